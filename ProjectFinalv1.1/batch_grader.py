@@ -0,0 +1,414 @@
+"""
+Headless batch grading - grades a whole cohort without opening the tkinter GUI.
+
+Can be used from the command line:
+    python batch_grader.py --question "..." --language Python --points 10 --students scans/ --output results/
+    python batch_grader.py --exam exam.json --language Python --students scans/ --output results/   # every scan answers all questions
+
+or imported:
+    from batch_grader import load_students, grade_cohort, write_results
+"""
+import sys
+import os
+import argparse
+import csv
+import json
+from exam_grader import (
+    API_KEY, GOOGLE_CREDENTIALS, PARAMETERS, LANGUAGES, GRADING_MODES, DEFAULT_GRADING_MODE, DEFAULT_BATCH_SIZE,
+    get_question_ocr_text, get_reference_answer
+)
+from image_text_viewer import IMAGE_EXTENSIONS, invalidate_ocr_cache, get_upload_stats
+from concurrent.futures import Future
+from instrumentation import configure_logging, reset_metrics, metrics_report, count
+from dependencies import check_dependencies, missing_message
+from ocr_backends import OCR_BACKEND
+from document_ingestion import DOCUMENT_EXTENSIONS, is_document, split_document, add_student_pages, parse_page_range, invalidate_document_ocr_cache
+from dedup import DEDUP_THRESHOLD
+from execution_grader import EXEC_WORKERS
+from job_store import JOB_STORE_PATH, JOB_STORE_ENABLED, get_job_store, student_key
+from multi_question import load_exam, grade_exam, rescore_exam
+from grading_pipeline import GradingPipeline, DEFAULT_OCR_WORKERS, DEFAULT_CORRECTNESS_WORKERS, DEFAULT_RUBRIC_WORKERS, DEFAULT_OCR_BATCH_SIZE
+
+MANIFEST_EXTENSIONS = {'.csv', '.json'}
+
+# ====== INPUT ======
+def load_students(source, pages_per_student=None):
+    """
+    Returns a list of {"name": ..., "image_path": ...} dicts from either:
+    - a directory of scans (student name = file name without extension); a PDF/TIFF in it is
+      one student whose answer spans all of its pages
+    - a CSV manifest with "name,image_path" columns and an optional "pages" column ("1-3,5")
+      for a page range inside a PDF/TIFF; rows with the same name are stitched into one answer
+    - a JSON manifest with a list of {"name": ..., "image_path": ..., "pages": ...} objects
+    - a single PDF/TIFF class document split into pages_per_student pages per student
+    Relative image paths in a manifest are resolved against the manifest's folder.
+    Students with several pages get a "pages" list (see document_ingestion).
+    """
+    if os.path.isdir(source):
+        students = []
+        for file_name in sorted(os.listdir(source)):
+            name, ext = os.path.splitext(file_name)
+            if ext.lower() in IMAGE_EXTENSIONS or ext.lower() in DOCUMENT_EXTENSIONS:
+                add_student_pages(students, name, os.path.join(source, file_name))
+        return students
+
+    if is_document(source):
+        if not pages_per_student:
+            raise ValueError(f"{source} is a class document - pass pages_per_student (--pages-per-student) to split it")
+        return split_document(source, pages_per_student)
+
+    ext = os.path.splitext(source)[1].lower()
+    if ext not in MANIFEST_EXTENSIONS:
+        raise ValueError(f"Unsupported student source: {source} (expected a directory, .csv, .json, .pdf or .tiff)")
+    with open(source, encoding='utf-8') as f:
+        if ext == '.csv':
+            rows = list(csv.DictReader(f))
+        else:
+            rows = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(source))
+    students = []
+    for row in rows:
+        if not row.get("name") or not row.get("image_path"):
+            raise ValueError(f"Manifest row is missing name/image_path: {row}")
+        pages = parse_page_range(row["pages"]) if row.get("pages") else None
+        add_student_pages(students, row["name"], os.path.join(base_dir, row["image_path"]), pages)
+    return students
+
+def load_question(question=None, question_image=None):
+    if question:
+        return question.strip()
+    text = get_question_ocr_text(question_image)
+    if not text:
+        raise ValueError(f"No text detected in question image: {question_image}")
+    return text
+
+# ====== GRADING ======
+def grade_cohort(question_text, students, language, question_score, reference_answer=None, pipeline=None, on_result=None, refresh_reference=False, cancel=None, store=None):
+    """
+    Grades every student against one reference answer through a concurrent GradingPipeline.
+    The reference answer is pinned per question, so regrading reuses the same one.
+    A failure for one student is recorded in its "error" field and does not stop the run.
+    Setting cancel (a threading.Event) stops the run early; ungraded students are marked "cancelled".
+    With a JobStore, each result is saved as it completes and students graded in an earlier run
+    of the same job are taken from the store instead of being graded again.
+    """
+    if reference_answer is None:
+        reference_answer = get_reference_answer(question_text, language, refresh=refresh_reference)
+    pipeline = pipeline or GradingPipeline()
+    job_id = None
+    if store is None:
+        results = pipeline.run(students, reference_answer, language, question_score, on_result=on_result, cancel=cancel)
+    else:
+        results, job_id = _grade_with_store(store, pipeline, question_text, students, reference_answer, language, question_score, on_result, cancel)
+    report = {
+        "question": question_text,
+        "language": language,
+        "question_score": question_score,
+        "reference_answer": reference_answer,
+        "students": results,
+        "duplicate_clusters": duplicate_clusters(results)
+    }
+    if job_id is not None:
+        report["job_id"] = job_id
+    return report
+
+def duplicate_clusters(results):
+    """Students who reused another student's grade, grouped under that student, for instructor review"""
+    clusters = {}
+    for result in results:
+        if result and result.get("duplicate_of"):
+            clusters.setdefault(result["duplicate_of"], []).append({"name": result["name"], "similarity": result["similarity"]})
+    return [{"graded": leader, "reused_by": members} for leader, members in clusters.items()]
+
+def _grade_with_store(store, pipeline, question_text, students, reference_answer, language, question_score, on_result, cancel):
+    job_id = store.open_job(question_text, language, pipeline.grading_mode, reference_answer)
+    stored = store.stored_results(job_id, question_score)
+    results = [None] * len(students)
+    pending = []  # (cohort index, student) still to grade
+    for index, student in enumerate(students):
+        previous = stored.get(student_key(student))
+        # Only graded rows are final; an exam's unanswered question (no scores) is graded here
+        if previous is not None and previous.get("scores") and not previous.get("error"):
+            results[index] = previous
+            count("jobstore.resumed")
+            if on_result:
+                on_result(index, previous)
+            continue
+        if previous is not None and previous["ocr_text"]:
+            # Evaluation failed last time, but the OCR text is still good
+            ocr_future = Future()
+            ocr_future.set_result(previous["ocr_text"])
+            student = dict(student, ocr_future=ocr_future)
+            count("jobstore.reused_ocr")
+        pending.append((index, student))
+
+    def record(pending_index, result):
+        index, student = pending[pending_index]
+        if not (result.get("cancelled") and not result["ocr_text"]):
+            store.record(job_id, index, student, result)
+        if on_result:
+            on_result(index, result)
+
+    pending_results = pipeline.run([student for _, student in pending], reference_answer, language, question_score, on_result=record, cancel=cancel)
+    for (index, _), result in zip(pending, pending_results):
+        results[index] = result
+    return results, job_id
+
+def rescore_cohort(question_text, students, language, question_score, grading_mode, store):
+    """
+    Report for a job that was already graded, rescored with the current PARAMETERS weights and
+    question_score from the stored per-parameter scores. Makes no OCR or Gemini calls; students
+    without stored scores get an "error".
+    """
+    job_id = store.find_job(question_text, language, grading_mode)
+    if job_id is None:
+        raise ValueError(f"No stored grading job for this question ({language}, {grading_mode} mode)")
+    stored = store.stored_results(job_id, question_score)
+    results = []
+    for student in students:
+        result = stored.get(student_key(student))
+        if result is None:
+            result = {"name": student["name"], "image_path": student["image_path"], "ocr_text": "", "scores": None, "error": "Not graded yet"}
+        results.append(result)
+    return {
+        "question": question_text,
+        "language": language,
+        "question_score": question_score,
+        "reference_answer": store.job_reference(job_id),
+        "students": results,
+        "duplicate_clusters": duplicate_clusters(results)
+    }
+
+# ====== OUTPUT ======
+def write_results(report, output_dir):
+    """Writes results.json (full report) and results.csv (score table) into output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, "results.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    csv_path = os.path.join(output_dir, "results.csv")
+    columns = [param for param, _ in PARAMETERS] + ["Final Score", "Exam Points"]
+    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Image"] + columns + ["Error", "Duplicate Of"])
+        for result in report["students"]:
+            scores = result["scores"] or {}
+            writer.writerow([result["name"], result["image_path"]] + [scores.get(c, "") for c in columns] + [result.get("error", ""), result.get("duplicate_of", "")])
+    return json_path, csv_path
+
+def write_exam_results(report, output_dir):
+    """Writes results.json (full report) and results.csv (points per question and exam total) into output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    json_path = os.path.join(output_dir, "results.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    csv_path = os.path.join(output_dir, "results.csv")
+    questions = [f"Q{number} ({question['question_score']})" for number, question in enumerate(report["questions"], 1)]
+    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Image"] + questions + ["Exam Points", "Max Points", "Error"])
+        for student in report["students"]:
+            points = [(answer.get("scores") or {}).get("Exam Points", "") for answer in student["answers"]]
+            writer.writerow([student["name"], student["image_path"]] + points + [student["Exam Points"], student["Max Points"], student.get("error", "")])
+    return json_path, csv_path
+
+def write_metrics(output_dir):
+    """Writes metrics.json (counters, span timings, estimated cost) for this run into output_dir"""
+    os.makedirs(output_dir, exist_ok=True)
+    metrics = metrics_report()
+    metrics_path = os.path.join(output_dir, "metrics.json")
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        json.dump(metrics, f, indent=2)
+    return metrics_path, metrics
+
+# ====== CLI ======
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Grade a cohort of scanned student answers without the GUI.")
+    question = parser.add_mutually_exclusive_group(required=True)
+    question.add_argument("--question", help="Question text")
+    question.add_argument("--question-image", help="Image of the question (OCR'd with Google Vision)")
+    question.add_argument("--exam", help="Multi-question exam file (JSON, see multi_question); each scan answers all of its questions")
+    question.add_argument("--job-id", type=int, help="With --rescore: the stored job to rescore (printed after grading); question, language and mode come from the store")
+    parser.add_argument("--language", choices=LANGUAGES, default="C#", help="Programming language of the answers (--exam: for questions that don't set one)")
+    parser.add_argument("--points", type=int, default=10, help="Question value in exam points (--exam: for questions that don't set one)")
+    parser.add_argument("--students", required=True, help="Directory of scans, a CSV/JSON manifest, or one multi-page PDF/TIFF for the whole class")
+    parser.add_argument("--pages-per-student", type=int, help="Pages per student when --students is a single class PDF/TIFF")
+    parser.add_argument("--output", required=True, help="Directory to write results.json and results.csv into")
+    parser.add_argument("--grading-mode", choices=GRADING_MODES, default=DEFAULT_GRADING_MODE, help="two-call (separate correctness/rubric prompts), structured (one JSON request per student) or batched (one JSON request per batch of students)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Students per request in batched mode (smaller batches are retried automatically on malformed replies)")
+    parser.add_argument("--refresh-ocr", action="store_true", help="Ignore cached OCR results for these scans and OCR them again")
+    parser.add_argument("--refresh-reference", action="store_true", help="Regenerate the pinned Gemini reference answer for this question")
+    parser.add_argument("--ocr-workers", type=int, default=DEFAULT_OCR_WORKERS, help="Concurrent OCR requests")
+    parser.add_argument("--ocr-batch-size", type=int, default=DEFAULT_OCR_BATCH_SIZE, help="Scans per Vision batch_annotate_images request (1 = one request per scan)")
+    parser.add_argument("--preprocess-workers", type=int, default=os.cpu_count() or 1, help="Processes for image decoding/preprocessing before OCR (0 = preprocess in the OCR threads)")
+    parser.add_argument("--queue-depth", type=int, default=None, help="Max scans held in memory between preprocessing and OCR (default: 2 per preprocess worker + one OCR batch per OCR worker)")
+    parser.add_argument("--correctness-workers", type=int, default=DEFAULT_CORRECTNESS_WORKERS, help="Concurrent Gemini correctness evaluations")
+    parser.add_argument("--rubric-workers", type=int, default=DEFAULT_RUBRIC_WORKERS, help="Concurrent Gemini rubric evaluations")
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD, help="Reuse the grade of an answer with the same code (up to layout and comments) found at or above this MinHash similarity (0-1, 0 = grade every answer)")
+    parser.add_argument("--execution-workers", type=int, default=EXEC_WORKERS, help="Python only: sandbox processes that run answers against the reference solution; answers matching it on every generated input skip Gemini (0 = off)")
+    parser.add_argument("--job-store", default=JOB_STORE_PATH, help="SQLite file where results are saved as they complete; rerunning the same question resumes from it")
+    parser.add_argument("--no-job-store", action="store_true", default=not JOB_STORE_ENABLED, help="Don't save or resume results (JOB_STORE=0 sets this by default)")
+    parser.add_argument("--regrade", action="store_true", help="Discard this question's stored results and grade every student again")
+    parser.add_argument("--rescore", action="store_true", help="Only recompute Final Score/Exam Points from stored results (current weights and --points); no OCR or Gemini calls")
+    parser.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"), help="Log verbosity (default: LOG_LEVEL or WARNING); DEBUG includes raw Gemini replies and per-call spans")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    configure_logging(args.log_level)
+    if args.points <= 0:
+        print("Error: --points must be a positive number.")
+        return 1
+    if args.rescore:
+        return rescore_main(args)
+    if args.job_id is not None:
+        print("Error: --job-id only selects a stored job for --rescore.")
+        return 1
+    if not API_KEY:
+        print("Error: GEMINI_API_KEY is not set (.env file).")
+        return 1
+    missing = check_dependencies(["vision"] if OCR_BACKEND == "vision" else [])
+    if missing:
+        print(f"Error: {missing_message(missing)}")
+        return 1
+    if OCR_BACKEND == "vision" and not os.path.exists(GOOGLE_CREDENTIALS):
+        print(f"Error: Could not find {GOOGLE_CREDENTIALS}")
+        return 1
+
+    try:
+        students = load_students(args.students, args.pages_per_student)
+    except (ValueError, ImportError) as e:
+        print(f"Error: {e}")
+        return 1
+    if not students:
+        print(f"Error: No student scans found in {args.students}")
+        return 1
+    try:
+        pipeline = GradingPipeline(args.ocr_workers, args.correctness_workers, args.rubric_workers, args.grading_mode, args.batch_size, args.ocr_batch_size,
+                                   args.preprocess_workers, args.queue_depth, args.dedup_threshold, args.execution_workers)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    store = None if args.no_job_store else get_job_store(args.job_store)
+    if args.refresh_ocr:
+        for student in students:
+            for path, page in student.get("pages") or [[student["image_path"], None]]:
+                if page is None:
+                    invalidate_ocr_cache(path)
+                else:
+                    invalidate_document_ocr_cache(path, [page])
+    reset_metrics()
+    if args.exam:
+        return exam_main(args, students, pipeline, store)
+    question_text = load_question(args.question, args.question_image)
+    if store and (args.regrade or args.refresh_ocr):
+        job_id = store.find_job(question_text, args.language, args.grading_mode)
+        if job_id is not None:
+            store.reset_job(job_id)
+    print(f"Grading {len(students)} students ({args.language}, {args.points} points, {args.grading_mode} mode)...")
+
+    def report_progress(index, result):
+        status = "failed" if result.get("error") else f"{result['scores']['Final Score']}"
+        print(f"  {result['name']}: {status}")
+
+    report = grade_cohort(question_text, students, args.language, args.points, pipeline=pipeline, on_result=report_progress, refresh_reference=args.refresh_reference, store=store)
+    json_path, csv_path = write_results(report, args.output)
+    metrics_path, metrics = write_metrics(args.output)
+
+    failed = [r for r in report["students"] if r.get("error")]
+    print(f"Done: {len(students) - len(failed)} graded, {len(failed)} failed.")
+    print(f"Results written to {json_path} and {csv_path}, metrics to {metrics_path}")
+    if "job_id" in report:
+        print(f"Saved as job {report['job_id']} in {args.job_store} (rescore offline with --rescore --job-id {report['job_id']})")
+    print_run_summary(args, metrics, report["duplicate_clusters"])
+    return 1 if failed else 0
+
+def exam_main(args, students, pipeline, store):
+    try:
+        exam = load_exam(args.exam, args.language, args.points)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    questions = exam["questions"]
+    if store and (args.regrade or args.refresh_ocr):
+        for question in questions:
+            job_id = store.find_job(question["text"], question["language"], args.grading_mode)
+            if job_id is not None:
+                store.reset_job(job_id)
+    print(f"Grading {len(students)} students on {len(questions)} questions "
+          f"({sum(question['points'] for question in questions)} points, {args.grading_mode} mode)...")
+
+    def report_progress(index, question_index, result):
+        status = "failed" if result.get("error") else "no answer" if result.get("missing") else f"{result['scores']['Final Score']}"
+        print(f"  {result['name']} Q{question_index + 1}: {status}")
+
+    try:
+        report = grade_exam(exam, students, pipeline=pipeline, on_result=report_progress, refresh_reference=args.refresh_reference, store=store)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    clusters = []
+    for number, question in enumerate(report["questions"]):
+        question["duplicate_clusters"] = duplicate_clusters([student["answers"][number] for student in report["students"]])
+        clusters.extend(question["duplicate_clusters"])
+    json_path, csv_path = write_exam_results(report, args.output)
+    metrics_path, metrics = write_metrics(args.output)
+
+    failed = [r for r in report["students"] if r.get("error")]
+    print(f"Done: {len(students) - len(failed)} students fully graded, {len(failed)} with failed answers.")
+    print(f"Results written to {json_path} and {csv_path}, metrics to {metrics_path}")
+    print_run_summary(args, metrics, clusters)
+    return 1 if failed else 0
+
+def print_run_summary(args, metrics, clusters):
+    uploads = get_upload_stats()
+    if uploads["images"]:
+        print(f"OCR uploads: {uploads['images']} images, {uploads['bytes_saved'] / 1024:.0f} KB saved, "
+              f"{uploads['seconds'] / uploads['images'] * 1000:.0f} ms preparation per image")
+    counters = metrics["counters"]
+    print(f"Gemini: {counters.get('gemini.requests', 0)} requests ({counters.get('gemini.retries', 0)} retries), "
+          f"{counters.get('gemini.tokens_in', 0)} tokens in / {counters.get('gemini.tokens_out', 0)} out, "
+          f"cache {counters.get('gemini.cache_hits', 0)} hits / {counters.get('gemini.cache_misses', 0)} misses")
+    fallbacks = counters.get('fallback.similarity', 0) + counters.get('fallback.rule_based', 0)
+    if fallbacks:
+        print(f"Local fallbacks: {counters.get('fallback.similarity', 0)} similarity, {counters.get('fallback.rule_based', 0)} rule-based")
+    if clusters:
+        print(f"Reused grades for {counters.get('dedup.reused', 0)} duplicate answers in {len(clusters)} clusters "
+              f"(listed under duplicate_clusters in results.json for review)")
+    if counters.get('jobstore.resumed', 0):
+        print(f"Resumed {counters['jobstore.resumed']} answers from {args.job_store}")
+    print(f"Estimated cost: ${metrics['cost_usd']['total']:.4f}")
+
+def rescore_main(args):
+    if args.no_job_store:
+        print("Error: --rescore needs the job store.")
+        return 1
+    if args.question_image:
+        # Rescoring makes no OCR or Gemini calls, so the question can't be read from an image
+        print("Error: --rescore doesn't OCR --question-image; pass --job-id (printed after grading) or --question with the question text.")
+        return 1
+    store = get_job_store(args.job_store)
+    try:
+        students = load_students(args.students, args.pages_per_student)
+        if args.exam:
+            report = rescore_exam(load_exam(args.exam, args.language, args.points, read_images=False), students, args.grading_mode, store)
+        elif args.job_id is not None:
+            job = store.job_info(args.job_id)
+            if job is None:
+                raise ValueError(f"No job {args.job_id} in {args.job_store}")
+            report = rescore_cohort(job["question"], students, job["language"], args.points, job["grading_mode"], store)
+        else:
+            report = rescore_cohort(args.question, students, args.language, args.points, args.grading_mode, store)
+    except (ValueError, ImportError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    json_path, csv_path = (write_exam_results if args.exam else write_results)(report, args.output)
+    missing = [r for r in report["students"] if r.get("error")]
+    print(f"Rescored {len(students) - len(missing)} students ({len(missing)} without stored scores).")
+    print(f"Results written to {json_path} and {csv_path}")
+    return 1 if missing else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
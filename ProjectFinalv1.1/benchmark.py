@@ -0,0 +1,304 @@
+"""
+End-to-end benchmark for the grading pipeline - no network, no credentials.
+
+    python benchmark.py --students 40 --repeat 3 --output bench.json
+    python benchmark.py --compare bench.json            # exit code 1 on a p95 regression
+
+A synthetic corpus of handwritten-style scans is generated once into --fixtures, together with
+recorded OCR responses (served by the replay OCR backend). Gemini replies are replayed from the
+same canned responses the mock server uses - in-process by default, or over HTTP through the
+real transport with --llm mock-server.
+
+Each stage is timed separately: preprocess (decode + preprocessing), ocr, reference,
+evaluation.<mode> (prompt + reply parsing), aggregation, rendering and pipeline.<mode>
+(one full GradingPipeline run per student). The report is JSON with throughput and
+p50/p95/p99 latency per stage.
+"""
+import os
+
+# The benchmark must never hit the on-disk caches
+os.environ["OCR_CACHE"] = "0"
+os.environ["GEMINI_CACHE"] = "0"
+
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from ocr_backends import ReplayOCRBackend, upload_digest
+from llm_client import LLMClient, GeminiClient, set_llm_client
+from mock_gemini_server import canned_reply, start_mock_server
+from image_text_viewer import prepare_upload_from_path, set_ocr_backend
+from exam_grader import (
+    GRADING_MODES, get_gemini_answer, evaluate_correctness, evaluate_rubric, evaluate_structured,
+    grade_batch, combine_scores, exam_points
+)
+from batch_grader import write_results
+from grading_pipeline import GradingPipeline
+from instrumentation import summarize_durations, reset_metrics, metrics_report
+
+DEFAULT_FIXTURES_DIR = os.path.join(os.getcwd(), "benchmark_fixtures")
+CORPUS_VERSION = 3  # bump when the generated corpus or the upload preprocessing changes
+
+QUESTIONS = [
+    ("Write a function that returns the sum of a list of numbers.", """def total(numbers):
+    result = 0
+    for n in numbers:
+        result += n
+    return result"""),
+    ("Write a function that returns the largest number in a list.", """def largest(values):
+    best = values[0]
+    for v in values:
+        if v > best:
+            best = v
+    return best"""),
+    ("Write a function that counts the vowels in a string.", """def count_vowels(text):
+    count = 0
+    for ch in text.lower():
+        if ch in "aeiou":
+            count += 1
+    return count"""),
+]
+OCR_TYPOS = {"n": "h", "e": "c", "(": "C", ":": ";", "l": "1", "o": "0"}
+
+# ====== CORPUS ======
+def _student_code(reference, rng):
+    # Reference solution with a few OCR-style typos, so answers differ per student
+    chars = list(reference)
+    for _ in range(rng.randint(0, 6)):
+        i = rng.randrange(len(chars))
+        chars[i] = OCR_TYPOS.get(chars[i], chars[i])
+    return "".join(chars)
+
+def _load_font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single bitmap font size
+        return ImageFont.load_default()
+
+def render_scan(text, rng, size=(2480, 3508)):
+    """A4 @ 300 DPI page with jittered 'handwriting', slight rotation, noise and blur"""
+    paper = rng.randint(215, 245)
+    img = Image.new('L', size, paper)
+    draw = ImageDraw.Draw(img)
+    font = _load_font(64)
+    y = 200
+    for line in text.splitlines():
+        x = 200 + rng.randint(-10, 10)
+        for ch in line:
+            draw.text((x, y + rng.randint(-4, 4)), ch, fill=rng.randint(20, 80), font=font)
+            x += 38 + rng.randint(-3, 3)
+        y += 110 + rng.randint(-6, 6)
+    img = img.rotate(rng.uniform(-1.5, 1.5), fillcolor=paper)
+    noise = Image.effect_noise(size, rng.uniform(8, 20))
+    img = Image.blend(img, noise, 0.08)
+    return img.filter(ImageFilter.GaussianBlur(rng.uniform(0.4, 1.2))).convert('RGB')
+
+def generate_corpus(directory, count, seed=0):
+    """
+    Writes count scans, a manifest and a recorded OCR response per scan into directory.
+    Returns the manifest dict.
+    """
+    rng = random.Random(seed)
+    scans_dir = os.path.join(directory, "scans")
+    ocr_dir = os.path.join(directory, "ocr")
+    os.makedirs(scans_dir, exist_ok=True)
+    os.makedirs(ocr_dir, exist_ok=True)
+    students = []
+    for i in range(count):
+        question_index = i % len(QUESTIONS)
+        code = _student_code(QUESTIONS[question_index][1], rng)
+        image_path = os.path.join(scans_dir, f"student_{i + 1:03d}.jpg")
+        render_scan(code, rng).save(image_path, quality=92)
+        # Record the OCR reply for the exact bytes the pipeline will upload
+        content, _ = prepare_upload_from_path(image_path, True)
+        confidence_scores = [round(rng.uniform(0.7, 0.99), 3) for _ in code.split()]
+        with open(os.path.join(ocr_dir, f"{upload_digest(content)}.json"), 'w', encoding='utf-8') as f:
+            json.dump({"text": code, "confidence_scores": confidence_scores}, f)
+        students.append({"name": f"student_{i + 1:03d}", "image_path": os.path.join("scans", os.path.basename(image_path)), "question": question_index})
+    manifest = {"version": CORPUS_VERSION, "seed": seed, "questions": [q for q, _ in QUESTIONS], "students": students}
+    with open(os.path.join(directory, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def load_corpus(directory, count, seed=0, regenerate=False):
+    manifest_path = os.path.join(directory, "manifest.json")
+    if not regenerate and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") == CORPUS_VERSION and manifest.get("seed") == seed and len(manifest["students"]) == count:
+            return manifest
+    shutil.rmtree(directory, ignore_errors=True)
+    print(f"Generating {count} synthetic scans in {directory}...", file=sys.stderr)
+    return generate_corpus(directory, count, seed)
+
+class ReplayLLMClient(LLMClient):
+    """Serves the mock server's canned replies in-process (no HTTP)"""
+    model = "replay"
+
+    def generate(self, prompt, generation_config=None):
+        return canned_reply(prompt, generation_config), "STOP"
+
+# ====== TIMING ======
+def summarize(samples, wall_seconds=None):
+    """samples: per-item latencies in seconds. Throughput is items/second over wall_seconds (or the sample total)"""
+    summary = summarize_durations(samples)
+    wall = wall_seconds if wall_seconds is not None else summary["total_seconds"]
+    summary["throughput_per_second"] = round(summary["count"] / wall, 3) if wall else None
+    return summary
+
+def timed(samples, func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append(time.perf_counter() - started)
+    return result
+
+# ====== STAGES ======
+def run_benchmark(corpus_dir, manifest, repeat=1, modes=GRADING_MODES, batch_size=5, workers=4):
+    students = [{"name": s["name"], "image_path": os.path.join(corpus_dir, s["image_path"])} for s in manifest["students"]]
+    questions = manifest["questions"]
+    question_of = [s["question"] for s in manifest["students"]]
+    ocr_backend = ReplayOCRBackend(os.path.join(corpus_dir, "ocr"))
+    samples = {}
+    walls = {}
+
+    def stage(name):
+        return samples.setdefault(name, [])
+
+    for _ in range(repeat):
+        # Image decode + preprocessing, and OCR on the prepared bytes
+        uploads = []
+        for student in students:
+            content, _ = timed(stage("preprocess"), prepare_upload_from_path, student["image_path"], True)
+            uploads.append(content)
+        codes = [timed(stage("ocr"), ocr_backend.annotate, content)[0] for content in uploads]
+
+        references = [timed(stage("reference"), get_gemini_answer, question, "Python", use_cache=False) for question in questions]
+
+        # Evaluation: prompt building, the (replayed) request and reply parsing
+        graded = {}
+        for mode in modes:
+            if mode == "batched":
+                results = []
+                for q, reference in enumerate(references):
+                    group = [code for code, question in zip(codes, question_of) if question == q]
+                    started = time.perf_counter()
+                    results.extend(grade_batch(group, reference, "Python", batch_size))
+                    # Per-student latency within the batch
+                    stage("evaluation.batched").extend([(time.perf_counter() - started) / max(1, len(group))] * len(group))
+            elif mode == "structured":
+                results = [timed(stage("evaluation.structured"), evaluate_structured, code, references[q], "Python") for code, q in zip(codes, question_of)]
+            else:
+                results = []
+                for code, q in zip(codes, question_of):
+                    started = time.perf_counter()
+                    correctness = evaluate_correctness(code, references[q], "Python")
+                    rubric = evaluate_rubric(code, "Python")
+                    stage("evaluation.two-call").append(time.perf_counter() - started)
+                    results.append((correctness, rubric, None))
+            graded[mode] = results
+
+        # Score aggregation
+        rows = []
+        for student, code, (correctness, rubric, feedback) in zip(students, codes, graded[modes[0]]):
+            started = time.perf_counter()
+            scores = combine_scores(correctness, rubric)
+            scores["Exam Points"] = exam_points(scores["Final Score"], 10)
+            stage("aggregation").append(time.perf_counter() - started)
+            rows.append({"name": student["name"], "image_path": student["image_path"], "ocr_text": code, "scores": scores, "feedback": feedback})
+
+        # Results rendering (results.json + results.csv)
+        report = {"question": questions[0], "language": "Python", "question_score": 10, "reference_answer": references[0], "students": rows}
+        with tempfile.TemporaryDirectory() as output_dir:
+            timed(stage("rendering"), write_results, report, output_dir)
+
+        # Whole pipeline per grading mode: per-student latency from start to result, throughput over wall time
+        for mode in modes:
+            # Every answer is evaluated: no grade reuse between the corpus' identical answers, no sandboxes
+            pipeline = GradingPipeline(workers, workers, workers, mode, batch_size, dedup_threshold=0, execution_workers=0)
+            for q, reference in enumerate(references):
+                group = [student for student, question in zip(students, question_of) if question == q]
+                started = time.perf_counter()
+                finished = stage(f"pipeline.{mode}")
+                pipeline.run(group, reference, "Python", 10, on_result=lambda index, result: finished.append(time.perf_counter() - started))
+                walls[f"pipeline.{mode}"] = walls.get(f"pipeline.{mode}", 0.0) + time.perf_counter() - started
+    return {name: summarize(values, walls.get(name)) for name, values in samples.items()}
+
+# ====== REPORT ======
+def compare_reports(report, baseline, tolerance):
+    """Returns a list of (stage, baseline p95, current p95) for stages that got slower than tolerance"""
+    regressions = []
+    for name, stats in report["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if before and before["p95_ms"] and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append((name, before["p95_ms"], stats["p95_ms"]))
+    return regressions
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the grading pipeline.")
+    parser.add_argument("--students", type=int, default=30, help="Synthetic scans in the corpus")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to run every stage")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR, help="Directory for the generated corpus and recorded responses")
+    parser.add_argument("--regenerate", action="store_true", help="Regenerate the corpus even if it exists")
+    parser.add_argument("--modes", nargs="+", choices=GRADING_MODES, default=list(GRADING_MODES), help="Grading modes to benchmark")
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4, help="Workers per pipeline stage")
+    parser.add_argument("--llm", choices=("replay", "mock-server"), default="replay", help="Replay Gemini replies in-process, or through the HTTP transport against a local mock server")
+    parser.add_argument("--mock-latency-ms", type=float, default=0, help="Mean mock server latency (--llm mock-server)")
+    parser.add_argument("--output", help="Write the JSON report to this file (it is always printed)")
+    parser.add_argument("--compare", help="Baseline JSON report; exit with code 1 if any stage's p95 regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown for --compare (0.2 = 20%%)")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    manifest = load_corpus(args.fixtures, args.students, args.seed, args.regenerate)
+    set_ocr_backend(ReplayOCRBackend(os.path.join(args.fixtures, "ocr")))
+    server = None
+    if args.llm == "mock-server":
+        server, base_url = start_mock_server(latency_ms=args.mock_latency_ms)
+        set_llm_client(GeminiClient("benchmark", "mock", base_url))
+    else:
+        set_llm_client(ReplayLLMClient())
+    try:
+        reset_metrics()
+        started = time.perf_counter()
+        stages = run_benchmark(args.fixtures, manifest, args.repeat, args.modes, args.batch_size, args.workers)
+        elapsed = time.perf_counter() - started
+    finally:
+        set_ocr_backend(None)
+        set_llm_client(None)
+        if server:
+            server.shutdown()
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"students": args.students, "repeat": args.repeat, "seed": args.seed, "modes": args.modes,
+                   "batch_size": args.batch_size, "workers": args.workers, "llm": args.llm, "mock_latency_ms": args.mock_latency_ms},
+        "elapsed_seconds": round(elapsed, 3),
+        "stages": stages,
+        "metrics": metrics_report()
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: p95 {before:.1f} ms -> {after:.1f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Persistent on-disk caches.
+
+DiskCache stores one JSON file per entry in a directory and evicts the least recently used
+entries once the total size goes over max_bytes. Entries older than ttl seconds (if set) are
+treated as misses. It is safe to share between threads.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from instrumentation import count
+
+# ====== CONFIG ======
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(os.getcwd(), ".ocr_cache"))
+OCR_CACHE_MAX_MB = float(os.getenv("OCR_CACHE_MAX_MB", "200"))
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE", "1") != "0"
+GEMINI_CACHE_DIR = os.getenv("GEMINI_CACHE_DIR", os.path.join(os.getcwd(), ".gemini_cache"))
+GEMINI_CACHE_MAX_MB = float(os.getenv("GEMINI_CACHE_MAX_MB", "100"))
+GEMINI_CACHE_TTL_HOURS = float(os.getenv("GEMINI_CACHE_TTL_HOURS", str(24 * 30)))
+GEMINI_CACHE_ENABLED = os.getenv("GEMINI_CACHE", "1") != "0"
+
+class DiskCache:
+    def __init__(self, directory, max_bytes, ttl=None, name=None):
+        self.name = name  # when set, hits/misses are also counted as "<name>.cache_hits/misses" metrics
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> size in bytes, least recently used first
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        # Rebuild LRU order from file modification times (updated on every hit)
+        if self._index is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            stat = os.stat(os.path.join(self.directory, file_name))
+            entries.append((stat.st_mtime, file_name[:-len(".json")], stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((key, size) for _, key, size in entries)
+
+    def get(self, key):
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self._miss()
+                return None
+            try:
+                with open(self._path(key), encoding='utf-8') as f:
+                    entry = json.load(f)
+                stored_at = entry["stored_at"]
+                value = entry["value"]
+            except (OSError, ValueError, KeyError, TypeError):
+                # Deleted by another process, a partial write or an old entry format - treat as a miss
+                self._index.pop(key, None)
+                self._miss()
+                return None
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                self._remove(key)
+                self._miss()
+                return None
+            os.utime(self._path(key))
+            self._index.move_to_end(key)
+            self.hits += 1
+            if self.name:
+                count(f"{self.name}.cache_hits")
+            return value
+
+    def _miss(self):
+        self.misses += 1
+        if self.name:
+            count(f"{self.name}.cache_misses")
+
+    def set(self, key, value):
+        data = json.dumps({"stored_at": time.time(), "value": value}, ensure_ascii=False).encode('utf-8')
+        with self._lock:
+            self._load_index()
+            tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._index.values())
+        while total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            total -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remove(self, key):
+        if self._index.pop(key, None) is None:
+            return False
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        return True
+
+    def invalidate(self, key):
+        """Removes one entry. Returns True if it existed."""
+        with self._lock:
+            self._load_index()
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            return {"entries": len(self._index), "bytes": sum(self._index.values()), "hits": self.hits, "misses": self.misses}
+
+# ====== OCR CACHE ======
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+def get_ocr_cache():
+    """Shared OCR cache, or None when disabled with OCR_CACHE=0"""
+    global _ocr_cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = DiskCache(OCR_CACHE_DIR, int(OCR_CACHE_MAX_MB * 1024 * 1024), name="ocr")
+        return _ocr_cache
+
+def ocr_cache_key(image_bytes, preprocess, mode):
+    """Content address: hash of the original image bytes + preprocessing flag + OCR mode"""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(f"{digest}|preprocess={bool(preprocess)}|mode={mode}".encode()).hexdigest()
+
+def document_page_cache_key(document_digest, page, preprocess, mode):
+    """Same as ocr_cache_key, for one page of a multi-page document (hash of the whole document + page number)"""
+    return hashlib.sha256(f"{document_digest}|page={page}|preprocess={bool(preprocess)}|mode={mode}".encode()).hexdigest()
+
+# ====== GEMINI CACHE ======
+_gemini_caches = {}
+_gemini_cache_lock = threading.Lock()
+
+def get_gemini_cache():
+    """Shared Gemini response cache, or None when disabled with GEMINI_CACHE=0"""
+    if not GEMINI_CACHE_ENABLED:
+        return None
+    with _gemini_cache_lock:
+        if "responses" not in _gemini_caches:
+            _gemini_caches["responses"] = DiskCache(
+                os.path.join(GEMINI_CACHE_DIR, "responses"),
+                int(GEMINI_CACHE_MAX_MB * 1024 * 1024),
+                ttl=GEMINI_CACHE_TTL_HOURS * 3600,
+                name="gemini"
+            )
+        return _gemini_caches["responses"]
+
+def get_reference_cache():
+    """
+    Pinned reference answers, one per (model, question, language).
+    Never evicted or expired, so a question's reference solution stays the same across runs.
+    """
+    with _gemini_cache_lock:
+        if "references" not in _gemini_caches:
+            _gemini_caches["references"] = DiskCache(os.path.join(GEMINI_CACHE_DIR, "references"), float("inf"), name="reference")
+        return _gemini_caches["references"]
+
+def gemini_cache_key(model, prompt, generation_config=None):
+    data = json.dumps({"model": model, "prompt": prompt, "generation_config": generation_config}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def reference_cache_key(model, question_text, language):
+    data = json.dumps({"model": model, "question": question_text, "language": language}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
@@ -0,0 +1,190 @@
+"""
+Local code similarity - the offline fallback when Gemini can't grade an answer.
+
+Both answers are tokenized for their language (Python, Java, C, C#, C++), with comments,
+imports/includes and code fences dropped. Identifiers, numbers and string literals are then
+replaced by placeholders, and keywords are case-folded. Keywords are also matched through common
+OCR character confusions (0/o, 1/l, rn/m), but only where that keyword can stand: "a5 = 1" and
+"for clo in x" keep their identifiers. Separators that OCR often drops (; : ,) are ignored.
+Misspelled keywords are not guessed at: "ref" or "batch" are identifiers, not def/catch. Renamed
+variables, OCR typos and spacing differences therefore barely change the score. Two measures are combined:
+- token similarity: overlap of normalized tokens and token trigrams (multiset Jaccard)
+- structural similarity: overlap of the control-flow skeleton (if/for/while/return/... bigrams)
+Everything is counting, so the cost is linear in the length of the answers.
+
+    similarity(student_code, reference_code, "Python")      # 0.0 - 1.0
+    python code_similarity.py reference.py answers/*.py --language Python   # offline pre-screen
+"""
+import re
+import sys
+import argparse
+from collections import Counter
+
+# ====== CONFIG ======
+TOKEN_WEIGHT = 0.7
+STRUCTURE_WEIGHT = 0.3
+NGRAM_SIZE = 3
+
+C_FAMILY = ("Java", "C", "C#", "C++")
+
+_COMMON_KEYWORDS = {
+    "if", "else", "for", "while", "do", "switch", "case", "default", "break", "continue", "return",
+    "try", "catch", "finally", "throw", "new", "class", "public", "private", "protected", "static",
+    "const", "void", "int", "float", "double", "char", "long", "short", "bool", "true", "false", "null",
+}
+KEYWORDS = {
+    "Python": {
+        "and", "as", "assert", "break", "class", "continue", "def", "del", "elif", "else", "except",
+        "finally", "for", "from", "global", "if", "import", "in", "is", "lambda", "nonlocal", "not",
+        "or", "pass", "raise", "return", "try", "while", "with", "yield", "none", "true", "false",
+        "print", "input", "len", "range", "int", "float", "str", "list", "dict", "set", "sum", "min", "max",
+    },
+    "Java": _COMMON_KEYWORDS | {
+        "boolean", "string", "system", "out", "println", "print", "scanner", "nextint", "length",
+        "extends", "implements", "interface", "final", "this", "math",
+    },
+    "C": _COMMON_KEYWORDS | {"unsigned", "struct", "sizeof", "printf", "scanf", "malloc", "free"},
+    "C#": _COMMON_KEYWORDS | {
+        "string", "var", "foreach", "in", "console", "writeline", "write", "readline", "parse",
+        "decimal", "length", "count", "list", "math", "this",
+    },
+    "C++": _COMMON_KEYWORDS | {
+        "std", "cout", "cin", "endl", "vector", "string", "auto", "template", "struct", "size",
+        "push_back", "unsigned", "this",
+    },
+}
+CONTROL_KEYWORDS = {
+    "if", "elif", "else", "for", "foreach", "while", "do", "switch", "case", "return", "break",
+    "continue", "try", "catch", "except", "finally", "def", "class", "lambda", "yield", "throw", "raise",
+}
+
+# Characters OCR commonly confuses in handwriting, folded before keywords are looked up
+_OCR_FOLDS = (("rn", "m"), ("cl", "d"), ("vv", "w"), ("0", "o"), ("1", "l"), ("5", "s"))
+# A folded spelling is only a keyword where that keyword can stand, so "a5 = 1" keeps an identifier
+_INFIX_KEYWORDS = {"and", "or", "in", "is", "as"}  # only after an operand
+_STATEMENT_KEYWORDS = CONTROL_KEYWORDS - {"lambda"}  # only at the start of a statement
+_STATEMENT_START = {"{", "}", ";", ":"}
+_IDENTIFIER_FOLLOWERS = {"=", "+=", "-=", "*=", "/=", "%=", ".", "[", ","}  # assigned, indexed or listed
+IGNORED_TOKENS = {";", ":", ","}
+
+_FENCE = re.compile(r"```[\w#+-]*")
+_PY_COMMENT = re.compile(r"#[^\n]*")
+_C_COMMENT = re.compile(r"//[^\n]*|/\*[\s\S]*?\*/")
+_IMPORT_LINE = re.compile(r"^\s*(?:import|from\s+\S+\s+import|using|package|#\s*include|#\s*define)\b[^\n]*$", re.MULTILINE)
+_TOKEN = re.compile(r"""
+    (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<op>==|!=|<=|>=|\+\+|--|\+=|-=|\*=|/=|%=|&&|\|\||->|::|<<|>>|\*\*|//|[^\s\w])
+""", re.VERBOSE)
+
+# ====== TOKENIZING ======
+def _fold(word):
+    for confused, replacement in _OCR_FOLDS:
+        word = word.replace(confused, replacement)
+    return word
+
+def _keyword_lookup(keywords):
+    """OCR-folded spelling -> keyword"""
+    return {_fold(keyword): keyword for keyword in keywords}
+
+def _keyword_position(keyword, previous, following, new_line):
+    """Whether keyword can stand between the raw tokens previous and following (matches or None)"""
+    if following is not None and following.group() in _IDENTIFIER_FOLLOWERS or previous is not None and previous.group() == ".":
+        return False
+    if keyword in _INFIX_KEYWORDS:
+        return previous is not None and not new_line and (previous.lastgroup != "op" or previous.group() in ")]")
+    if keyword in _STATEMENT_KEYWORDS:
+        return previous is None or new_line or previous.group() in _STATEMENT_START
+    return True
+
+def guess_language(code):
+    if re.search(r"^\s*def\s+\w+\s*\(", code, re.MULTILINE) or re.search(r":\s*$", code, re.MULTILINE):
+        return "Python"
+    return "C#"
+
+def normalize_tokens(code, language=None):
+    """Language-aware token stream with ID/NUM/STR placeholders and case-folded keywords"""
+    code = _FENCE.sub("", code or "")
+    language = language if language in KEYWORDS else guess_language(code)
+    code = _IMPORT_LINE.sub("", code)
+    code = (_PY_COMMENT if language == "Python" else _C_COMMENT).sub(" ", code)
+    keywords, folded = KEYWORDS[language], _KEYWORD_LOOKUPS[language]
+    matches = list(_TOKEN.finditer(code))
+    tokens = []
+    for index, match in enumerate(matches):
+        kind = match.lastgroup
+        if kind == "string":
+            tokens.append("STR")
+        elif kind == "number":
+            tokens.append("NUM")
+        elif kind == "word":
+            word = match.group().lower()
+            keyword = word if word in keywords else folded.get(_fold(word))
+            if keyword and keyword != word:
+                previous = matches[index - 1] if index else None
+                following = matches[index + 1] if index + 1 < len(matches) else None
+                new_line = previous is not None and "\n" in code[previous.end():match.start()]
+                if not _keyword_position(keyword, previous, following, new_line):
+                    keyword = None
+            tokens.append(keyword or "ID")
+        elif match.group() not in IGNORED_TOKENS:
+            tokens.append(match.group())
+    return tokens
+
+_KEYWORD_LOOKUPS = {language: _keyword_lookup(keywords) for language, keywords in KEYWORDS.items()}
+
+def _ngrams(tokens, size):
+    if len(tokens) < size:
+        return Counter([tuple(tokens)]) if tokens else Counter()
+    return Counter(tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+
+def _overlap(a, b):
+    # Multiset Jaccard
+    if not a and not b:
+        return 1.0
+    return sum((a & b).values()) / sum((a | b).values())
+
+# ====== SCORING ======
+def _profile(code, language):
+    tokens = normalize_tokens(code, language)
+    return tokens, Counter(tokens), _ngrams(tokens, NGRAM_SIZE), _ngrams([t for t in tokens if t in CONTROL_KEYWORDS], 2)
+
+def _compare(student, reference):
+    if not student[0] or not reference[0]:
+        return {"token": 0.0, "structure": 0.0, "score": 0.0}
+    token = (_overlap(student[1], reference[1]) + _overlap(student[2], reference[2])) / 2
+    structure = _overlap(student[3], reference[3])
+    score = TOKEN_WEIGHT * token + STRUCTURE_WEIGHT * structure
+    return {"token": round(token, 4), "structure": round(structure, 4), "score": round(score, 4)}
+
+def similarity_report(student_code, reference_code, language=None):
+    """{"token": ..., "structure": ..., "score": ...}, each 0.0 - 1.0"""
+    return _compare(_profile(student_code, language), _profile(reference_code, language))
+
+def similarity(student_code, reference_code, language=None):
+    """How closely the student's code matches the reference, 0.0 - 1.0"""
+    return similarity_report(student_code, reference_code, language)["score"]
+
+def prescreen(student_codes, reference_code, language=None):
+    """Similarity of each answer to the reference, without any network call (the reference is tokenized once)"""
+    reference = _profile(reference_code, language)
+    return [_compare(_profile(code, language), reference)["score"] for code in student_codes]
+
+# ====== CLI ======
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score answers against a reference solution offline.")
+    parser.add_argument("reference", help="File with the reference solution")
+    parser.add_argument("answers", nargs="+", help="Answer files (e.g. saved OCR text)")
+    parser.add_argument("--language", choices=sorted(KEYWORDS), help="Programming language (guessed if omitted)")
+    args = parser.parse_args(argv)
+    with open(args.reference, encoding='utf-8') as f:
+        reference = f.read()
+    for path in args.answers:
+        with open(path, encoding='utf-8') as f:
+            report = similarity_report(f.read(), reference, args.language)
+        print(f"{report['score']:.3f}  token={report['token']:.3f} structure={report['structure']:.3f}  {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Near-duplicate detection for OCR'd answers (MinHash + LSH).
+
+Answers are split into tokens for their language - whitespace, line layout and comments are
+dropped, case and string literals are kept, and Python indentation becomes indent/dedent tokens -
+and turned into overlapping k-token shingles. A MinHash signature estimates the Jaccard
+similarity of two shingle sets, and LSH banding puts similar signatures in the same bucket, so
+candidates are found without comparing every pair. Candidates are confirmed with the exact
+Jaccard similarity.
+
+A grade may only be reused for the same program, and one changed token (< for >, True for False)
+in a long answer barely moves the Jaccard similarity. So by default (exact=True) a match also
+needs the identical token sequence; exact=False reports near-duplicates, e.g. for review.
+
+    index = DuplicateIndex(threshold=0.95, language="Python")
+    index.match_or_add("alice", text)   # None: alice's answer is new
+    index.match_or_add("bob", text2)    # ("alice", 1.0): bob handed in the same code, laid out differently
+
+cluster_texts() groups a whole list of answers at once, e.g. for an instructor review report.
+"""
+import os
+import re
+import random
+import hashlib
+import threading
+
+# ====== CONFIG ======
+# Minimum Jaccard similarity of shingle sets for two answers to share a grade (0 disables reuse)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.95"))
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 similarity almost always share a bucket
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)  # fixed, so signatures are stable across processes
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+_STRING = "|".join((r'"""[\s\S]*?"""', r"'''[\s\S]*?'''", r'"(?:\\.|[^"\\\n])*"', r"'(?:\\.|[^'\\\n])*'"))
+_COMMENTS = {"Python": r"#[^\n]*", "Java": r"//[^\n]*|/\*[\s\S]*?\*/"}
+_COMMENTS.update({language: _COMMENTS["Java"] for language in ("C", "C#", "C++")})
+
+def _token_pattern(comment):
+    return re.compile(rf"(?P<string>{_STRING})|(?P<comment>{comment})|(?P<newline>\n[ \t]*)|\w+|[^\w\s]")
+
+_TOKEN_PATTERNS = {language: _token_pattern(comment) for language, comment in _COMMENTS.items()}
+_TOKEN_PATTERNS[None] = _token_pattern(r"(?!)")  # no comment syntax to strip
+
+# ====== FINGERPRINTS ======
+def normalize_tokens(text, language=None):
+    """Word, symbol and string literal tokens without comments; case is kept"""
+    pattern = _TOKEN_PATTERNS.get(language, _TOKEN_PATTERNS[None])
+    # Indentation is part of a Python program; an unknown language is treated the same way
+    track_indent = language == "Python" or language not in _COMMENTS
+    tokens = []
+    levels = [0]
+    indent = None  # indentation of the line the next token starts
+    for match in pattern.finditer("\n" + (text or "")):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        if kind == "newline":
+            indent = len(match.group().expandtabs(4)) - 1
+            continue
+        if indent is not None and track_indent:
+            while indent < levels[-1]:
+                levels.pop()
+                tokens.append("<dedent>")
+            if indent > levels[-1]:
+                levels.append(indent)
+                tokens.append("<indent>")
+        indent = None
+        tokens.append(match.group())
+    return tokens
+
+def shingles(text, size=SHINGLE_SIZE, language=None):
+    """Set of hashed k-token shingles (a single shingle for answers shorter than size)"""
+    return _shingles(normalize_tokens(text, language), size)
+
+def _shingles(tokens, size=SHINGLE_SIZE):
+    if not tokens:
+        return set()
+    if len(tokens) < size:
+        return {_hash_shingle(tokens)}
+    return {_hash_shingle(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+def _digest(tokens):
+    return hashlib.blake2b("\x1f".join(tokens).encode('utf-8'), digest_size=16).digest()
+
+def _hash_shingle(tokens):
+    return int.from_bytes(hashlib.blake2b("\x1f".join(tokens).encode('utf-8'), digest_size=8).digest(), 'big')
+
+def minhash(shingle_set):
+    return [min((a * value + b) % _MERSENNE_PRIME for value in shingle_set) for a, b in _PERMUTATIONS]
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def _bands(signature):
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    return [(band, tuple(signature[band * rows:(band + 1) * rows])) for band in range(LSH_BANDS)]
+
+# ====== INDEX ======
+class DuplicateIndex:
+    """
+    Online near-duplicate index, safe to share between threads.
+    The first answer of each cluster is its leader; later duplicates are matched to it.
+    With exact=True only answers with the leader's exact token sequence are matched.
+    """
+    def __init__(self, threshold=DEDUP_THRESHOLD, language=None, exact=True):
+        self.threshold = threshold
+        self.language = language
+        self.exact = exact
+        self._buckets = {}   # (band, band hash) -> leader keys
+        self._shingles = {}  # leader key -> shingle set
+        self._digests = {}   # leader key -> digest of its token sequence
+        self._lock = threading.Lock()
+
+    def match_or_add(self, key, text):
+        """
+        Returns (leader key, similarity) if text is a duplicate of an indexed answer,
+        otherwise indexes it under key and returns None. Empty answers are never matched.
+        """
+        tokens = normalize_tokens(text, self.language)
+        shingle_set = _shingles(tokens)
+        if not shingle_set:
+            return None
+        digest = _digest(tokens)
+        bands = _bands(minhash(shingle_set))
+        with self._lock:
+            best = None
+            candidates = {leader for band in bands for leader in self._buckets.get(band, ())}
+            for leader in candidates:
+                if self.exact and self._digests[leader] != digest:
+                    continue
+                similarity = jaccard(shingle_set, self._shingles[leader])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (leader, similarity)
+            if best is not None:
+                return best
+            self._shingles[key] = shingle_set
+            self._digests[key] = digest
+            for band in bands:
+                self._buckets.setdefault(band, []).append(key)
+        return None
+
+    def remove(self, key):
+        """Stops matching against key (e.g. its grading failed)"""
+        with self._lock:
+            if self._shingles.pop(key, None) is None:
+                return
+            del self._digests[key]
+            for leaders in self._buckets.values():
+                if key in leaders:
+                    leaders.remove(key)
+
+def cluster_texts(texts, threshold=DEDUP_THRESHOLD, language=None, exact=False):
+    """Groups of indices into texts whose answers are near-duplicates (only groups of 2 or more)"""
+    index = DuplicateIndex(threshold, language, exact)
+    clusters = {}
+    for i, text in enumerate(texts):
+        match = index.match_or_add(i, text)
+        if match is None:
+            clusters[i] = [i]
+        else:
+            clusters[match[0]].append(i)
+    return [members for members in clusters.values() if len(members) > 1]
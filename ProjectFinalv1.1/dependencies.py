@@ -0,0 +1,117 @@
+"""
+Explicit dependency check for the entry points.
+
+Importing the grader modules never probes or installs packages; the GUI and batch_grader call
+check_dependencies() once at startup instead. The check only looks packages up (nothing is
+imported), and a passing result is remembered in DEPENDENCY_CHECK_FILE for the same interpreter,
+so repeated launches skip it entirely.
+
+    python dependencies.py            # report missing packages
+    python dependencies.py --install  # pip install the missing ones
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+import importlib.util
+
+# ====== CONFIG ======
+DEPENDENCY_CHECK_FILE = os.getenv("DEPENDENCY_CHECK_FILE", os.path.join(os.getcwd(), ".dependency_check.json"))
+DEPENDENCY_CHECK_ENABLED = os.getenv("DEPENDENCY_CHECK", "1") != "0"
+
+# (module, pip package) needed by every run
+REQUIRED = [
+    ("PIL", "Pillow"),
+    ("requests", "requests"),
+    ("dotenv", "python-dotenv"),
+]
+# Only needed for some features: the Vision OCR backend, PDF scans and the local OCR backend
+OPTIONAL = {
+    "vision": [("google.cloud.vision", "google-cloud-vision")],
+    "pdf": [("pypdfium2", "pypdfium2")],
+    "local_ocr": [("pytesseract", "pytesseract")],
+}
+
+_checked = {}
+
+def _installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        # A missing parent package (e.g. "google" for "google.cloud.vision")
+        return False
+
+def _requirements(features):
+    requirements = list(REQUIRED)
+    for feature in features:
+        requirements.extend(OPTIONAL[feature])
+    return requirements
+
+def _check_key(requirements):
+    return f"{sys.executable}|{sys.version_info[:3]}|{','.join(module for module, _ in requirements)}"
+
+def _load_passed():
+    try:
+        with open(DEPENDENCY_CHECK_FILE, encoding='utf-8') as f:
+            return set(json.load(f).get("passed", []))
+    except (OSError, ValueError):
+        return set()
+
+def _save_passed(key):
+    passed = _load_passed()
+    passed.add(key)
+    try:
+        with open(DEPENDENCY_CHECK_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"passed": sorted(passed)}, f)
+    except OSError:
+        pass
+
+def check_dependencies(features=("vision",), force=False):
+    """
+    Returns the pip package names missing for features (empty list = all present).
+    Results are cached per process, and a passing check is also saved to disk.
+    """
+    requirements = _requirements(features)
+    key = _check_key(requirements)
+    if not force:
+        if key in _checked:
+            return list(_checked[key])
+        if DEPENDENCY_CHECK_ENABLED and key in _load_passed():
+            _checked[key] = []
+            return []
+    missing = [package for module, package in requirements if not _installed(module)]
+    _checked[key] = missing
+    if not missing and DEPENDENCY_CHECK_ENABLED:
+        _save_passed(key)
+    return list(missing)
+
+def missing_message(missing):
+    return (f"The following required packages are missing: {', '.join(missing)}\n\n"
+            f"Install them with:\n    {sys.executable} -m pip install {' '.join(missing)}\n"
+            f"or run: python dependencies.py --install")
+
+def install(packages):
+    """Runs pip install for packages; returns pip's exit code"""
+    return subprocess.call([sys.executable, "-m", "pip", "install", *packages])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check (and optionally install) the grader's dependencies.")
+    parser.add_argument("--install", action="store_true", help="pip install missing packages")
+    parser.add_argument("--feature", action="append", choices=sorted(OPTIONAL), help="Also check an optional feature (default: vision)")
+    args = parser.parse_args(argv)
+    features = args.feature or ["vision"]
+    missing = check_dependencies(features, force=True)
+    if not missing:
+        print("All dependencies are installed.")
+        return 0
+    if not args.install:
+        print(missing_message(missing))
+        return 1
+    code = install(missing)
+    if code == 0:
+        code = 1 if check_dependencies(features, force=True) else 0
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
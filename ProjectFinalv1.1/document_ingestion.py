@@ -0,0 +1,201 @@
+"""
+Multi-page exam documents (PDF / multi-page TIFF).
+
+A scanner typically produces one document per class. Pages are streamed out of it one at a
+time - each page is rendered, OCR'd and released before the next one is read - so memory
+stays flat no matter how long the document is. Students are split out of a document either
+by a fixed page count or by page ranges in a manifest, and an answer that spans several
+pages (or several image files) is OCR'd page by page and stitched into one text.
+
+A student with pages is described as:
+    {"name": ..., "image_path": <first file>, "pages": [[path, page], ...]}
+where page is a 1-based page number inside a document, or None for a plain image file.
+
+PDF rendering needs pypdfium2 (pip install pypdfium2); TIFFs are read with Pillow.
+"""
+import os
+import io
+import hashlib
+import threading
+from PIL import Image
+from image_text_viewer import (
+    OCR_TARGET_LONG_EDGE,
+    run_google_vision_ocr, prepare_image_for_ocr, get_ocr_backend, ocr_annotate, ocr_cache_mode
+)
+from cache import get_ocr_cache, document_page_cache_key
+from instrumentation import get_logger
+
+log = get_logger(__name__)
+
+DOCUMENT_EXTENSIONS = {'.pdf', '.tif', '.tiff'}
+PAGE_SEPARATOR = "\n"
+
+def is_document(path):
+    return os.path.splitext(path)[1].lower() in DOCUMENT_EXTENSIONS
+
+def _open_pdf(path):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise ImportError("Reading PDF exams requires pypdfium2 (pip install pypdfium2)")
+    return pdfium.PdfDocument(path)  # pages are loaded on demand, not the whole file
+
+def count_pages(path):
+    if os.path.splitext(path)[1].lower() == '.pdf':
+        pdf = _open_pdf(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with Image.open(path) as img:
+        return getattr(img, "n_frames", 1)
+
+def render_page(path, page):
+    """Renders one 1-based page as a PIL image, no larger than OCR_TARGET_LONG_EDGE"""
+    if os.path.splitext(path)[1].lower() == '.pdf':
+        pdf = _open_pdf(path)
+        try:
+            pdf_page = pdf[page - 1]
+            # Render straight at OCR resolution instead of rasterizing at full size and shrinking
+            scale = OCR_TARGET_LONG_EDGE / max(pdf_page.get_size())
+            img = pdf_page.render(scale=scale).to_pil()
+            pdf_page.close()
+            return img
+        finally:
+            pdf.close()
+    with Image.open(path) as tiff:
+        tiff.seek(page - 1)  # TIFF frames are decoded one at a time
+        img = tiff.copy()
+    img.thumbnail((OCR_TARGET_LONG_EDGE, OCR_TARGET_LONG_EDGE), Image.LANCZOS)
+    return img
+
+def iter_pages(path, pages=None):
+    """Yields (page number, PIL image) one page at a time - for all pages, or the given 1-based ones"""
+    for page in pages or range(1, count_pages(path) + 1):
+        yield page, render_page(path, page)
+
+# ====== STUDENT SPLITTING ======
+def parse_page_range(spec):
+    """'1-3,5' -> [1, 2, 3, 5] (1-based, in the order given)"""
+    pages = []
+    for part in str(spec).replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first, last = int(first), int(last or first)
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range: {spec}")
+        pages.extend(range(first, last + 1))
+    if not pages:
+        raise ValueError(f"Empty page range: {spec!r}")
+    return pages
+
+def document_student(name, path, pages=None):
+    """One student whose answer is the given pages of a document (all pages by default)"""
+    pages = pages or range(1, count_pages(path) + 1)
+    return {"name": name, "image_path": path, "pages": [[path, page] for page in pages]}
+
+def split_document(path, pages_per_student, names=None):
+    """
+    Splits a class document into consecutive blocks of pages_per_student pages per student.
+    Students are named from names (in order) or "<document>_001", "<document>_002", ...
+    """
+    if pages_per_student < 1:
+        raise ValueError("pages_per_student must be at least 1")
+    total = count_pages(path)
+    if total % pages_per_student:
+        log.warning("%s has %d pages, not a multiple of %d; the last student gets %d", os.path.basename(path), total, pages_per_student, total % pages_per_student)
+    student_count = -(-total // pages_per_student)
+    if names is not None and len(names) != student_count:
+        raise ValueError(f"{os.path.basename(path)} holds {student_count} students but {len(names)} names were given")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    students = []
+    for i in range(student_count):
+        name = names[i] if names is not None else f"{stem}_{i + 1:03d}"
+        first = i * pages_per_student + 1
+        students.append(document_student(name, path, range(first, min(first + pages_per_student, total + 1))))
+    return students
+
+def add_student_pages(students, name, path, pages=None):
+    """
+    Adds a manifest row to students: a row with an existing name appends its pages to that
+    student, so one answer can span several images or page ranges.
+    """
+    if pages is None and not is_document(path):
+        entries = [[path, None]]
+    else:
+        entries = document_student(name, path, pages)["pages"]
+    for student in students:
+        if student["name"] == name:
+            student.setdefault("pages", [[student["image_path"], None]]).extend(entries)
+            return
+    student = {"name": name, "image_path": path}
+    if entries != [[path, None]]:
+        student["pages"] = entries
+    students.append(student)
+
+# ====== OCR ======
+_digests = {}
+_digests_lock = threading.Lock()
+
+def file_digest(path):
+    """sha256 of a file, read in chunks (never the whole document in memory) and memoized per mtime/size"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _digests_lock:
+        if memo_key in _digests:
+            return _digests[memo_key]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    with _digests_lock:
+        _digests[memo_key] = digest.hexdigest()
+    return _digests[memo_key]
+
+def run_document_page_ocr(path, page, preprocess=False, use_cache=True, backend=None):
+    """
+    Returns (text, confidence_scores) for one page of a document.
+    Cached by document content + page number, so a cache hit doesn't render the page at all.
+    """
+    backend = backend or get_ocr_backend()
+    cache = get_ocr_cache() if use_cache else None
+    if cache:
+        key = document_page_cache_key(file_digest(path), page, preprocess, ocr_cache_mode(backend))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["text"], cached["confidence_scores"]
+    img = render_page(path, page)
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    page_bytes = io.BytesIO()
+    img.save(page_bytes, format='PNG')
+    del img
+    content, _ = prepare_image_for_ocr(page_bytes.getvalue(), preprocess)
+    text, confidence_scores = ocr_annotate(backend, content)
+    if cache:
+        cache.set(key, {"text": text, "confidence_scores": confidence_scores})
+    return text, confidence_scores
+
+def ocr_pages(pages, preprocess=True):
+    """OCRs a student's pages in order and stitches them into one text"""
+    texts = []
+    for path, page in pages:
+        if page is None:
+            text, _ = run_google_vision_ocr(path, preprocess=preprocess)
+        else:
+            text, _ = run_document_page_ocr(path, page, preprocess=preprocess)
+        if text:
+            texts.append(text.strip('\n'))
+    return PAGE_SEPARATOR.join(texts)
+
+def invalidate_document_ocr_cache(path, pages=None):
+    """Drops cached OCR results for a document's pages (both preprocessing variants)"""
+    cache = get_ocr_cache()
+    if not cache:
+        return
+    mode = ocr_cache_mode(get_ocr_backend())
+    digest = file_digest(path)
+    for page in pages or range(1, count_pages(path) + 1):
+        for preprocess in (True, False):
+            cache.invalidate(document_page_cache_key(digest, page, preprocess, mode))
@@ -1,25 +1,41 @@
 import sys
 import os
-import tkinter as tk
-from tkinter import filedialog, simpledialog, messagebox, scrolledtext
-import requests
-import io
-from PIL import Image, ImageTk
-from google.cloud import vision
-from difflib import SequenceMatcher
-from image_text_viewer import run_google_vision_ocr
+from PIL import Image
+from difflib import unified_diff
+from code_similarity import similarity as code_similarity
+from image_text_viewer import run_google_vision_ocr, run_google_vision_ocr_batch, get_ocr_backend, calculate_ocr_accuracy
+from document_ingestion import ocr_pages, is_document, document_student, render_page
+from gemini_transport import GeminiError
+from llm_client import GeminiReplyError, get_llm_client
+from instrumentation import get_logger, span, count, configure_logging
+from dependencies import check_dependencies, missing_message
+from cache import get_gemini_cache, get_reference_cache, gemini_cache_key, reference_cache_key
 import re
 import random
 import string
-import builtins
+import json
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+log = get_logger(__name__)
+
 # ====== CONFIG ======
 API_KEY = os.getenv("GEMINI_API_KEY")  # Gemini API Key - must be set in .env file
 GOOGLE_CREDENTIALS = os.path.join(os.getcwd(), os.getenv("GOOGLE_CREDENTIALS_FILE", "google-credentials.json"))
+GEMINI_MODEL = "gemini-2.0-flash"
+# Question images are usually typed: try the offline OCR engine first and use Vision only below this confidence
+QUESTION_OCR_LOCAL_FIRST = os.getenv("QUESTION_OCR_LOCAL_FIRST", "1") != "0"
+LOCAL_OCR_MIN_CONFIDENCE = int(os.getenv("LOCAL_OCR_MIN_CONFIDENCE", "90"))  # percent
+GUI_POLL_MS = 100  # how often the GUI picks up results from the grading thread
+# Start the reference answer and student OCR in the background before "Run" is clicked
+GUI_PREFETCH = os.getenv("GUI_PREFETCH", "1") != "0"
+GUI_PREFETCH_WORKERS = int(os.getenv("GUI_PREFETCH_WORKERS", "4"))
 
 # ====== PARAMETERS & WEIGHTS ======
 PARAMETERS = [
@@ -30,6 +46,12 @@ PARAMETERS = [
     ("Edge Cases", 0.15)
 ]
 
+LANGUAGES = ["Python", "Java", "C", "C#", "C++"]
+
+def exam_points(final_score, question_score):
+    # Convert a 0-100 final score into points out of the question's value
+    return int(round((final_score / 100) * question_score))
+
 # ====== OCR FUNCTION ======
 def get_ocr_text(image_path):
     result = run_google_vision_ocr(image_path, preprocess=True)
@@ -38,28 +60,81 @@ def get_ocr_text(image_path):
         return result[0]  # Return only the text part
     return result
 
+def get_question_ocr_text(image_path):
+    """OCR for a question image: the cheap local engine when it reads the page confidently, otherwise the default backend"""
+    if QUESTION_OCR_LOCAL_FIRST and get_ocr_backend().name == "vision":
+        try:
+            text, confidence_scores = run_google_vision_ocr(image_path, backend=get_ocr_backend("local"))
+            if text.strip() and calculate_ocr_accuracy(confidence_scores) >= LOCAL_OCR_MIN_CONFIDENCE:
+                return text
+        except Exception as e:
+            log.warning("Local OCR unavailable, using Google Vision: %s", e)
+    return get_ocr_text(image_path)
+
+def get_ocr_texts(image_paths):
+    """Batch variant of get_ocr_text (one Vision request for many pages); failed images come back as Exception instances"""
+    return [result if isinstance(result, Exception) else result[0] for result in run_google_vision_ocr_batch(image_paths, preprocess=True)]
+
+def get_pages_ocr_text(pages):
+    """OCR text for an answer spanning several pages/images, stitched in page order"""
+    return ocr_pages(pages, preprocess=True)
+
 # ====== GEMINI FUNCTION ======
-def get_gemini_answer(question_text, language=None):
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json",
-        "X-goog-api-key": API_KEY
-    }
+def get_gemini_answer(question_text, language=None, generation_config=None, use_cache=True, raise_errors=False):
+    """
+    Sends a prompt to Gemini and returns the reply text, or a "[שגיאה ...]" string on failure
+    (raise_errors=True raises GeminiError instead, so graders don't parse the error text as a score).
+    Requests go through the shared LLM client (see llm_client) and successful replies are
+    cached on disk by (model, prompt, generation config).
+    """
+    client = get_llm_client(API_KEY, GEMINI_MODEL)
     if language:
         prompt = f"{question_text}\n\nכתוב את התשובה בקוד {language}."
     else:
         prompt = question_text
-    data = {
-        "contents": [{"parts": [{"text": prompt}]}]
-    }
-    resp = requests.post(url, headers=headers, json=data)
-    if resp.status_code == 200:
-        try:
-            return resp.json()['candidates'][0]['content']['parts'][0]['text'].strip()
-        except Exception:
-            return "[שגיאה בפענוח תשובת Gemini]"
-    else:
-        return f"[שגיאה בחיבור ל-Gemini: {resp.status_code} {resp.text}]"
+    cache = get_gemini_cache() if use_cache else None
+    if cache:
+        key = gemini_cache_key(client.model, prompt, generation_config)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    try:
+        with span("gemini.generate", prompt_chars=len(prompt)):
+            answer, finish_reason = client.generate(prompt, generation_config)
+    except GeminiReplyError:
+        if raise_errors:
+            raise
+        return "[שגיאה בפענוח תשובת Gemini]"
+    except GeminiError as e:
+        if raise_errors:
+            raise
+        return f"[שגיאה בחיבור ל-Gemini: {e}]"
+    # Don't cache replies cut off by token limits or safety filters
+    if cache and finish_reason == 'STOP':
+        cache.set(key, answer)
+    return answer
+
+def is_gemini_error(answer):
+    return answer.startswith("[שגיאה")
+
+def get_reference_answer(question_text, language, refresh=False):
+    """
+    Returns the pinned reference solution for a question, generating it once if needed.
+    The pin keeps the reference identical across runs; refresh=True regenerates it.
+    """
+    references = get_reference_cache()
+    key = reference_cache_key(GEMINI_MODEL, question_text, language)
+    if not refresh:
+        pinned = references.get(key)
+        if pinned is not None:
+            return pinned
+    answer = get_gemini_answer(question_text, language, use_cache=not refresh)
+    if not is_gemini_error(answer):
+        references.set(key, answer)
+    return answer
+
+def unpin_reference_answer(question_text, language):
+    return get_reference_cache().invalidate(reference_cache_key(GEMINI_MODEL, question_text, language))
 
 def repair_ocr_code(code):
     # Fix common OCR mistakes
@@ -82,34 +157,35 @@ def extract_signature(code):
     params = [p.strip().split('=')[0].strip() for p in match.group(2).split(',') if p.strip()]
     return name, params
 
-def generate_sample_inputs(params, n=3):
+def generate_sample_inputs(params, n=3, rng=random):
     # Try to guess types by parameter names, fallback to int/string
     samples = []
     for _ in range(n):
         args = []
         for p in params:
-            if 'str' in p or 'name' in p or 'text' in p:
-                args.append(''.join(random.choices(string.ascii_letters, k=5)))
-            elif 'list' in p:
-                args.append([random.randint(1, 10) for _ in range(3)])
+            p = p.lower()
+            if 'str' in p or 'name' in p or 'text' in p or 'word' in p or p == 's':
+                args.append(''.join(rng.choices(string.ascii_letters, k=5)))
+            elif 'list' in p or 'arr' in p or 'nums' in p or 'lst' in p or 'numbers' in p:
+                args.append([rng.randint(1, 10) for _ in range(3)])
             elif 'dict' in p:
                 args.append({str(i): i for i in range(3)})
             else:
-                args.append(random.randint(1, 10))
+                args.append(rng.randint(1, 10))
         samples.append(tuple(args))
     return samples
 
 def safe_run(code, func_name, args):
-    # Run code in restricted namespace
-    local_ns = {}
-    try:
-        exec(code, {'__builtins__': {k: getattr(builtins, k) for k in ('abs','min','max','sum','len','range','str','int','float','list','dict')}}, local_ns)
-        func = local_ns.get(func_name)
-        if not callable(func):
-            return Exception('Function not found')
-        return func(*args)
-    except Exception as e:
-        return e
+    # Run code in a sandbox process with CPU/memory/time limits (see execution_grader);
+    # returns the (JSON-normalized) return value, or an Exception
+    from execution_grader import run_sandboxed
+    reply = run_sandboxed(code, func_name, [list(args)])
+    if reply["status"] != "ok":
+        return Exception(reply.get("error") or reply["status"])
+    result = reply["results"][0]
+    if "error" in result:
+        return Exception(result["error"])
+    return result["value"]
 
 def strip_boilerplate(code, language=None):
     # Remove import, using, class, and public class lines
@@ -142,7 +218,49 @@ def add_numbers(a, b):
     return result
 
 # ====== GRADING FUNCTION ======
-def grade_student_answer(student_code, gemini_code, language=None):
+# "two-call": separate correctness and rubric prompts parsed with regexes (original behaviour)
+# "structured": one request returning all scores as JSON (half the requests and input tokens)
+# "batched": one structured request per batch of students answering the same question
+GRADING_MODES = ("two-call", "structured", "batched")
+DEFAULT_GRADING_MODE = "two-call"
+DEFAULT_BATCH_SIZE = 5
+
+# Similarity-fallback bands, calibrated for code_similarity on the benchmark corpus: OCR-noised
+# correct answers (with renamed variables) score >= 0.77 in 95% of cases (median 1.0), while
+# answers to a different question stay below 0.59. Above SIMILARITY_HIGH an answer is taken as
+# correct, between the two as likely correct with OCR damage; below, the raw score is used.
+SIMILARITY_HIGH = 0.75
+SIMILARITY_MEDIUM = 0.6
+
+# Gemini responseSchema for the structured mode; maps JSON fields to PARAMETERS names
+STRUCTURED_SCORE_FIELDS = {
+    "Correctness": "correctness",
+    "Syntax": "syntax",
+    "Code Structure": "structure",
+    "Efficiency": "efficiency",
+    "Edge Cases": "edge_cases"
+}
+STRUCTURED_GRADING_SCHEMA = {
+    "type": "OBJECT",
+    "properties": dict(
+        {field: {"type": "INTEGER"} for field in STRUCTURED_SCORE_FIELDS.values()},
+        explanation={"type": "STRING"},
+        corrected_code={"type": "STRING"}
+    ),
+    "required": list(STRUCTURED_SCORE_FIELDS.values()) + ["explanation", "corrected_code"]
+}
+
+def grade_student_answer(student_code, gemini_code, language=None, mode=DEFAULT_GRADING_MODE):
+    if mode in ("structured", "batched"):
+        correctness, rubric, _ = evaluate_structured(student_code, gemini_code, language)
+    elif mode == "two-call":
+        correctness = evaluate_correctness(student_code, gemini_code, language)
+        rubric = evaluate_rubric(student_code, language)
+    else:
+        raise ValueError(f"Unknown grading mode: {mode}")
+    return combine_scores(correctness, rubric)
+
+def evaluate_correctness(student_code, gemini_code, language=None):
     # Use Gemini to evaluate the student's code
     language_info = f"PROGRAMMING LANGUAGE: {language}" if language else "PROGRAMMING LANGUAGE: Not specified"
     
@@ -190,49 +308,61 @@ def grade_student_answer(student_code, gemini_code, language=None):
     """
     
     try:
-        evaluation_response = get_gemini_answer(evaluation_prompt)
-        print(f"DEBUG: Gemini evaluation response: {evaluation_response}")
-        
+        evaluation_response = get_gemini_answer(evaluation_prompt, raise_errors=True)
+        log.debug("Gemini evaluation response: %s", evaluation_response)
+    except Exception as e:
+        log.warning("Error in Gemini evaluation: %s", e)
+        return similarity_correctness(student_code, gemini_code, language)
+
+    with span("parse.correctness"):
         # Parse the response - try multiple patterns
         score_match = re.search(r'SCORE:\s*(\d+)', evaluation_response, re.IGNORECASE)
         if not score_match:
             score_match = re.search(r'(\d+)\s*\/\s*100', evaluation_response)
         if not score_match:
             score_match = re.search(r'score[:\s]*(\d+)', evaluation_response, re.IGNORECASE)
-        
-        if score_match:
-            correctness = int(score_match.group(1))
-            print(f"DEBUG: Parsed correctness score: {correctness}")
-        else:
-            # Fallback to similarity if parsing fails
-            from difflib import SequenceMatcher
-            similarity = SequenceMatcher(None, student_code, gemini_code).ratio()
-            correctness = int(similarity * 100)
-            print(f"DEBUG: Could not parse Gemini score, using similarity: {correctness}%")
-            print(f"DEBUG: Raw response was: {evaluation_response}")
-            
-            # Be more lenient with similarity scoring for handwritten code
-            if similarity > 0.6:  # Lowered threshold for OCR errors
-                correctness = min(95, int(similarity * 100) + 25)  # Higher boost
-                print(f"DEBUG: High similarity detected, boosting score to: {correctness}")
-            elif similarity > 0.4:  # Medium similarity - likely correct with OCR errors
-                correctness = min(85, int(similarity * 100) + 30)
-                print(f"DEBUG: Medium similarity detected, boosting score to: {correctness}")
-    except Exception as e:
-        print(f"DEBUG: Error in Gemini evaluation: {e}")
-        # Fallback to similarity
-        from difflib import SequenceMatcher
-        similarity = SequenceMatcher(None, student_code, gemini_code).ratio()
-        correctness = int(similarity * 100)
-        print(f"DEBUG: Fallback to similarity: {correctness}%")
-        
-        # Additional check: be more lenient for handwritten code with OCR errors
-        if similarity > 0.7:  # Lowered threshold
-            correctness = 90
-            print(f"DEBUG: Very high similarity, assuming correct: {correctness}")
-        elif similarity > 0.5:  # Medium similarity - likely correct with OCR errors
-            correctness = 80
-            print(f"DEBUG: Medium similarity, likely correct with OCR errors: {correctness}")
+
+    if score_match:
+        correctness = int(score_match.group(1))
+        log.debug("Parsed correctness score: %d", correctness)
+        return correctness
+
+    # Fallback to similarity if parsing fails
+    count("fallback.unparsed_score")
+    count("fallback.similarity")
+    with span("fallback.similarity"):
+        similarity = code_similarity(student_code, gemini_code, language)
+    correctness = int(similarity * 100)
+    log.info("Could not parse Gemini score, using similarity: %d%%", correctness)
+    log.debug("Raw response was: %s", evaluation_response)
+
+    # Be more lenient with similarity scoring for handwritten code
+    if similarity >= SIMILARITY_HIGH:
+        correctness = min(95, int(similarity * 100) + 25)
+        log.debug("High similarity detected, boosting score to: %d", correctness)
+    elif similarity >= SIMILARITY_MEDIUM:  # likely correct with OCR errors
+        correctness = min(85, int(similarity * 100) + 30)
+        log.debug("Medium similarity detected, boosting score to: %d", correctness)
+    return correctness
+
+def similarity_correctness(student_code, gemini_code, language=None):
+    # Fallback to local token/structure similarity (see code_similarity)
+    count("fallback.similarity")
+    with span("fallback.similarity"):
+        similarity = code_similarity(student_code, gemini_code, language)
+    correctness = int(similarity * 100)
+    log.info("Fallback to similarity: %d%%", correctness)
+    
+    # Additional check: be more lenient for handwritten code with OCR errors
+    if similarity >= SIMILARITY_HIGH:
+        correctness = 90
+        log.debug("Very high similarity, assuming correct: %d", correctness)
+    elif similarity >= SIMILARITY_MEDIUM:  # likely correct with OCR errors
+        correctness = 80
+        log.debug("Medium similarity, likely correct with OCR errors: %d", correctness)
+    return correctness
+
+def evaluate_rubric(student_code, language=None):
     # Use Gemini for comprehensive evaluation
     comprehensive_prompt = f"""
     You are an expert programming instructor evaluating handwritten code that may contain OCR errors.
@@ -261,9 +391,13 @@ def grade_student_answer(student_code, gemini_code, language=None):
     """
     
     try:
-        comprehensive_response = get_gemini_answer(comprehensive_prompt)
-        print(f"DEBUG: Comprehensive evaluation: {comprehensive_response}")
-        
+        comprehensive_response = get_gemini_answer(comprehensive_prompt, raise_errors=True)
+    except Exception as e:
+        log.warning("Error in comprehensive evaluation: %s", e)
+        return rule_based_rubric(student_code)
+    log.debug("Comprehensive evaluation: %s", comprehensive_response)
+
+    with span("parse.rubric"):
         # Parse each score
         syntax_match = re.search(r'SYNTAX:\s*(\d+)', comprehensive_response)
         structure_match = re.search(r'STRUCTURE:\s*(\d+)', comprehensive_response)
@@ -274,29 +408,210 @@ def grade_student_answer(student_code, gemini_code, language=None):
         structure = int(structure_match.group(1)) if structure_match else 70
         efficiency = int(efficiency_match.group(1)) if efficiency_match else 70
         edge_cases = int(edge_cases_match.group(1)) if edge_cases_match else 60
-        
-    except Exception as e:
-        print(f"DEBUG: Error in comprehensive evaluation: {e}")
-        # Fallback to simple rules
-        syntax = 100 if ("error" not in student_code.lower() and "syntax" not in student_code.lower()) else 60
-        structure = 100 if ("def " in student_code or "function" in student_code) else 70
-        efficiency = 100 if ("for" in student_code or "while" in student_code) else 70
-        edge_cases = 100 if ("if" in student_code or "try" in student_code) else 60
-    
-    scores = [correctness, syntax, structure, efficiency, edge_cases]
-    weighted = sum([score * weight for score, (_, weight) in zip(scores, PARAMETERS)])
+
     return {
-        "Correctness": correctness,
         "Syntax": syntax,
         "Code Structure": structure,
         "Efficiency": efficiency,
-        "Edge Cases": edge_cases,
+        "Edge Cases": edge_cases
+    }
+
+def rule_based_rubric(student_code):
+    # Fallback to simple rules
+    count("fallback.rule_based")
+    return {
+        "Syntax": 100 if ("error" not in student_code.lower() and "syntax" not in student_code.lower()) else 60,
+        "Code Structure": 100 if ("def " in student_code or "function" in student_code) else 70,
+        "Efficiency": 100 if ("for" in student_code or "while" in student_code) else 70,
+        "Edge Cases": 100 if ("if" in student_code or "try" in student_code) else 60
+    }
+
+STRUCTURED_GUIDELINES = """GRADING GUIDELINES:
+    - The student code is scanned from handwriting. DO NOT deduct points for OCR errors such as typos
+      ("hum" vs "num"), missing parentheses/brackets/semicolons or spacing issues. Focus on INTENT and LOGIC.
+    - Ignore missing class/method declarations (public class, Main method), especially in C#/Java.
+    - If the logic is correct but has OCR/syntax errors, give HIGH scores (85-100).
+    - Only give low scores if the fundamental logic is wrong or missing key algorithm steps.
+
+    Score each field from 0 to 100:
+    - correctness: logical correctness compared to the correct solution
+    - syntax: logical syntax understanding, ignoring OCR typos
+    - structure: code organization and flow, ignoring missing boilerplate
+    - efficiency: algorithm efficiency and data structure choices
+    - edge_cases: handling of edge cases and error conditions
+    Also give a brief explanation of logical issues (ignore OCR errors) and corrected_code
+    ("NO CORRECTION NEEDED" if the logic is correct)."""
+
+def evaluate_structured(student_code, gemini_code, language=None):
+    """
+    Single-request evaluation: all five PARAMETERS scores, explanation and corrected code
+    come back as one JSON object. Returns (correctness, rubric, feedback).
+    """
+    structured_prompt = f"""
+    You are an expert programming instructor evaluating handwritten code that may contain OCR errors.
+
+    PROGRAMMING LANGUAGE: {language if language else 'Not specified'}
+
+    CORRECT SOLUTION:
+    {gemini_code}
+
+    STUDENT'S CODE (handwritten, may contain OCR errors):
+    {student_code}
+
+    {STRUCTURED_GUIDELINES}
+    """
+    generation_config = {
+        "responseMimeType": "application/json",
+        "responseSchema": STRUCTURED_GRADING_SCHEMA
+    }
+    try:
+        response = get_gemini_answer(structured_prompt, generation_config=generation_config, raise_errors=True)
+        log.debug("Gemini structured evaluation: %s", response)
+        with span("parse.structured"):
+            return parse_structured_grading(response)
+    except Exception as e:
+        log.warning("Error in structured evaluation: %s", e)
+        return similarity_correctness(student_code, gemini_code, language), rule_based_rubric(student_code), None
+
+def parse_structured_grading(response):
+    # Raises ValueError if the reply is not a complete grading object
+    return structured_grading_from_dict(json.loads(response))
+
+def structured_grading_from_dict(data):
+    if not isinstance(data, dict):
+        raise ValueError("Structured grading reply is not a JSON object")
+    scores = {}
+    for param, field in STRUCTURED_SCORE_FIELDS.items():
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"Missing or invalid '{field}' in structured grading reply")
+        scores[param] = max(0, min(100, int(value)))
+    correctness = scores.pop("Correctness")
+    feedback = {
+        "Explanation": str(data.get("explanation", "")),
+        "Corrected Code": str(data.get("corrected_code", ""))
+    }
+    return correctness, scores, feedback
+
+def evaluate_structured_batch(student_codes, gemini_code, language=None):
+    """
+    Grades several answers to the same question in one request, so the guidelines and the
+    reference solution are sent once per batch. Returns a list of (correctness, rubric, feedback)
+    in the order of student_codes. Raises ValueError if the reply is malformed or truncated.
+    """
+    answers = "\n".join(
+        f"""
+    --- STUDENT {i} (handwritten, may contain OCR errors) ---
+    {code}
+    --- END STUDENT {i} ---"""
+        for i, code in enumerate(student_codes)
+    )
+    batch_prompt = f"""
+    You are an expert programming instructor evaluating handwritten code that may contain OCR errors.
+
+    PROGRAMMING LANGUAGE: {language if language else 'Not specified'}
+
+    CORRECT SOLUTION:
+    {gemini_code}
+
+    {STRUCTURED_GUIDELINES}
+
+    Grade each of the following {len(student_codes)} students independently and return one object per
+    student, with "id" set to the student's number.
+    {answers}
+    """
+    generation_config = {
+        "responseMimeType": "application/json",
+        "responseSchema": {
+            "type": "ARRAY",
+            "items": dict(
+                STRUCTURED_GRADING_SCHEMA,
+                properties=dict(STRUCTURED_GRADING_SCHEMA["properties"], id={"type": "INTEGER"}),
+                required=["id"] + STRUCTURED_GRADING_SCHEMA["required"]
+            )
+        }
+    }
+    response = get_gemini_answer(batch_prompt, generation_config=generation_config, raise_errors=True)
+    log.debug("Gemini batch evaluation (%d students): %s", len(student_codes), response)
+    with span("parse.batch", students=len(student_codes)):
+        items = json.loads(response)
+        if not isinstance(items, list):
+            raise ValueError("Batch grading reply is not a JSON array")
+        graded = {}
+        for item in items:
+            if isinstance(item, dict) and isinstance(item.get("id"), int) and 0 <= item["id"] < len(student_codes):
+                graded[item["id"]] = structured_grading_from_dict(item)
+    if len(graded) != len(student_codes):
+        raise ValueError(f"Batch grading reply covers {len(graded)} of {len(student_codes)} students")
+    return [graded[i] for i in range(len(student_codes))]
+
+def grade_batch(student_codes, gemini_code, language=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Grades student_codes in batches of at most batch_size. A batch whose reply is malformed or
+    truncated is split in half and retried; a single answer falls back to evaluate_structured.
+    """
+    results = []
+    for start in range(0, len(student_codes), batch_size):
+        results.extend(_grade_batch_with_fallback(student_codes[start:start + batch_size], gemini_code, language))
+    return results
+
+def _grade_batch_with_fallback(student_codes, gemini_code, language):
+    if len(student_codes) == 1:
+        return [evaluate_structured(student_codes[0], gemini_code, language)]
+    try:
+        return evaluate_structured_batch(student_codes, gemini_code, language)
+    except GeminiError as e:
+        # Request failed even after retries - smaller batches would only add load
+        log.warning("Batch of %d failed (%s), using local fallback", len(student_codes), e)
+        count("fallback.batch_local", len(student_codes))
+        return [(similarity_correctness(code, gemini_code, language), rule_based_rubric(code), None) for code in student_codes]
+    except Exception as e:
+        log.info("Batch of %d failed (%s), splitting", len(student_codes), e)
+        count("fallback.batch_splits")
+        middle = len(student_codes) // 2
+        return (_grade_batch_with_fallback(student_codes[:middle], gemini_code, language)
+                + _grade_batch_with_fallback(student_codes[middle:], gemini_code, language))
+
+def combine_scores(correctness, rubric):
+    scores = dict(rubric, Correctness=correctness)
+    weighted = sum([scores[param] * weight for param, weight in PARAMETERS])
+    return {
+        "Correctness": correctness,
+        "Syntax": scores["Syntax"],
+        "Code Structure": scores["Code Structure"],
+        "Efficiency": scores["Efficiency"],
+        "Edge Cases": scores["Edge Cases"],
         "Final Score": int(weighted)
     }
 
 # ====== UI ======
+def reference_diff(reference_code, student_code, student_name="student"):
+    """Line diff of a student's answer against the reference, as (line, tag) pairs ("added"/"removed"/None)"""
+    lines = []
+    for line in unified_diff(str(reference_code or "").splitlines(), str(student_code or "").splitlines(), "Gemini", student_name, lineterm=""):
+        if line.startswith(("---", "+++")):
+            tag = None
+        elif line.startswith("+"):
+            tag = "added"
+        elif line.startswith("-"):
+            tag = "removed"
+        else:
+            tag = None
+        lines.append((line, tag))
+    return lines or [("(אין הבדלים)", None)]
+
+# tkinter is loaded by import_gui(): batch_grader and worker processes never import it
+tk = filedialog = simpledialog = messagebox = scrolledtext = ttk = None
+
+def import_gui():
+    """Imports tkinter for the GUI; raises ImportError when it isn't installed"""
+    global tk, filedialog, simpledialog, messagebox, scrolledtext, ttk
+    import tkinter as tk
+    from tkinter import filedialog, simpledialog, messagebox, scrolledtext, ttk
+
 class ExamGraderApp:
     def __init__(self, root):
+        import_gui()
         self.root = root
         self.root.title("AI Exam Grader - Gemini")
         self.root.configure(bg="#f7f7fa")
@@ -305,6 +620,10 @@ class ExamGraderApp:
         self.students = []  # List of (name, image_path, ocr_text, scores)
         self.question_score = 10  # ברירת מחדל
         self.selected_language = tk.StringVar(value="C#")
+        self.prefetch_pool = None
+        self.reference_prefetch = None  # ((question, language), Future of the reference answer)
+        self.ocr_prefetch = {}  # scan path -> Future of its OCR text
+        self.selected_language.trace_add('write', lambda *_: self.prefetch_reference())
         self.build_ui()
 
     def build_ui(self):
@@ -320,8 +639,7 @@ class ExamGraderApp:
         lang_frame = tk.Frame(self.frame, bg="#f7f7fa")
         lang_frame.pack(pady=(10, 5))
         tk.Label(lang_frame, text="בחר שפת קוד לתשובת Gemini:", font=("Arial", 12), bg="#f7f7fa", fg="#222").pack(side='left')
-        lang_options = ["Python", "Java", "C", "C#", "C++"]
-        lang_menu = tk.OptionMenu(lang_frame, self.selected_language, *lang_options)
+        lang_menu = tk.OptionMenu(lang_frame, self.selected_language, *LANGUAGES)
         lang_menu.config(font=("Arial", 12), bg="#e0e7ff", fg="#222")
         lang_menu.pack(side='left', padx=8)
         # ניקוד שאלה
@@ -341,7 +659,11 @@ class ExamGraderApp:
     def upload_question_image(self):
         path = filedialog.askopenfilename(title='בחר תמונה של שאלה', filetypes=[('Image Files', '*.png;*.jpg;*.jpeg;*.bmp;*.tiff;*.tif;*.webp')])
         if path:
-            text = get_ocr_text(path)
+            try:
+                text = get_question_ocr_text(path)
+            except Exception as e:
+                messagebox.showerror("שגיאה", f"שגיאה בזיהוי הטקסט:\n{e}")
+                return
             if not text:
                 messagebox.showerror("שגיאה", "לא זוהה טקסט בתמונה.")
                 return
@@ -357,8 +679,60 @@ class ExamGraderApp:
         except Exception:
             messagebox.showerror("שגיאה", "ניקוד השאלה חייב להיות מספר חיובי.")
             return
+        self.prefetch_reference()
         self.next_step_students()
 
+    # ---- background prefetch ----
+    def prefetch_executor(self):
+        if self.prefetch_pool is None:
+            self.prefetch_pool = ThreadPoolExecutor(GUI_PREFETCH_WORKERS, thread_name_prefix="prefetch")
+        return self.prefetch_pool
+
+    def prefetch_reference(self):
+        """Starts generating the reference answer for the current question and language"""
+        if not GUI_PREFETCH or not self.question_text:
+            return
+        key = (self.question_text, self.selected_language.get())
+        if self.reference_prefetch is not None:
+            if self.reference_prefetch[0] == key:
+                return
+            # The question or language changed; drop the stale request if it hasn't started yet
+            self.reference_prefetch[1].cancel()
+        self.reference_prefetch = (key, self.prefetch_executor().submit(get_reference_answer, *key))
+
+    def prefetch_ocr(self, path):
+        """Starts OCR of a student's scan as soon as it is added"""
+        if not GUI_PREFETCH or path in self.ocr_prefetch:
+            return
+        if is_document(path):
+            future = self.prefetch_executor().submit(get_pages_ocr_text, document_student("", path)["pages"])
+        else:
+            future = self.prefetch_executor().submit(get_ocr_text, path)
+        self.ocr_prefetch[path] = future
+
+    def prefetched_reference(self, language):
+        """The prefetched reference answer Future for the current question and language, or None"""
+        if self.reference_prefetch is None or self.reference_prefetch[0] != (self.question_text, language):
+            return None
+        future = self.reference_prefetch[1]
+        return None if future.cancelled() else future
+
+    def prefetched_ocr(self, path):
+        # A failed prefetch is ignored, so the pipeline OCRs the scan again
+        future = self.ocr_prefetch.get(path)
+        if future is None or future.cancelled() or (future.done() and future.exception() is not None):
+            return None
+        return future
+
+    def close_prefetch(self):
+        if self.prefetch_pool is None:
+            return
+        if self.reference_prefetch is not None:
+            self.reference_prefetch[1].cancel()
+        for future in self.ocr_prefetch.values():
+            future.cancel()
+        self.prefetch_pool.shutdown(wait=False)
+
     def next_step_students(self):
         for widget in self.frame.winfo_children():
             widget.destroy()
@@ -376,29 +750,143 @@ class ExamGraderApp:
         name = simpledialog.askstring("שם סטודנט", "הזן שם/מזהה לסטודנט:")
         if not name:
             return
-        path = filedialog.askopenfilename(title='בחר תמונה של תשובת סטודנט', filetypes=[('Image Files', '*.png;*.jpg;*.jpeg;*.bmp;*.tiff;*.tif;*.webp')])
+        path = filedialog.askopenfilename(title='בחר תמונה של תשובת סטודנט', filetypes=[('Image Files', '*.png;*.jpg;*.jpeg;*.bmp;*.tiff;*.tif;*.webp'), ('Multi-page Documents', '*.pdf;*.tiff;*.tif')])
         if not path:
             return
         self.students.append((name, path, None, None))
         self.students_listbox.insert(tk.END, f"{name} - {os.path.basename(path)}")
+        self.prefetch_ocr(path)
 
     def run_grading(self):
         if not self.students:
             messagebox.showerror("שגיאה", "לא הוספת אף סטודנט.")
             return
-        self.step_label.config(text="מריץ Gemini... זה עשוי לקחת מספר שניות...")
-        self.root.update()
-        selected_language = self.selected_language.get()
-        self.gemini_answer = get_gemini_answer(self.question_text, selected_language)
-        results = []
-        for i, (name, path, _, _) in enumerate(self.students):
-            ocr_text = get_ocr_text(path)
-            scores = grade_student_answer(ocr_text, self.gemini_answer, selected_language)
-            # חישוב ניקוד סופי
-            final_score = scores["Final Score"]
-            exam_points = int(round((final_score / 100) * self.question_score))
-            scores["Exam Points"] = exam_points
-            results.append((name, ocr_text, scores))
+        from batch_grader import grade_cohort
+        from job_store import JOB_STORE_ENABLED, get_job_store
+        students = [document_student(name, path) if is_document(path) else {"name": name, "image_path": path} for name, path, _, _ in self.students]
+        language = self.selected_language.get()
+        # Scans whose OCR was prefetched go straight to evaluation
+        for student in students:
+            ocr_future = self.prefetched_ocr(student["image_path"])
+            if ocr_future is not None:
+                student["ocr_future"] = ocr_future
+        reference_future = self.prefetched_reference(language)
+        self.build_progress_view(students)
+        # Grading runs on a background thread; results come back through a queue polled by the Tk loop
+        self.grading_events = queue.Queue()
+        self.grading_cancel = threading.Event()
+        self.grading_started = time.monotonic()
+
+        def grade():
+            try:
+                reference_answer = None
+                if reference_future is not None:
+                    try:
+                        reference_answer = reference_future.result()
+                    except Exception as e:
+                        log.warning("Prefetched reference answer failed, requesting it again: %s", e)
+                    if reference_answer is not None and is_gemini_error(reference_answer):
+                        reference_answer = None
+                report = grade_cohort(self.question_text, students, language, self.question_score, reference_answer=reference_answer,
+                                      on_result=lambda index, result: self.grading_events.put(("result", index, result)),
+                                      cancel=self.grading_cancel, store=get_job_store() if JOB_STORE_ENABLED else None)
+            except Exception as e:
+                self.grading_events.put(("error", None, e))
+            else:
+                self.grading_events.put(("done", None, report))
+
+        threading.Thread(target=grade, name="grading", daemon=True).start()
+        self.root.after(GUI_POLL_MS, self.poll_grading)
+
+    def build_progress_view(self, students):
+        for widget in self.frame.winfo_children():
+            widget.destroy()
+        self.step_label = tk.Label(self.frame, text="מריץ בדיקה...", font=("Arial", 14, "bold"), bg="#f7f7fa", fg="#222")
+        self.step_label.pack(pady=(0, 10))
+        self.progress = ttk.Progressbar(self.frame, orient='horizontal', length=500, mode='determinate', maximum=len(students))
+        self.progress.pack(pady=5, fill='x')
+        self.progress_label = tk.Label(self.frame, text=f"0 / {len(students)} - מכין תשובת Gemini...", font=("Arial", 11), bg="#f7f7fa", fg="#4f46e5")
+        self.progress_label.pack(pady=(0, 5))
+        # סטטוס לכל סטודנט - תוצאות חלקיות מוצגות מיד כשהן מוכנות
+        status_frame = tk.Frame(self.frame, bg="#f7f7fa")
+        status_frame.pack(pady=5, fill='both', expand=True)
+        self.status_tree = ttk.Treeview(status_frame, columns=("name", "status", "Final Score", "Exam Points"), show='headings', height=12, selectmode='browse')
+        status_scroll = ttk.Scrollbar(status_frame, orient='vertical', command=self.status_tree.yview)
+        self.status_tree.configure(yscrollcommand=status_scroll.set)
+        for column, title, width in (("name", "סטודנט", 180), ("status", "סטטוס", 220), ("Final Score", "Final Score", 100), ("Exam Points", "Exam Points", 100)):
+            self.status_tree.heading(column, text=title)
+            self.status_tree.column(column, width=width, anchor='w' if column in ("name", "status") else 'center')
+        self.status_tree.pack(side='left', fill='both', expand=True)
+        status_scroll.pack(side='right', fill='y')
+        for idx, student in enumerate(students):
+            self.status_tree.insert('', 'end', iid=str(idx), values=(student["name"], "ממתין", "", ""))
+        self.partial_text = scrolledtext.ScrolledText(self.frame, width=80, height=8, font=("Consolas", 10), bg="#fff", fg="#222", wrap='word')
+        self.partial_text.config(state='disabled')
+        self.partial_text.pack(pady=5, fill='both', expand=True)
+        self.status_tree.bind('<<TreeviewSelect>>', lambda e: self.show_partial_result())
+        self.btn_cancel = tk.Button(self.frame, text="בטל", command=self.cancel_grading, font=("Arial", 12), bg="#fee2e2", fg="#222", relief="raised")
+        self.btn_cancel.pack(pady=10, fill='x')
+        self.grading_results = [None] * len(students)
+
+    def show_partial_result(self):
+        selection = self.status_tree.selection()
+        result = self.grading_results[int(selection[0])] if selection else None
+        self.partial_text.config(state='normal')
+        self.partial_text.delete('1.0', tk.END)
+        if result is not None:
+            self.partial_text.insert(tk.END, result.get("error") or result["ocr_text"])
+        self.partial_text.config(state='disabled')
+
+    def cancel_grading(self):
+        self.grading_cancel.set()
+        self.btn_cancel.config(state='disabled', text="מבטל...")
+
+    def poll_grading(self):
+        """Applies results from the grading thread to the UI (runs on the Tk thread)"""
+        while True:
+            try:
+                kind, index, payload = self.grading_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "result":
+                self.grading_results[index] = payload
+                self.update_student_status(index, payload)
+            elif kind == "error":
+                messagebox.showerror("שגיאה", f"הבדיקה נכשלה:\n{payload}")
+                self.btn_cancel.config(text="סגור", state='normal', command=self.root.destroy)
+                return
+            else:
+                self.finish_grading(payload)
+                return
+        self.root.after(GUI_POLL_MS, self.poll_grading)
+
+    def update_student_status(self, index, result):
+        if result.get("cancelled"):
+            values = (result["name"], "בוטל", "", "")
+        elif result.get("error"):
+            values = (result["name"], f"נכשל: {result['error']}", "", "")
+        else:
+            values = (result["name"], "הושלם", result["scores"]["Final Score"], result["scores"]["Exam Points"])
+        self.status_tree.item(str(index), values=values)
+        done = sum(1 for r in self.grading_results if r is not None)
+        total = len(self.grading_results)
+        self.progress['value'] = done
+        elapsed = time.monotonic() - self.grading_started
+        eta = elapsed / done * (total - done)
+        self.progress_label.config(text=f"{done} / {total} - זמן משוער לסיום: {int(eta) // 60}:{int(eta) % 60:02d}")
+
+    def finish_grading(self, report):
+        self.gemini_answer = report["reference_answer"]
+        graded = [r for r in report["students"] if not r.get("error")]
+        failed = [r for r in report["students"] if r.get("error") and not r.get("cancelled")]
+        if failed:
+            details = "\n".join(f"{r['name']}: {r['error']}" for r in failed)
+            messagebox.showerror("שגיאה", f"הבדיקה נכשלה עבור:\n{details}")
+        if not graded:
+            self.step_label.config(text="אין תוצאות להצגה")
+            self.btn_cancel.config(text="סגור", state='normal', command=self.root.destroy)
+            return
+        results = [(r["name"], r["ocr_text"], r["scores"], r["image_path"]) for r in graded]
         self.show_results(results)
 
     def show_results(self, results):
@@ -463,15 +951,16 @@ class ExamGraderApp:
         def show_image_window(image_path, student_name):
             win = tk.Toplevel(self.root)
             win.title(f"תמונה מקורית - {student_name}")
-            img = Image.open(image_path)
+            img = render_page(image_path, 1) if is_document(image_path) else Image.open(image_path)
             img.thumbnail((700, 900))
+            from PIL import ImageTk
             img_tk = ImageTk.PhotoImage(img, master=win)
             lbl = tk.Label(win, image=img_tk)
             lbl.image = img_tk
             lbl.pack(padx=10, pady=10)
 
         if len(results) == 1:
-            name, ocr_text, scores = results[0]
+            name, ocr_text, scores, image_path = results[0]
             compare_frame = tk.Frame(self.frame, bg="#f7f7fa")
             compare_frame.pack(pady=10, fill='x')
             # Gemini
@@ -488,7 +977,7 @@ class ExamGraderApp:
             top_row = tk.Frame(student_frame, bg="#e0f7fa")
             top_row.pack(anchor='n', fill='x')
             tk.Label(top_row, text=f"תשובת {name}", font=("Arial", 12, "bold"), bg="#e0f7fa", fg="#4f46e5").pack(side='left', padx=8, pady=(4,0))
-            btn_img = tk.Button(top_row, text="הצג תמונה", font=("Arial", 10), bg="#e0e7ff", fg="#222", command=lambda: show_image_window(self.students[0][1], name))
+            btn_img = tk.Button(top_row, text="הצג תמונה", font=("Arial", 10), bg="#e0e7ff", fg="#222", command=lambda: show_image_window(image_path, name))
             btn_img.pack(side='left', padx=8, pady=(4,0))
             student_text = scrolledtext.ScrolledText(student_frame, width=45, height=10, font=("Consolas", 10), bg="#fff", fg="#222", wrap='word')
             student_text.insert(tk.END, ocr_text)
@@ -514,36 +1003,148 @@ class ExamGraderApp:
             gemini_text.insert(tk.END, str(self.gemini_answer or ""))
             gemini_text.config(state='disabled')
             gemini_text.pack(anchor='w', padx=8, pady=(0,8), fill='both', expand=True)
-            # לכל סטודנט
-            for idx, (name, ocr_text, scores) in enumerate(results):
-                sf = tk.LabelFrame(self.frame, text=f"סטודנט: {name}", padx=10, pady=10, font=("Arial", 12, "bold"), bg="#f7f7fa", fg="#222", relief="ridge")
-                sf.pack(fill='x', pady=10)
-                top_row = tk.Frame(sf, bg="#f7f7fa")
-                top_row.pack(anchor='w', fill='x')
-                tk.Label(top_row, text="תשובת סטודנט:", font=("Arial", 11, "bold"), bg="#f7f7fa", fg="#222").pack(side='left')
-                btn_img = tk.Button(top_row, text="הצג תמונה", font=("Arial", 10), bg="#e0e7ff", fg="#222", command=lambda i=idx: show_image_window(self.students[i][1], name))
-                btn_img.pack(side='left', padx=8)
-                st = scrolledtext.ScrolledText(sf, width=90, height=6, font=("Consolas", 10), bg="#fff", fg="#222", wrap='word')
-                st.insert(tk.END, ocr_text)
-                st.config(state='disabled')
-                st.pack(pady=(0,8), fill='both', expand=True)
-                # טבלת ציונים
-                table = tk.Frame(sf, bg="#f7f7fa")
-                table.pack(pady=5)
-                for i, (param, _) in enumerate(PARAMETERS):
-                    tk.Label(table, text=param, borderwidth=1, relief="solid", width=14, font=("Arial", 9, "bold"), bg="#e0e7ff", fg="#222").grid(row=0, column=i)
-                tk.Label(table, text="Final Score", borderwidth=1, relief="solid", width=14, font=("Arial", 9, "bold"), bg="#e0e7ff", fg="#222").grid(row=0, column=len(PARAMETERS))
-                tk.Label(table, text="Exam Points", borderwidth=1, relief="solid", width=14, font=("Arial", 9, "bold"), bg="#e0e7ff", fg="#222").grid(row=0, column=len(PARAMETERS)+1)
-                for i, (param, _) in enumerate(PARAMETERS):
-                    tk.Label(table, text=str(scores[param]), borderwidth=1, relief="solid", width=14, font=("Arial", 9), bg="#fff", fg="#222").grid(row=1, column=i)
-                tk.Label(table, text=str(scores["Final Score"]), borderwidth=1, relief="solid", width=14, font=("Arial", 9, "bold"), bg="#fff", fg="#000").grid(row=1, column=len(PARAMETERS))
-                tk.Label(table, text=str(scores["Exam Points"]), borderwidth=1, relief="solid", width=14, font=("Arial", 9, "bold"), bg="#fff", fg="#4f46e5").grid(row=1, column=len(PARAMETERS)+1)
+            self.build_results_table(results, show_image_window)
         tk.Button(self.frame, text="סיים", command=self.root.destroy, font=("Arial", 12), bg="#e0e7ff", fg="#222", relief="raised").pack(pady=15, fill='x')
 
+    def build_results_table(self, results, show_image_window):
+        """
+        One Treeview row per student; rows are items, not widgets, so large cohorts stay fast.
+        OCR text, the diff against the Gemini answer and the scan are only built for the selected row.
+        """
+        columns = ["name"] + [param for param, _ in PARAMETERS] + ["Final Score", "Exam Points"]
+        sort_state = {"column": None, "descending": False}
+
+        # סינון
+        filter_row = tk.Frame(self.frame, bg="#f7f7fa")
+        filter_row.pack(pady=(10, 5), fill='x')
+        tk.Label(filter_row, text="ציון מינימלי:", font=("Arial", 11), bg="#f7f7fa", fg="#222").pack(side='left')
+        min_score = tk.StringVar(value="0")
+        tk.Spinbox(filter_row, from_=0, to=100, width=5, textvariable=min_score, font=("Arial", 11)).pack(side='left', padx=5)
+        tk.Label(filter_row, text="ציון מקסימלי:", font=("Arial", 11), bg="#f7f7fa", fg="#222").pack(side='left', padx=(10, 0))
+        max_score = tk.StringVar(value="100")
+        tk.Spinbox(filter_row, from_=0, to=100, width=5, textvariable=max_score, font=("Arial", 11)).pack(side='left', padx=5)
+        tk.Label(filter_row, text="חיפוש שם:", font=("Arial", 11), bg="#f7f7fa", fg="#222").pack(side='left', padx=(10, 0))
+        name_query = tk.StringVar()
+        tk.Entry(filter_row, width=20, textvariable=name_query, font=("Arial", 11)).pack(side='left', padx=5)
+        count_label = tk.Label(filter_row, font=("Arial", 11), bg="#f7f7fa", fg="#4f46e5")
+        count_label.pack(side='left', padx=10)
+
+        # טבלת ציונים
+        table_frame = tk.Frame(self.frame, bg="#f7f7fa")
+        table_frame.pack(fill='both', expand=True)
+        tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=15, selectmode='browse')
+        tree_scroll = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=tree_scroll.set)
+        for column in columns:
+            tree.heading(column, text="סטודנט" if column == "name" else column, command=lambda c=column: sort_by(c))
+            tree.column(column, width=180 if column == "name" else 110, anchor='w' if column == "name" else 'center')
+        tree.pack(side='left', fill='both', expand=True)
+        tree_scroll.pack(side='right', fill='y')
+        for idx, (name, _, scores, _) in enumerate(results):
+            tree.insert('', 'end', iid=str(idx), values=[name] + [scores[column] for column in columns[1:]])
+
+        def row_value(idx, column):
+            name, _, scores, _ = results[idx]
+            return name.lower() if column == "name" else scores[column]
+
+        def refresh(*_):
+            try:
+                low, high = float(min_score.get()), float(max_score.get())
+            except ValueError:
+                return
+            query = name_query.get().strip().lower()
+            visible = [idx for idx, (name, _, scores, _) in enumerate(results)
+                       if low <= scores["Final Score"] <= high and query in name.lower()]
+            if sort_state["column"]:
+                visible.sort(key=lambda idx: row_value(idx, sort_state["column"]), reverse=sort_state["descending"])
+            # detach/move only reorders existing rows; nothing is recreated
+            shown = set(visible)
+            tree.detach(*[str(idx) for idx in range(len(results)) if idx not in shown])
+            for position, idx in enumerate(visible):
+                tree.move(str(idx), '', position)
+            count_label.config(text=f"מוצגים {len(visible)} מתוך {len(results)}")
+
+        def sort_by(column):
+            if sort_state["column"] == column:
+                sort_state["descending"] = not sort_state["descending"]
+            else:
+                # Scores start highest first, names alphabetically
+                sort_state.update(column=column, descending=column != "name")
+            refresh()
+
+        for var in (min_score, max_score, name_query):
+            var.trace_add('write', refresh)
+        refresh()
+
+        # פרטי הסטודנט הנבחר
+        details = tk.Frame(self.frame, bg="#f7f7fa")
+        details.pack(pady=10, fill='both', expand=True)
+        buttons = tk.Frame(details, bg="#f7f7fa")
+        buttons.pack(anchor='w', fill='x')
+        details_label = tk.Label(buttons, text="בחר סטודנט בטבלה", font=("Arial", 11, "bold"), bg="#f7f7fa", fg="#222")
+        details_label.pack(side='left')
+        details_text = scrolledtext.ScrolledText(details, width=90, height=12, font=("Consolas", 10), bg="#fff", fg="#222", wrap='word')
+        details_text.tag_configure('added', foreground="#15803d")
+        details_text.tag_configure('removed', foreground="#b91c1c")
+        details_text.config(state='disabled')
+        details_text.pack(pady=(4, 8), fill='both', expand=True)
+
+        def selected():
+            selection = tree.selection()
+            return int(selection[0]) if selection else None
+
+        def show_text(lines_with_tags):
+            details_text.config(state='normal')
+            details_text.delete('1.0', tk.END)
+            for line, tag in lines_with_tags:
+                details_text.insert(tk.END, line + "\n", (tag,) if tag else ())
+            details_text.config(state='disabled')
+
+        def show_ocr(*_):
+            idx = selected()
+            if idx is None:
+                return
+            name, ocr_text, _, _ = results[idx]
+            details_label.config(text=f"תשובת {name}")
+            show_text([(line, None) for line in ocr_text.splitlines()])
+
+        def show_diff():
+            idx = selected()
+            if idx is None:
+                return
+            name, ocr_text, _, _ = results[idx]
+            details_label.config(text=f"הבדלים בין Gemini ל-{name}")
+            show_text(reference_diff(self.gemini_answer, ocr_text, name))
+
+        def show_image():
+            idx = selected()
+            if idx is not None:
+                name, _, _, image_path = results[idx]
+                show_image_window(image_path, name)
+
+        tk.Button(buttons, text="תשובת סטודנט", font=("Arial", 10), bg="#e0e7ff", fg="#222", command=show_ocr).pack(side='left', padx=8)
+        tk.Button(buttons, text="השוואה ל-Gemini", font=("Arial", 10), bg="#e0e7ff", fg="#222", command=show_diff).pack(side='left', padx=8)
+        tk.Button(buttons, text="הצג תמונה", font=("Arial", 10), bg="#e0e7ff", fg="#222", command=show_image).pack(side='left', padx=8)
+        tree.bind('<<TreeviewSelect>>', show_ocr)
+        tree.bind('<Double-1>', lambda e: show_image())
+
+
 if __name__ == "__main__":
+    configure_logging()
     # Uncomment the next line to test the grading function
     # test_grading()
     
+    try:
+        import_gui()
+    except ImportError:
+        print("The GUI requires tkinter; use batch_grader.py for headless grading.")
+        sys.exit(1)
     root = tk.Tk()
+    missing = check_dependencies()
+    if missing:
+        root.withdraw()
+        messagebox.showerror("Missing Modules", missing_message(missing))
+        sys.exit(1)
     app = ExamGraderApp(root)
-    root.mainloop() 
\ No newline at end of file
+    root.mainloop()
+    app.close_prefetch() 
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Execution-based correctness for Python answers (differential testing).
+
+The reference solution's function is run on generated sample inputs once per question, and each
+OCR-repaired student answer is run on the same inputs. Every run happens in its own sandbox
+process (sandbox_worker.py) with CPU-time, memory and wall-clock limits, so an infinite loop or
+a runaway allocation only costs that answer its sandbox. An answer whose function gives the
+reference's return value and printed output for every input gets correctness 100 without a
+Gemini correctness request (its rubric is still evaluated). Anything else - a mismatch, a
+crash, code that OCR left unparseable, or a reference that can't be run - is left undecided for
+Gemini to grade.
+
+    executor = DifferentialExecutor(reference_code, "Python")
+    executor.grade(student_code)   # {"decided": True, "score": 100, "passed": 8, "total": 8, ...}
+    python execution_grader.py reference.py answers/*.py   # offline check
+"""
+import os
+import re
+import sys
+import json
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from exam_grader import repair_ocr_code, extract_signature, generate_sample_inputs
+from instrumentation import get_logger, span, count
+
+log = get_logger(__name__)
+
+# ====== CONFIG ======
+# Concurrent sandboxes in the grading pipeline (0 = grade every answer with Gemini)
+EXEC_WORKERS = int(os.getenv("EXEC_WORKERS", "0"))
+EXEC_SAMPLES = int(os.getenv("EXEC_SAMPLES", "8"))  # generated inputs per question
+EXEC_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "3"))  # wall-clock seconds per sandbox
+EXEC_CPU_SECONDS = int(os.getenv("EXEC_CPU_SECONDS", "1"))
+EXEC_MEMORY_MB = int(os.getenv("EXEC_MEMORY_MB", "256"))
+# Run answers even where the sandbox can't isolate itself (no namespaces, Windows) - trusted code only
+EXEC_ALLOW_UNISOLATED = os.getenv("EXEC_ALLOW_UNISOLATED", "0") == "1"
+EXEC_SEED = 20240611  # fixed, so every run of a question uses the same inputs
+
+SUPPORTED_LANGUAGES = ("Python",)
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+_FENCE = re.compile(r"```[\w#+-]*")
+_FENCED_BLOCK = re.compile(r"```[\w#+-]*[^\n]*\n(.*?)(?:```|\Z)", re.S)
+
+# ====== SANDBOX ======
+def _sandbox_env():
+    env = {"PYTHONHASHSEED": "0", "PYTHONIOENCODING": "utf-8"}
+    if "SYSTEMROOT" in os.environ:
+        env["SYSTEMROOT"] = os.environ["SYSTEMROOT"]  # needed by the Windows interpreter
+    return env
+
+def run_sandboxed(code, function, inputs, arity=None, timeout=EXEC_TIMEOUT):
+    """
+    Runs function from code on each argument list in inputs in a fresh sandbox process.
+    Returns the worker's reply (see sandbox_worker), or {"status": "timeout"/"limit"/"crashed", "error": ...}.
+    """
+    if arity is None:
+        arity = len(inputs[0]) if inputs else 0
+    request = json.dumps({
+        "code": code, "function": function, "arity": arity, "inputs": inputs,
+        "cpu_seconds": EXEC_CPU_SECONDS, "memory_mb": EXEC_MEMORY_MB, "require_isolation": not EXEC_ALLOW_UNISOLATED,
+    })
+    count("execution.sandboxes")
+    with span("execution.sandbox"), tempfile.TemporaryDirectory(prefix="sandbox-") as workdir:
+        try:
+            # -S/-s: no site-packages, the environment is replaced and the working directory is empty
+            process = subprocess.run([sys.executable, "-S", "-s", WORKER_SCRIPT], input=request, capture_output=True,
+                                     text=True, encoding='utf-8', timeout=timeout, cwd=workdir, env=_sandbox_env())
+        except subprocess.TimeoutExpired:
+            count("execution.timeouts")
+            return {"status": "timeout", "error": f"No result within {timeout:g}s"}
+    try:
+        return json.loads(process.stdout)
+    except ValueError:
+        pass
+    if process.returncode < 0:
+        count("execution.limits")
+        return {"status": "limit", "error": f"Stopped by signal {-process.returncode} (CPU/memory limit)"}
+    error = process.stderr.strip().splitlines()[-1:] or [f"exit code {process.returncode}"]
+    return {"status": "crashed", "error": error[0]}
+
+def _outputs_match(expected, actual):
+    if "error" in actual:
+        return False
+    if expected["stdout"].rstrip() != actual["stdout"].rstrip():
+        return False
+    return _values_match(expected["value"], actual["value"])
+
+def _values_match(expected, actual):
+    if isinstance(expected, float) or isinstance(actual, float):
+        if isinstance(expected, (int, float)) and isinstance(actual, (int, float)) and not isinstance(expected, bool) and not isinstance(actual, bool):
+            return abs(expected - actual) <= 1e-9 * max(1.0, abs(expected))
+        return False
+    if isinstance(expected, list) and isinstance(actual, list):
+        return len(expected) == len(actual) and all(_values_match(e, a) for e, a in zip(expected, actual))
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return expected.keys() == actual.keys() and all(_values_match(expected[k], actual[k]) for k in expected)
+    return type(expected) is type(actual) and expected == actual
+
+def strip_fences(code):
+    """The first fenced code block of a reply (explanation text around it dropped), else the whole text"""
+    code = code or ""
+    block = _FENCED_BLOCK.search(code)
+    return block.group(1) if block else _FENCE.sub("", code)
+
+# ====== DIFFERENTIAL EXECUTION ======
+class DifferentialExecutor:
+    """
+    Grades answers to one question against its reference solution; thread-safe.
+    The reference runs once, when the first answer is graded.
+    """
+    def __init__(self, reference_code, language, samples=EXEC_SAMPLES, seed=EXEC_SEED):
+        self.reference_code = strip_fences(reference_code)
+        self.language = language
+        self.samples = samples
+        self.seed = seed
+        self._reference = None
+        self._reference_lock = threading.Lock()
+
+    @staticmethod
+    def supports(language):
+        return language in SUPPORTED_LANGUAGES
+
+    def reference(self):
+        """(function name, arity, [(inputs, expected output)]) or None if the reference can't be run"""
+        with self._reference_lock:
+            if self._reference is None:
+                self._reference = self._run_reference() or False
+            return self._reference or None
+
+    def _run_reference(self):
+        function, params = extract_signature(self.reference_code)
+        if not function:
+            log.info("Reference solution has no Python function to execute")
+            return None
+        inputs = [list(args) for args in generate_sample_inputs(params, self.samples, random.Random(self.seed))]
+        reply = run_sandboxed(self.reference_code, function, inputs, arity=len(params))
+        if reply["status"] == "isolation_error":
+            log.warning("Execution grading is off for this question: %s", reply["error"])
+            return None
+        if reply["status"] != "ok":
+            log.info("Reference solution could not be executed (%s): %s", reply["status"], reply.get("error"))
+            return None
+        cases = [(args, output) for args, output in zip(inputs, reply["results"]) if "error" not in output]
+        if not cases:
+            log.info("Reference solution failed on every generated input")
+            return None
+        return reply["function"], len(params), cases
+
+    def grade(self, student_code):
+        """
+        {"decided": bool, "score": 0-100 or None, "passed": int, "total": int, "reason": str}
+        Only an answer that matches the reference on every input is decided.
+        """
+        if not self.supports(self.language):
+            return _undecided(f"execution grading supports {', '.join(SUPPORTED_LANGUAGES)} only")
+        reference = self.reference()
+        if reference is None:
+            return _undecided("the reference solution can't be executed")
+        function, arity, cases = reference
+        reply = run_sandboxed(repair_ocr_code(strip_fences(student_code)), function, [args for args, _ in cases], arity=arity)
+        if reply["status"] != "ok":
+            count("execution.undecided")
+            return _undecided(f"{reply['status']}: {reply.get('error', '')}".strip(": "))
+        passed = sum(1 for (_, expected), actual in zip(cases, reply["results"]) if _outputs_match(expected, actual))
+        outcome = {"decided": passed == len(cases), "score": round(100 * passed / len(cases)), "passed": passed,
+                   "total": len(cases), "reason": f"{passed}/{len(cases)} generated inputs match the reference solution"}
+        count("execution.decided" if outcome["decided"] else "execution.undecided")
+        return outcome
+
+def _undecided(reason):
+    return {"decided": False, "score": None, "passed": 0, "total": 0, "reason": reason}
+
+def execution_grading(outcome):
+    """(correctness, feedback) for an answer the executor decided, in the evaluators' format"""
+    feedback = {
+        "Explanation": f"Graded by sandboxed execution: {outcome['reason']}.",
+        "Corrected Code": "NO CORRECTION NEEDED"
+    }
+    return outcome["score"], feedback
+
+# ====== CLI ======
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run Python answers against a reference solution in sandboxes.")
+    parser.add_argument("reference", help="File with the reference solution")
+    parser.add_argument("answers", nargs="+", help="Answer files (e.g. saved OCR text)")
+    parser.add_argument("--samples", type=int, default=EXEC_SAMPLES, help="Generated inputs per question")
+    args = parser.parse_args(argv)
+    with open(args.reference, encoding='utf-8') as f:
+        executor = DifferentialExecutor(f.read(), "Python", samples=args.samples)
+    for path in args.answers:
+        with open(path, encoding='utf-8') as f:
+            outcome = executor.grade(f.read())
+        verdict = f"{outcome['score']:>3}" if outcome["decided"] else "  ?"
+        print(f"{verdict}  {outcome['reason']}  {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
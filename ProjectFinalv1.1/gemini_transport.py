@@ -0,0 +1,182 @@
+"""
+HTTP transport for Gemini requests.
+
+One pooled requests.Session is shared by every grading worker, with:
+- connect/read timeouts
+- retries with exponential backoff + jitter on 429/5xx and network errors (honours Retry-After)
+- token-bucket limits for requests-per-minute and tokens-per-minute quotas
+"""
+import os
+import time
+import random
+import threading
+import email.utils
+from instrumentation import get_logger, span, count
+
+log = get_logger(__name__)
+
+# ====== CONFIG ======
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "10"))
+GEMINI_READ_TIMEOUT = float(os.getenv("GEMINI_READ_TIMEOUT", "120"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "0"))  # requests per minute, 0 = unlimited
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "0"))  # tokens per minute, 0 = unlimited
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "32"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+class GeminiError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class GeminiReplyError(GeminiError):
+    """The request succeeded but the reply has no usable candidate text"""
+
+class TokenBucket:
+    """
+    Allows rate_per_minute units per minute with bursts up to capacity.
+    acquire() blocks until enough units are available; adjust() corrects an earlier estimate.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, delta):
+        # Positive delta = more was used than acquired; the bucket may go into debt
+        with self.lock:
+            self._refill()
+            self.tokens -= delta
+
+def estimate_tokens(text):
+    # Rough Gemini estimate: ~4 characters per token
+    return max(1, len(text) // 4)
+
+class GeminiTransport:
+    def __init__(self, api_key, connect_timeout=GEMINI_CONNECT_TIMEOUT, read_timeout=GEMINI_READ_TIMEOUT,
+                 max_retries=GEMINI_MAX_RETRIES, requests_per_minute=GEMINI_RPM, tokens_per_minute=GEMINI_TPM,
+                 pool_size=GEMINI_POOL_SIZE):
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        import requests  # deferred: only needed once a request is actually made
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, url, payload, prompt_tokens=0):
+        """
+        POSTs payload as JSON and returns the decoded reply.
+        Raises GeminiError when the request still fails after all retries or can't be sent at all
+        (e.g. an invalid URL), and GeminiReplyError when a 200 reply is not JSON.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "X-goog-api-key": self.api_key
+        }
+        import requests
+        count("gemini.requests")
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                count("gemini.retries")
+            if self.request_bucket:
+                self.request_bucket.acquire()
+            if self.token_bucket and prompt_tokens:
+                self.token_bucket.acquire(prompt_tokens)
+            retry_after = None
+            try:
+                with span("gemini.request", attempt=attempt):
+                    resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ContentDecodingError) as e:
+                # Network failures and replies cut off mid-body are retried
+                error = GeminiError(f"{type(e).__name__}: {e}")
+            except requests.RequestException as e:
+                # A bad URL or header: retrying can't help
+                count("gemini.errors")
+                raise GeminiError(f"{type(e).__name__}: {e}") from e
+            else:
+                if resp.status_code == 200:
+                    try:
+                        reply = resp.json()
+                    except ValueError:
+                        # An HTML error page or a body cut off by a proxy
+                        count("gemini.errors")
+                        raise GeminiReplyError(f"Gemini reply is not JSON: {resp.text[:200]!r}")
+                    self._record_usage(reply, prompt_tokens)
+                    return reply
+                count(f"gemini.http_{resp.status_code}")
+                error = GeminiError(f"{resp.status_code} {resp.text}", resp.status_code)
+                if resp.status_code not in RETRY_STATUS_CODES:
+                    count("gemini.errors")
+                    raise error
+                retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if attempt == self.max_retries:
+                count("gemini.errors")
+                raise error
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            log.info("Gemini request failed (%s), retrying in %.1fs", error, delay)
+            time.sleep(delay)
+
+    def _record_usage(self, reply, prompt_tokens):
+        usage = reply.get("usageMetadata") or {}
+        count("gemini.tokens_in", usage.get("promptTokenCount", prompt_tokens))
+        count("gemini.tokens_out", usage.get("candidatesTokenCount", 0))
+        # Replace the prompt estimate with the real token count (including the output)
+        total = usage.get("totalTokenCount")
+        if self.token_bucket and total is not None:
+            self.token_bucket.adjust(total - prompt_tokens)
+
+def backoff_delay(attempt):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def parse_retry_after(value):
+    """Retry-After is either a number of seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_gemini_transport(api_key):
+    """Shared transport, so every worker thread uses the same connection pool and rate limits"""
+    global _transport
+    with _transport_lock:
+        if _transport is None or _transport.api_key != api_key:
+            _transport = GeminiTransport(api_key)
+        return _transport
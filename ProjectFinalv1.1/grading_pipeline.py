@@ -0,0 +1,480 @@
+"""
+Concurrent grading pipeline.
+
+Each student goes through three stages:
+    OCR -> (correctness evaluation + rubric evaluation, in parallel) -> combined scores
+In "structured" grading mode the two evaluations are a single request on the correctness pool,
+and in "batched" mode OCR'd answers are grouped into batches of batch_size per request.
+Every stage has its own thread pool, so a slow Gemini call never blocks the OCR of the
+next scan. With ocr_batch_size > 1, scans are OCR'd in groups through one
+batch_annotate_images request each. Students with "pages" (multi-page PDF/TIFF answers, see
+document_ingestion) are OCR'd page by page in one OCR worker. A student with an "ocr_future"
+(a Future of its OCR text, e.g. prefetched while the teacher was still adding students) skips
+the OCR stage and is evaluated as soon as that future completes. Results are returned in the
+same order as the input students.
+
+With preprocess_workers > 0, image decoding/preprocessing (CPU-bound, holds the GIL) runs in a
+process pool before OCR. At most queue_depth scans are in flight between preprocessing and
+OCR at any time, which caps the memory used by prepared uploads.
+
+With dedup_threshold > 0, each OCR'd answer is looked up in a MinHash/LSH index (see dedup)
+first. An answer with the same tokens as one already being graded (only whitespace, layout or
+comments differ) reuses that grade instead of making its own evaluation calls, and its result
+records "duplicate_of" and "similarity".
+
+A student may carry its own "question" ({"id", "reference_answer", "language", "question_score"}), so one
+run can grade every (student, question) pair of a multi-question exam on the same pools (see
+multi_question). Batches, duplicate matching and execution grading stay within one question.
+
+With execution_workers > 0 and Python answers, each answer is first run against the reference
+solution in sandbox processes (see execution_grader). An answer that matches the reference on every
+generated input gets its correctness locally and only needs the rubric request; answers the
+executor can't decide go to Gemini as usual.
+
+Setting the cancel event passed to run() stops the remaining work: any stage that hasn't started
+yet fails its student with GradingCancelled, while requests already in flight are left to finish.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from exam_grader import (
+    GRADING_MODES, DEFAULT_GRADING_MODE, DEFAULT_BATCH_SIZE,
+    get_ocr_text, get_ocr_texts, get_pages_ocr_text, evaluate_correctness, evaluate_rubric, evaluate_structured, grade_batch, combine_scores, exam_points
+)
+from dedup import DuplicateIndex, DEDUP_THRESHOLD
+from execution_grader import DifferentialExecutor, execution_grading, EXEC_WORKERS
+from instrumentation import get_logger, count
+from image_text_viewer import (
+    get_ocr_backend, ocr_annotate, ocr_batch_annotate, lookup_cached_ocr, store_cached_ocr, prepare_upload_from_path, record_upload_stats
+)
+
+DEFAULT_OCR_WORKERS = 4
+DEFAULT_CORRECTNESS_WORKERS = 4
+DEFAULT_RUBRIC_WORKERS = 4
+DEFAULT_OCR_BATCH_SIZE = 1
+DEFAULT_PREPROCESS_WORKERS = 0
+
+log = get_logger(__name__)
+
+class GradingCancelled(Exception):
+    """Recorded as the error of students that were not graded because the run was cancelled"""
+
+def _cancellable(cancel, fn):
+    # Checked when the task starts running, so queued work is dropped right after cancel is set
+    def run(*args):
+        if cancel is not None and cancel.is_set():
+            raise GradingCancelled("Grading was cancelled")
+        return fn(*args)
+    return run
+
+class _StudentJob:
+    """Tracks one student's progress through the stages"""
+    def __init__(self, index, student):
+        self.index = index
+        self.student = student
+        self.ocr_text = ""
+        self.correctness = None
+        self.rubric = None
+        self.feedback = None
+        self.pending = 2  # correctness + rubric
+        self.duplicate_of = None  # (leader job, similarity) when the grade is reused
+        self.followers = []  # duplicate jobs waiting for this job's grade
+        self.question = None  # _Question this answer is graded against
+        self.finished = False
+        self.failed = False
+        self.lock = threading.Lock()
+
+class _Question:
+    """Per-question state of a run, shared by every student answering that question"""
+    def __init__(self, reference_answer, language, question_score):
+        self.reference_answer = reference_answer
+        self.language = language
+        self.question_score = question_score
+        self.size = 0
+        self.duplicates = None
+        self.executor = None
+        self.batcher = None
+
+class _Batcher:
+    """
+    Groups items into lists of up to size and passes each full list to flush.
+    The last, partial list is flushed once all expected items have arrived.
+    add(None) accounts for an item that dropped out (e.g. failed in an earlier stage).
+    """
+    def __init__(self, size, expected, flush):
+        self.size = size
+        self.remaining = expected
+        self.flush = flush
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def add(self, item):
+        with self.lock:
+            if item is not None:
+                self.pending.append(item)
+            self.remaining -= 1
+            if not self.pending or (len(self.pending) < self.size and self.remaining > 0):
+                return
+            batch = self.pending[:]
+            self.pending.clear()
+        self.flush(batch)
+
+def _annotate_upload(cache_key, content):
+    result = ocr_annotate(get_ocr_backend(), content)
+    store_cached_ocr(cache_key, result)
+    return result[0]
+
+def _annotate_uploads(uploads):
+    # uploads: list of (cache key, content); failed images come back as Exception instances
+    results = ocr_batch_annotate(get_ocr_backend(), [content for _, content in uploads])
+    texts = []
+    for (cache_key, _), result in zip(uploads, results):
+        if isinstance(result, Exception):
+            texts.append(result)
+            continue
+        store_cached_ocr(cache_key, result)
+        texts.append(result[0])
+    return texts
+
+class GradingPipeline:
+    def __init__(self, ocr_workers=DEFAULT_OCR_WORKERS, correctness_workers=DEFAULT_CORRECTNESS_WORKERS, rubric_workers=DEFAULT_RUBRIC_WORKERS,
+                 grading_mode=DEFAULT_GRADING_MODE, batch_size=DEFAULT_BATCH_SIZE, ocr_batch_size=DEFAULT_OCR_BATCH_SIZE,
+                 preprocess_workers=DEFAULT_PREPROCESS_WORKERS, queue_depth=None, dedup_threshold=DEDUP_THRESHOLD, execution_workers=EXEC_WORKERS):
+        if grading_mode not in GRADING_MODES:
+            raise ValueError(f"Unknown grading mode: {grading_mode}")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if ocr_batch_size < 1:
+            raise ValueError("ocr_batch_size must be at least 1")
+        if preprocess_workers < 0:
+            raise ValueError("preprocess_workers can't be negative")
+        if not 0 <= dedup_threshold <= 1:
+            raise ValueError("dedup_threshold must be between 0 and 1")
+        if execution_workers < 0:
+            raise ValueError("execution_workers can't be negative")
+        for name, value in (("ocr_workers", ocr_workers), ("correctness_workers", correctness_workers), ("rubric_workers", rubric_workers)):
+            if value < 1:
+                raise ValueError(f"{name} must be at least 1")
+        if queue_depth is None:
+            queue_depth = 2 * preprocess_workers + ocr_workers * ocr_batch_size
+        # A partial OCR batch holds its slots until it fills up, so the queue must fit one batch
+        if queue_depth < ocr_batch_size:
+            raise ValueError("queue_depth must be at least ocr_batch_size")
+        self.ocr_workers = ocr_workers
+        self.correctness_workers = correctness_workers
+        self.rubric_workers = rubric_workers
+        self.grading_mode = grading_mode
+        self.batch_size = batch_size
+        self.ocr_batch_size = ocr_batch_size
+        self.preprocess_workers = preprocess_workers
+        self.queue_depth = queue_depth
+        self.dedup_threshold = dedup_threshold
+        self.execution_workers = execution_workers
+
+    def run(self, students, reference_answer, language, question_score, on_result=None, cancel=None):
+        """
+        Grades all students and returns a list of result dicts in input order.
+        on_result(index, result) is called from a worker thread as soon as each student finishes;
+        an exception it raises is logged and doesn't stop the run.
+        A failure in any stage is recorded in the student's "error" field.
+        A student's "question" overrides reference_answer, language and question_score for that student.
+        cancel is an optional threading.Event; once set, students not yet graded finish with GradingCancelled.
+        """
+        results = [None] * len(students)
+        if not students:
+            return results
+        remaining = [len(students)]
+        remaining_lock = threading.Lock()
+        all_done = threading.Event()
+        upload_slots = threading.BoundedSemaphore(self.queue_depth)
+
+        def finish(job, scores=None, error=None):
+            result = {"name": job.student["name"], "image_path": job.student["image_path"], "ocr_text": job.ocr_text, "scores": scores}
+            if job.feedback is not None:
+                result["feedback"] = job.feedback
+            if job.duplicate_of is not None and error is None:
+                leader, similarity = job.duplicate_of
+                result["duplicate_of"] = leader.student["name"]
+                result["similarity"] = round(similarity, 3)
+            if error is not None:
+                result["error"] = str(error)
+                if isinstance(error, GradingCancelled):
+                    result["cancelled"] = True
+            results[job.index] = result
+            try:
+                if on_result:
+                    try:
+                        on_result(job.index, result)
+                    except Exception:
+                        # e.g. the job store couldn't save the result; the run itself must still complete
+                        log.exception("on_result failed for %s", job.student["name"])
+                with job.lock:
+                    job.finished = True
+                    job.failed = error is not None
+                    followers, job.followers = job.followers, []
+                release_followers(job, followers)
+            finally:
+                with remaining_lock:
+                    remaining[0] -= 1
+                    if remaining[0] == 0:
+                        all_done.set()
+
+        # ---- duplicate reuse ----
+        def follow(job, leader, similarity):
+            """Makes job reuse leader's grade; False if the leader failed and job must be graded itself"""
+            with leader.lock:
+                if leader.finished and leader.failed:
+                    return False
+                job.duplicate_of = (leader, similarity)
+                if not leader.finished:
+                    leader.followers.append(job)
+                    return True
+            reuse_grade(job, leader)
+            return True
+
+        def reuse_grade(job, leader):
+            count("dedup.reused")
+            job.correctness, job.rubric, job.feedback = leader.correctness, leader.rubric, leader.feedback
+            score_student(job)
+
+        def release_followers(leader, followers):
+            if not followers:
+                return
+            if not leader.failed:
+                for job in followers:
+                    reuse_grade(job, leader)
+                return
+            # The leader's grading failed: stop matching against it; the first follower becomes the new leader
+            leader.question.duplicates.remove(leader.index)
+            for job in followers:
+                job.duplicate_of = None
+                grade_or_reuse(job, batched=False)
+
+        def grade_or_reuse(job, batched=True):
+            """Evaluates job, or attaches it to a duplicate's grade (returns True then)"""
+            if job.question.duplicates is not None:
+                match = job.question.duplicates.match_or_add(job.index, job.ocr_text)
+                if match is not None and follow(job, jobs_by_index[match[0]], match[1]):
+                    return True
+            evaluate(job, batched)
+            return False
+
+        # ---- evaluation ----
+        def after_evaluation(job, field, future):
+            with job.lock:
+                if job.pending == 0:
+                    return  # the other evaluation already failed and finished this student
+                error = future.exception()
+                if error is not None:
+                    job.pending = 0
+                else:
+                    setattr(job, field, future.result())
+                    job.pending -= 1
+                if error is None and job.pending > 0:
+                    return
+            if error is not None:
+                finish(job, error=error)
+                return
+            score_student(job)
+
+        def after_structured_evaluation(job, future):
+            error = future.exception()
+            if error is not None:
+                finish(job, error=error)
+                return
+            job.correctness, job.rubric, job.feedback = future.result()
+            score_student(job)
+
+        def score_student(job):
+            try:
+                scores = combine_scores(job.correctness, job.rubric)
+                scores["Exam Points"] = exam_points(scores["Final Score"], job.question.question_score)
+            except Exception as e:
+                finish(job, error=e)
+                return
+            finish(job, scores)
+
+        def after_batch_evaluation(jobs, future):
+            error = future.exception()
+            for i, job in enumerate(jobs):
+                if error is not None:
+                    finish(job, error=error)
+                    continue
+                job.correctness, job.rubric, job.feedback = future.result()[i]
+                score_student(job)
+
+        def submit_batch_evaluation(jobs):
+            question = jobs[0].question
+            batch_future = correctness_pool.submit(_cancellable(cancel, grade_batch), [job.ocr_text for job in jobs], question.reference_answer, question.language, self.batch_size)
+            batch_future.add_done_callback(lambda f: after_batch_evaluation(jobs, f))
+
+        def evaluate(job, batched=True):
+            if job.question.executor is not None:
+                execution_future = execution_pool.submit(_cancellable(cancel, job.question.executor.grade), job.ocr_text)
+                execution_future.add_done_callback(lambda f: after_execution(job, batched, f))
+                return
+            evaluate_with_gemini(job, batched)
+
+        def after_execution(job, batched, future):
+            error = future.exception()
+            decided = error is None and future.result()["decided"]
+            if not decided and not isinstance(error, GradingCancelled):
+                if error is not None:
+                    log.warning("Execution grading failed for %s: %s", job.student["name"], error)
+                evaluate_with_gemini(job, batched)
+                return
+            if job.question.batcher and batched:
+                job.question.batcher.add(None)
+            if error is not None:
+                finish(job, error=error)
+                return
+            # Execution decides correctness only; the rubric is still evaluated as usual
+            job.correctness, job.feedback = execution_grading(future.result())
+            job.pending = 1
+            rubric_future = rubric_pool.submit(_cancellable(cancel, evaluate_rubric), job.ocr_text, job.question.language)
+            rubric_future.add_done_callback(lambda f: after_evaluation(job, "rubric", f))
+
+        def evaluate_with_gemini(job, batched=True):
+            question = job.question
+            if question.batcher and batched:
+                question.batcher.add(job)
+                return
+            if self.grading_mode in ("structured", "batched"):
+                evaluation_future = correctness_pool.submit(_cancellable(cancel, evaluate_structured), job.ocr_text, question.reference_answer, question.language)
+                evaluation_future.add_done_callback(lambda f: after_structured_evaluation(job, f))
+                return
+            correctness_future = correctness_pool.submit(_cancellable(cancel, evaluate_correctness), job.ocr_text, question.reference_answer, question.language)
+            correctness_future.add_done_callback(lambda f: after_evaluation(job, "correctness", f))
+            rubric_future = rubric_pool.submit(_cancellable(cancel, evaluate_rubric), job.ocr_text, question.language)
+            rubric_future.add_done_callback(lambda f: after_evaluation(job, "rubric", f))
+
+        # ---- OCR ----
+        def ocr_done(job, ocr_text, error):
+            if error is not None:
+                finish(job, error=error)
+                if job.question.batcher:
+                    job.question.batcher.add(None)
+                return
+            job.ocr_text = ocr_text
+            if grade_or_reuse(job) and job.question.batcher:
+                job.question.batcher.add(None)
+
+        def after_ocr(job, future):
+            error = future.exception()
+            ocr_done(job, None if error is not None else future.result(), error)
+
+        def after_ocr_batch(jobs, future, release_slots=False):
+            error = future.exception()
+            texts = future.result() if error is None else [error] * len(jobs)
+            for job, text in zip(jobs, texts):
+                if release_slots:
+                    upload_slots.release()
+                if isinstance(text, Exception):
+                    ocr_done(job, None, text)
+                else:
+                    ocr_done(job, text, None)
+
+        # ---- preprocessing in the process pool (preprocess_workers > 0) ----
+        def submit_upload_batch(uploads):
+            jobs = [job for job, _, _ in uploads]
+            ocr_future = ocr_pool.submit(_cancellable(cancel, _annotate_uploads), [(key, content) for _, key, content in uploads])
+            ocr_future.add_done_callback(lambda f: after_ocr_batch(jobs, f, release_slots=True))
+
+        image_count = sum(1 for student in students if not student.get("pages") and student.get("ocr_future") is None)
+        upload_batcher = _Batcher(self.ocr_batch_size, image_count, submit_upload_batch) if self.ocr_batch_size > 1 else None
+
+        def upload_failed(job, error):
+            upload_slots.release()
+            if upload_batcher:
+                upload_batcher.add(None)
+            ocr_done(job, None, error)
+
+        def after_upload(job, future):
+            upload_slots.release()
+            after_ocr(job, future)
+
+        def after_preprocess(job, cache_key, future):
+            error = future.exception()
+            if error is not None:
+                upload_failed(job, error)
+                return
+            content, stats = future.result()
+            record_upload_stats(stats)
+            if upload_batcher:
+                upload_batcher.add((job, cache_key, content))
+                return
+            ocr_future = ocr_pool.submit(_cancellable(cancel, _annotate_upload), cache_key, content)
+            ocr_future.add_done_callback(lambda f: after_upload(job, f))
+
+        def start_preprocessed(job):
+            upload_slots.acquire()  # blocks while queue_depth scans are already in flight
+            if cancel is not None and cancel.is_set():
+                upload_failed(job, GradingCancelled("Grading was cancelled"))
+                return
+            try:
+                cache_key, cached = lookup_cached_ocr(job.student["image_path"], preprocess=True)
+            except Exception as e:
+                upload_failed(job, e)
+                return
+            if cached is not None:
+                upload_slots.release()
+                if upload_batcher:
+                    upload_batcher.add(None)
+                ocr_done(job, cached[0], None)
+                return
+            preprocess_future = preprocess_pool.submit(prepare_upload_from_path, job.student["image_path"], True)
+            preprocess_future.add_done_callback(lambda f: after_preprocess(job, cache_key, f))
+
+        jobs_by_index = [_StudentJob(index, student) for index, student in enumerate(students)]
+        questions = {}
+        for job in jobs_by_index:
+            # Students are grouped by question id: two questions may share a reference answer and points
+            spec = job.student.get("question")
+            key = spec["id"] if spec else None
+            if key not in questions:
+                spec = spec or {}
+                questions[key] = _Question(spec.get("reference_answer", reference_answer), spec.get("language", language),
+                                           spec.get("question_score", question_score))
+            job.question = questions[key]
+            job.question.size += 1
+        for question in questions.values():
+            if self.dedup_threshold > 0:
+                question.duplicates = DuplicateIndex(self.dedup_threshold, question.language)
+            if self.execution_workers and DifferentialExecutor.supports(question.language):
+                question.executor = DifferentialExecutor(question.reference_answer, question.language)
+            if self.grading_mode == "batched":
+                question.batcher = _Batcher(self.batch_size, question.size, submit_batch_evaluation)
+        preprocess_pool = ProcessPoolExecutor(self.preprocess_workers) if self.preprocess_workers else None
+        try:
+            with ThreadPoolExecutor(self.ocr_workers, thread_name_prefix="ocr") as ocr_pool, \
+                    ThreadPoolExecutor(self.correctness_workers, thread_name_prefix="correctness") as correctness_pool, \
+                    ThreadPoolExecutor(self.rubric_workers, thread_name_prefix="rubric") as rubric_pool, \
+                    ThreadPoolExecutor(max(1, self.execution_workers), thread_name_prefix="execution") as execution_pool:
+                jobs = list(jobs_by_index)
+                for job in jobs:
+                    if job.student.get("ocr_future") is not None:
+                        job.student["ocr_future"].add_done_callback(lambda f, job=job: after_ocr(job, f))
+                jobs = [job for job in jobs if job.student.get("ocr_future") is None]
+                # Multi-page answers are streamed page by page in one OCR worker and stitched together
+                for job in jobs:
+                    if job.student.get("pages"):
+                        ocr_future = ocr_pool.submit(_cancellable(cancel, get_pages_ocr_text), job.student["pages"])
+                        ocr_future.add_done_callback(lambda f, job=job: after_ocr(job, f))
+                jobs = [job for job in jobs if not job.student.get("pages")]
+                if preprocess_pool:
+                    for job in jobs:
+                        start_preprocessed(job)
+                elif self.ocr_batch_size > 1:
+                    for start in range(0, len(jobs), self.ocr_batch_size):
+                        chunk = jobs[start:start + self.ocr_batch_size]
+                        ocr_future = ocr_pool.submit(_cancellable(cancel, get_ocr_texts), [job.student["image_path"] for job in chunk])
+                        ocr_future.add_done_callback(lambda f, chunk=chunk: after_ocr_batch(chunk, f))
+                else:
+                    for job in jobs:
+                        ocr_future = ocr_pool.submit(_cancellable(cancel, get_ocr_text), job.student["image_path"])
+                        ocr_future.add_done_callback(lambda f, job=job: after_ocr(job, f))
+                # Later stages are submitted from callbacks, so the pools must stay open until every student is done
+                all_done.wait()
+        finally:
+            if preprocess_pool:
+                preprocess_pool.shutdown()
+        return results
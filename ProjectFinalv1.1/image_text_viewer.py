@@ -1,105 +1,392 @@
 import sys
-import subprocess
 import os
-import tkinter as tk
-from tkinter import filedialog, scrolledtext, messagebox
+import threading
+import time
+import math
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Auto-install required packages if missing
-required = [
-    ("PIL", "Pillow"),
-    ("google.cloud", "google-cloud-vision"),
-    ("dotenv", "python-dotenv")
-]
-missing = []
-for mod, pkg in required:
-    try:
-        __import__(mod)
-    except ImportError:
-        missing.append(pkg)
-if missing:
-    print(f"Installing missing packages: {', '.join(missing)}")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", *missing])
-    print("Restarting script...")
-    os.execv(sys.executable, [sys.executable] + sys.argv)
-
-# Check Python version
-if sys.version_info < (3, 6):
-    tk.Tk().withdraw()
-    messagebox.showerror("Python Version Error", "Python 3.6 or higher is required.")
-    sys.exit(1)
-
-# Check for required modules
-missing_modules = []
-try:
-    from PIL import Image, ImageTk, ImageEnhance, ImageFilter
-except ImportError:
-    missing_modules.append('Pillow')
-try:
-    from google.cloud import vision
-except ImportError:
-    missing_modules.append('google-cloud-vision')
+# Heavy or GUI-only modules (google.cloud.vision, tkinter, ImageTk) are imported where they are
+# first used; check installed packages explicitly with dependencies.check_dependencies()
+from PIL import Image, ImageEnhance, ImageFilter, ImageStat
 import io
+from cache import get_ocr_cache, ocr_cache_key
+from instrumentation import get_logger, span, count, record_span, configure_logging
+from ocr_backends import OCRBackend, LocalOCRBackend, ReplayOCRBackend, RecordingOCRBackend, OCR_BACKEND, OCR_RECORD_DIR
 
-if missing_modules:
-    tk.Tk().withdraw()
-    messagebox.showerror(
-        "Missing Modules",
-        f"The following required modules are missing: {', '.join(missing_modules)}\n\nPlease install them using pip."
-    )
-    sys.exit(1)
+log = get_logger(__name__)
 
 IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif', '.webp'}
+OCR_MODE = "document_text_detection"
+# "adaptive": one OCR call chosen from image statistics; "compare": OCR both variants, keep the better
+OCR_VIEWER_MODE = os.getenv("OCR_VIEWER_MODE", "adaptive")
+
+# ====== UPLOAD PREPARATION ======
+# Long edge in pixels sent to Vision (~250 DPI for an A4 page) - enough for handwriting OCR
+OCR_TARGET_LONG_EDGE = int(os.getenv("OCR_TARGET_LONG_EDGE", "2400"))
+OCR_JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "90"))
+# Part of the OCR cache key, so changing how uploads are prepared doesn't reuse stale results
+OCR_CACHE_MODE = f"{OCR_MODE}:edge={OCR_TARGET_LONG_EDGE}:q={OCR_JPEG_QUALITY}"
+
+_upload_stats = {"images": 0, "original_bytes": 0, "upload_bytes": 0, "seconds": 0.0}
+_upload_stats_lock = threading.Lock()
+
+def get_upload_stats():
+    """Totals for all uploads prepared in this process"""
+    with _upload_stats_lock:
+        return dict(_upload_stats, bytes_saved=_upload_stats["original_bytes"] - _upload_stats["upload_bytes"])
+
+def _open_for_ocr(source, mode=None):
+    """Opens an image, using JPEG draft mode to decode at reduced size when it is larger than needed"""
+    img = Image.open(source)
+    long_edge = max(img.size)
+    if img.format == 'JPEG' and long_edge > OCR_TARGET_LONG_EDGE:
+        scale = OCR_TARGET_LONG_EDGE / long_edge
+        img.draft(mode, (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    if max(img.size) > OCR_TARGET_LONG_EDGE:
+        img.thumbnail((OCR_TARGET_LONG_EDGE, OCR_TARGET_LONG_EDGE), Image.LANCZOS)
+    return img
+
+def _smallest_encoding(img):
+    # Lossless PNG vs. high-quality JPEG: keep whichever is smaller
+    png = io.BytesIO()
+    img.save(png, format='PNG')
+    if img.mode not in ('L', 'RGB'):
+        return png.getvalue()
+    jpeg = io.BytesIO()
+    img.save(jpeg, format='JPEG', quality=OCR_JPEG_QUALITY)
+    return min(png.getvalue(), jpeg.getvalue(), key=len)
+
+def prepare_image_for_ocr(original, preprocess):
+    content, stats = _prepare_upload(original, preprocess)
+    record_upload_stats(stats)
+    return content, stats
+
+def prepare_upload_from_path(image_path, preprocess):
+    """
+    Process-pool entry point: the worker reads and prepares the image itself, so only the
+    prepared upload bytes cross the process boundary. The caller records the returned stats.
+    """
+    with io.open(image_path, 'rb') as image_file:
+        original = image_file.read()
+    return _prepare_upload(original, preprocess)
+
+def record_upload_stats(stats):
+    count("ocr.original_bytes", stats["original_bytes"])
+    count("ocr.upload_bytes", stats["upload_bytes"])
+    record_span("ocr.prepare", stats["seconds"])
+    with _upload_stats_lock:
+        _upload_stats["images"] += 1
+        _upload_stats["original_bytes"] += stats["original_bytes"]
+        _upload_stats["upload_bytes"] += stats["upload_bytes"]
+        _upload_stats["seconds"] += stats["seconds"]
+
+def _prepare_upload(original, preprocess):
+    """
+    Returns (upload bytes, stats) for an image's original bytes.
+    The image is downscaled to OCR_TARGET_LONG_EDGE and encoded in the smallest format; with
+    preprocess=True it is also converted to grayscale, contrast-enhanced and sharpened.
+    The raw variant keeps the original bytes when they are already small enough.
+    """
+    started = time.perf_counter()
+    if preprocess:
+        content = preprocess_image_for_ocr(io.BytesIO(original))
+    else:
+        header = Image.open(io.BytesIO(original))  # reads only the header
+        if header.format in ('JPEG', 'PNG') and max(header.size) <= OCR_TARGET_LONG_EDGE:
+            content = original
+        else:
+            img = _open_for_ocr(io.BytesIO(original))
+            if img.mode not in ('L', 'RGB'):
+                img = img.convert('RGB')
+            content = _smallest_encoding(img)
+            if len(content) >= len(original) and header.format in ('JPEG', 'PNG'):
+                content = original
+    stats = {
+        "original_bytes": len(original),
+        "upload_bytes": len(content),
+        "bytes_saved": len(original) - len(content),
+        "seconds": time.perf_counter() - started
+    }
+    return content, stats
 
 def preprocess_image_for_ocr(image_path):
     """
     Preprocesses an image to improve OCR results by:
+    - Downscaling to OCR resolution (JPEGs are decoded at reduced size)
     - Converting to grayscale
     - Increasing contrast
     - Sharpening the image
-    - Saving as PNG format
+    - Saving as PNG or JPEG, whichever is smaller
     """
-    img = Image.open(image_path)
-    # Convert to grayscale
-    img = img.convert('L')
+    # Convert to grayscale (during decode for JPEGs)
+    img = _open_for_ocr(image_path, mode='L').convert('L')
     # Increase contrast
     enhancer = ImageEnhance.Contrast(img)
     img = enhancer.enhance(2.0)  # 2.0 = double contrast
     # Sharpen the image
     img = img.filter(ImageFilter.SHARPEN)
     # Save to bytes
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
-    return img_bytes.getvalue()
-
-def run_google_vision_ocr(image_path, preprocess=False):
-    # Set the environment variable for authentication
-    cred_path = os.path.join(os.getcwd(), os.getenv("GOOGLE_CREDENTIALS_FILE", "google-credentials.json"))
-    if not os.path.exists(cred_path):
-        tk.Tk().withdraw()
-        messagebox.showerror(
-            "Missing Credentials",
-            f"Could not find {os.getenv('GOOGLE_CREDENTIALS_FILE', 'google-credentials.json')} in {os.getcwd()}\nPlease make sure the file exists."
-        )
-        sys.exit(1)
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = cred_path
-    client = vision.ImageAnnotatorClient()
-    
-    # Preprocess the image for better OCR if requested
-    if preprocess:
-        content = preprocess_image_for_ocr(image_path)
-    else:
-        with io.open(image_path, 'rb') as image_file:
-            content = image_file.read()
-    
-    image = vision.Image(content=content)
-    
-    # Use document_text_detection for better confidence scores
-    response = client.document_text_detection(image=image)  # type: ignore
-    
+    return _smallest_encoding(img)
+
+# ====== ADAPTIVE PREPROCESSING ======
+# Below any of these the scan is treated as faded/blurry and preprocessed before upload
+LOW_CONTRAST_STDDEV = 20        # grayscale standard deviation
+NARROW_HISTOGRAM_SPREAD = 120   # 1st-99th percentile brightness range (ink vs. paper)
+BLUR_EDGE_VARIANCE = 100        # variance of the edge-filtered image
+ADAPTIVE_CONFIDENCE_THRESHOLD = int(os.getenv("OCR_ADAPTIVE_THRESHOLD", "85"))  # percent
+STATS_MAX_SIZE = (1024, 1024)
+
+def image_statistics(image_path):
+    """Cheap local image statistics (on a downscaled grayscale copy) used to pick the OCR variant"""
+    img = Image.open(image_path)
+    img.draft('L', STATS_MAX_SIZE)  # fast reduced-size JPEG decode, no-op for other formats
+    gray = img.convert('L')
+    gray.thumbnail(STATS_MAX_SIZE)
+    contrast = ImageStat.Stat(gray).stddev[0]
+    histogram = gray.histogram()
+    total = sum(histogram)
+    low = high = None
+    seen = 0
+    for value, pixels in enumerate(histogram):
+        seen += pixels
+        if low is None and seen >= total * 0.01:
+            low = value
+        if high is None and seen >= total * 0.99:
+            high = value
+            break
+    sharpness = ImageStat.Stat(gray.filter(ImageFilter.FIND_EDGES)).var[0]
+    return {"contrast": contrast, "spread": high - low, "sharpness": sharpness}
+
+def choose_preprocessing(stats):
+    return (stats["contrast"] < LOW_CONTRAST_STDDEV
+            or stats["spread"] < NARROW_HISTOGRAM_SPREAD
+            or stats["sharpness"] < BLUR_EDGE_VARIANCE)
+
+def run_adaptive_ocr(image_path, threshold=ADAPTIVE_CONFIDENCE_THRESHOLD):
+    """
+    Single-pass OCR: picks preprocessed or raw upload from local image statistics, and only
+    OCRs the other variant when the confidence comes back below threshold (percent).
+    Returns (text, confidence_scores, accuracy, info) where info["path"] is the path taken,
+    e.g. "preprocessed" or "raw->preprocessed", and info["ocr_calls"] is 1 or 2.
+    """
+    stats = image_statistics(image_path)
+    preprocess = choose_preprocessing(stats)
+    text, confidence_scores = run_google_vision_ocr(image_path, preprocess=preprocess)
+    accuracy = calculate_ocr_accuracy(confidence_scores)
+    path = "preprocessed" if preprocess else "raw"
+    info = {"stats": stats, "path": path, "ocr_calls": 1, "preprocessed": preprocess}
+    if accuracy < threshold:
+        other_text, other_scores = run_google_vision_ocr(image_path, preprocess=not preprocess)
+        other_accuracy = calculate_ocr_accuracy(other_scores)
+        info["path"] = f"{path}->{'raw' if preprocess else 'preprocessed'}"
+        info["ocr_calls"] = 2
+        if other_accuracy > accuracy:
+            text, confidence_scores, accuracy = other_text, other_scores, other_accuracy
+            info["preprocessed"] = not preprocess
+    return text, confidence_scores, accuracy, info
+
+# ====== VISION CLIENT ======
+VISION_BATCH_LIMIT = 16  # max images per batch_annotate_images request
+
+class VisionOCRClient(OCRBackend):
+    """
+    Long-lived Google Vision client (the "vision" OCR backend). Credentials are resolved and the gRPC channel is created
+    once, on first use, and then shared by every OCR call (safe to use from several threads).
+    """
+    name = "vision"
+
+    def __init__(self, credentials_file=None):
+        self.credentials_file = credentials_file or os.getenv("GOOGLE_CREDENTIALS_FILE", "google-credentials.json")
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                cred_path = os.path.join(os.getcwd(), self.credentials_file)
+                if not os.path.exists(cred_path):
+                    raise FileNotFoundError(f"Could not find {self.credentials_file} in {os.getcwd()}\nPlease make sure the file exists.")
+                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = cred_path
+                from google.cloud import vision
+                self._client = vision.ImageAnnotatorClient()
+            return self._client
+
+    def annotate(self, content):
+        """OCR for one image's bytes. Returns (text, confidence_scores)"""
+        from google.cloud import vision
+        image = vision.Image(content=content)
+        # Use document_text_detection for better confidence scores
+        response = self.client.document_text_detection(image=image)  # type: ignore
+        if response.error.message:
+            raise RuntimeError(f"Vision API error: {response.error.message}")
+        return _parse_vision_response(response)
+
+    def batch_annotate(self, contents):
+        """
+        OCR for many images with batch_annotate_images (up to VISION_BATCH_LIMIT per request).
+        Returns a list in the same order; an image that failed is an Exception instance in the list.
+        """
+        from google.cloud import vision
+        feature = vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        results = []
+        for start in range(0, len(contents), VISION_BATCH_LIMIT):
+            requests = [
+                vision.AnnotateImageRequest(image=vision.Image(content=content), features=[feature])
+                for content in contents[start:start + VISION_BATCH_LIMIT]
+            ]
+            batch_response = self.client.batch_annotate_images(requests=requests)
+            for response in batch_response.responses:
+                if response.error.message:
+                    results.append(RuntimeError(f"Vision API error: {response.error.message}"))
+                else:
+                    results.append(_parse_vision_response(response))
+        return results
+
+_vision_client = VisionOCRClient()
+
+def get_vision_client():
+    return _vision_client
+
+# ====== OCR BACKENDS ======
+_backends = {}
+_backends_lock = threading.Lock()
+
+_backend_override = None
+
+def get_ocr_backend(name=None):
+    """Shared OCR backend by name ("vision", "local" or "replay"); OCR_BACKEND (or set_ocr_backend) by default"""
+    if name is None and _backend_override is not None:
+        return _backend_override
+    name = name or OCR_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name == "vision":
+                backend = _vision_client
+            elif name == "local":
+                backend = LocalOCRBackend()
+            elif name == "replay":
+                backend = ReplayOCRBackend()
+            else:
+                raise ValueError(f"Unknown OCR backend: {name}")
+            if OCR_RECORD_DIR and name == OCR_BACKEND and name != "replay":
+                backend = RecordingOCRBackend(backend, OCR_RECORD_DIR)
+            _backends[name] = backend
+        return _backends[name]
+
+def set_ocr_backend(backend):
+    """Replaces the default OCR backend (e.g. with a replay backend for benchmarks); None restores OCR_BACKEND"""
+    global _backend_override
+    _backend_override = backend
+
+def ocr_annotate(backend, content):
+    """backend.annotate with a span and upload counters - every OCR call site goes through here"""
+    count("ocr.requests")
+    count(f"ocr.{backend.name}_images")
+    count("ocr.bytes_uploaded", len(content))
+    with span(f"ocr.{backend.name}", upload_bytes=len(content)):
+        return backend.annotate(content)
+
+def ocr_batch_annotate(backend, contents):
+    count("ocr.requests")
+    count(f"ocr.{backend.name}_images", len(contents))
+    count("ocr.bytes_uploaded", sum(len(content) for content in contents))
+    with span(f"ocr.{backend.name}_batch", images=len(contents)):
+        return backend.batch_annotate(contents)
+
+def ocr_cache_mode(backend):
+    # Vision keeps the plain mode, so existing cache entries stay valid
+    if backend.name == "vision":
+        return OCR_CACHE_MODE
+    return f"{OCR_CACHE_MODE}:backend={backend.name}"
+
+def run_google_vision_ocr(image_path, preprocess=False, use_cache=True, backend=None):
+    """
+    Returns (text, word confidence scores) for an image, from the given OCR backend
+    (get_ocr_backend() by default - Google Vision unless OCR_BACKEND says otherwise).
+    Results are cached on disk by image content, so re-running an exam makes no OCR calls.
+    """
+    backend = backend or get_ocr_backend()
+    with io.open(image_path, 'rb') as image_file:
+        original = image_file.read()
+    cache = get_ocr_cache() if use_cache else None
+    if cache:
+        key = ocr_cache_key(original, preprocess, ocr_cache_mode(backend))
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["text"], cached["confidence_scores"]
+    content, _ = prepare_image_for_ocr(original, preprocess)
+    text, confidence_scores = ocr_annotate(backend, content)
+    if cache:
+        cache.set(key, {"text": text, "confidence_scores": confidence_scores})
+    return text, confidence_scores
+
+def run_google_vision_ocr_batch(image_paths, preprocess=False, use_cache=True, backend=None):
+    """
+    Batch variant of run_google_vision_ocr: cached images are served from the cache and the
+    rest are sent together in batch_annotate_images requests.
+    Returns a list of (text, confidence_scores) - or an Exception instance for a failed image.
+    """
+    backend = backend or get_ocr_backend()
+    cache = get_ocr_cache() if use_cache else None
+    results = [None] * len(image_paths)
+    pending = []  # (index, cache key, content)
+    for i, image_path in enumerate(image_paths):
+        try:
+            with io.open(image_path, 'rb') as image_file:
+                original = image_file.read()
+            key = ocr_cache_key(original, preprocess, ocr_cache_mode(backend))
+            cached = cache.get(key) if cache else None
+            if cached is not None:
+                results[i] = (cached["text"], cached["confidence_scores"])
+                continue
+            content, _ = prepare_image_for_ocr(original, preprocess)
+        except Exception as e:
+            results[i] = e
+            continue
+        pending.append((i, key, content))
+    if pending:
+        annotations = ocr_batch_annotate(backend, [content for _, _, content in pending])
+        for (i, key, _), annotation in zip(pending, annotations):
+            results[i] = annotation
+            if cache and not isinstance(annotation, Exception):
+                text, confidence_scores = annotation
+                cache.set(key, {"text": text, "confidence_scores": confidence_scores})
+    return results
+
+def lookup_cached_ocr(image_path, preprocess=False, backend=None):
+    """Returns (cache key, cached (text, confidence_scores) or None) for an image file"""
+    with io.open(image_path, 'rb') as image_file:
+        key = ocr_cache_key(image_file.read(), preprocess, ocr_cache_mode(backend or get_ocr_backend()))
+    cache = get_ocr_cache()
+    cached = cache.get(key) if cache else None
+    if cached is None:
+        return key, None
+    return key, (cached["text"], cached["confidence_scores"])
+
+def store_cached_ocr(key, result):
+    cache = get_ocr_cache()
+    if cache:
+        text, confidence_scores = result
+        cache.set(key, {"text": text, "confidence_scores": confidence_scores})
+
+def invalidate_ocr_cache(image_path=None, backend=None):
+    """Drops cached OCR results for one image (both preprocessing variants), or the whole cache"""
+    cache = get_ocr_cache()
+    if not cache:
+        return
+    if image_path is None:
+        cache.clear()
+        return
+    with io.open(image_path, 'rb') as image_file:
+        original = image_file.read()
+    for preprocess in (True, False):
+        cache.invalidate(ocr_cache_key(original, preprocess, ocr_cache_mode(backend or get_ocr_backend())))
+
+def _parse_vision_response(response):
     full_text_annotation = response.full_text_annotation
     texts = response.text_annotations
     
@@ -116,9 +403,8 @@ def run_google_vision_ocr(image_path, preprocess=False):
                             confidence = word.confidence
                             if confidence is not None:
                                 confidence_scores.append(confidence)
-                                print(f"Word confidence: {confidence}")
         except Exception as e:
-            print(f"Error extracting confidence scores: {e}")
+            log.warning("Error extracting confidence scores: %s", e)
         
         # If no confidence scores found, estimate based on text quality
         if not confidence_scores:
@@ -132,12 +418,9 @@ def run_google_vision_ocr(image_path, preprocess=False):
                     # Estimate confidence between 70-95% based on diversity and length
                     estimated_confidence = 70 + (diversity_ratio * 25)
                     confidence_scores = [estimated_confidence / 100]
-                    print(f"Estimated confidence: {estimated_confidence}%")
-        
-        print(f"Total confidence scores found: {len(confidence_scores)}")
-        if confidence_scores:
-            print(f"Sample confidence scores: {confidence_scores[:5]}")
+                    log.debug("Estimated confidence: %.1f%%", estimated_confidence)
         
+        log.debug("Confidence scores found: %d", len(confidence_scores))
         return texts[0].description, confidence_scores
     return '', []
 
@@ -151,14 +434,13 @@ def calculate_ocr_accuracy(confidence_scores):
     # Calculate average confidence and convert to percentage
     avg_conf = sum(confidence_scores) / len(confidence_scores)
     quality = int(round(avg_conf * 100))
-    
-    print(f"Confidence scores: {confidence_scores}")
-    print(f"Average confidence: {avg_conf}")
-    print(f"Quality: {quality}%")
-    
+    log.debug("OCR quality %d%% over %d words", quality, len(confidence_scores))
     return quality
 
-def show_image_and_text(image_file, ocr_text, root, preprocessed=False, accuracy=0.0):
+def show_image_and_text(image_file, ocr_text, root, preprocessed=False, accuracy=0.0, ocr_path=None):
+    import tkinter as tk
+    from tkinter import scrolledtext
+    from PIL import ImageTk
     viewer = tk.Toplevel(root)
     title = f'Image and Google Vision OCR - {os.path.basename(image_file)}'
     if preprocessed:
@@ -192,6 +474,10 @@ def show_image_and_text(image_file, ocr_text, root, preprocessed=False, accuracy
     else:
         accuracy_label.config(fg="#ef4444")  # Red for low accuracy
 
+    # Which preprocessing path produced the text
+    if ocr_path:
+        tk.Label(right_panel, text=f"OCR path: {ocr_path}", font=("Arial", 10), fg="#6b7280", anchor='w').pack(fill='x', pady=(0, 10))
+
     # Display OCR text (read-only)
     text_area = scrolledtext.ScrolledText(right_panel, width=60, height=35, font=("Consolas", 10))
     text_area.insert(tk.END, ocr_text)
@@ -207,6 +493,7 @@ def show_image_and_text(image_file, ocr_text, root, preprocessed=False, accuracy
     viewer.mainloop()
 
 def main(root):
+    from tkinter import filedialog, messagebox
     # Ask user to select an image file
     image_file = filedialog.askopenfilename(title='Select an image file', filetypes=[('Image Files', '*.png;*.jpg;*.jpeg;*.bmp;*.tiff;*.tif;*.webp')])
     if not image_file:
@@ -215,32 +502,46 @@ def main(root):
         sys.exit()
     
     try:
-        # Try OCR with preprocessing first
-        ocr_text_preprocessed, confidence_preprocessed = run_google_vision_ocr(image_file, preprocess=True)
-        accuracy_preprocessed = calculate_ocr_accuracy(confidence_preprocessed)
-        
-        # Also try without preprocessing for comparison
-        ocr_text_original, confidence_original = run_google_vision_ocr(image_file, preprocess=False)
-        accuracy_original = calculate_ocr_accuracy(confidence_original)
-        
-        # Use the result with better accuracy
-        if accuracy_preprocessed >= accuracy_original:
-            ocr_text = ocr_text_preprocessed
-            accuracy = accuracy_preprocessed
-            preprocessed = True
+        if OCR_VIEWER_MODE == "adaptive":
+            ocr_text, _, accuracy, info = run_adaptive_ocr(image_file)
+            preprocessed = info["preprocessed"]
+            ocr_path = f"{info['path']} ({info['ocr_calls']} OCR call{'s' if info['ocr_calls'] > 1 else ''})"
+            log.info("OCR path: %s", ocr_path)
         else:
-            ocr_text = ocr_text_original
-            accuracy = accuracy_original
-            preprocessed = False
-            
+            ocr_text, accuracy, preprocessed = compare_ocr_variants(image_file)
+            ocr_path = f"compare, kept {'preprocessed' if preprocessed else 'raw'} (2 OCR calls)"
     except Exception as e:
         messagebox.showerror('OCR Error', f'An error occurred during OCR:\n{e}')
         root.destroy()
         sys.exit(1)
     
-    show_image_and_text(image_file, ocr_text, root, preprocessed, accuracy)
+    show_image_and_text(image_file, ocr_text, root, preprocessed, accuracy, ocr_path)
+
+def compare_ocr_variants(image_file):
+    """Original strategy: always OCR both variants and keep the more confident one"""
+    # Try OCR with preprocessing first
+    ocr_text_preprocessed, confidence_preprocessed = run_google_vision_ocr(image_file, preprocess=True)
+    accuracy_preprocessed = calculate_ocr_accuracy(confidence_preprocessed)
+    
+    # Also try without preprocessing for comparison
+    ocr_text_original, confidence_original = run_google_vision_ocr(image_file, preprocess=False)
+    accuracy_original = calculate_ocr_accuracy(confidence_original)
+    
+    # Use the result with better accuracy
+    if accuracy_preprocessed >= accuracy_original:
+        return ocr_text_preprocessed, accuracy_preprocessed, True
+    return ocr_text_original, accuracy_original, False
 
 if __name__ == "__main__":
+    configure_logging()
+    import tkinter as tk
+    from tkinter import messagebox
+    from dependencies import check_dependencies, missing_message
     root = tk.Tk()
+    missing = check_dependencies()
+    if missing:
+        root.withdraw()
+        messagebox.showerror("Missing Modules", missing_message(missing))
+        sys.exit(1)
     root.withdraw()
     main(root) 
\ No newline at end of file
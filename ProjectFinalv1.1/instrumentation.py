@@ -0,0 +1,146 @@
+"""
+Logging, timing spans and per-run metrics.
+
+    log = get_logger(__name__)
+    with span("gemini.request"):
+        ...                          # duration recorded under "gemini.request"
+    count("gemini.tokens_in", 1200)
+    metrics_report()                 # counters, span percentiles and estimated cost
+
+Log output is controlled by LOG_LEVEL (default WARNING) through configure_logging(), which the
+entry points (GUI, batch_grader) call once. Metrics are process-wide; reset_metrics() starts a new run.
+Each span keeps exact count/total/max and a sample of at most SPAN_SAMPLE_SIZE durations for the
+percentiles, so a long-running GUI doesn't grow with every run.
+"""
+import os
+import math
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+
+# ====== CONFIG ======
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")
+# Prices used for the cost estimate in the metrics report (USD)
+GEMINI_INPUT_USD_PER_M = float(os.getenv("GEMINI_INPUT_USD_PER_M", "0.10"))    # per million input tokens
+GEMINI_OUTPUT_USD_PER_M = float(os.getenv("GEMINI_OUTPUT_USD_PER_M", "0.40"))  # per million output tokens
+VISION_USD_PER_1000 = float(os.getenv("VISION_USD_PER_1000", "1.50"))          # per 1000 images
+# Durations kept per span for percentiles; count, total and max are exact however long the process runs
+SPAN_SAMPLE_SIZE = int(os.getenv("SPAN_SAMPLE_SIZE", "2048"))
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+def configure_logging(level=None):
+    """Sets up console logging at level (LOG_LEVEL by default)"""
+    logging.basicConfig(level=(level or LOG_LEVEL).upper(), format=LOG_FORMAT)
+
+log = get_logger(__name__)
+
+# ====== METRICS ======
+_counters = {}
+_spans = {}  # name -> _SpanStats
+_metrics_lock = threading.Lock()
+
+class _SpanStats:
+    """Running count/total/max of a span's durations plus a fixed-size uniform sample of them"""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+        self._random = random.Random(0)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < SPAN_SAMPLE_SIZE:
+            self.samples.append(seconds)
+        else:
+            # Reservoir sampling: every duration so far is kept with the same probability
+            slot = self._random.randrange(self.count)
+            if slot < SPAN_SAMPLE_SIZE:
+                self.samples[slot] = seconds
+
+    def summary(self):
+        values = sorted(self.samples)
+        return {
+            "count": self.count,
+            "total_seconds": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+def count(name, amount=1):
+    with _metrics_lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def record_span(name, seconds):
+    """Records a duration measured elsewhere (e.g. in a worker process)"""
+    with _metrics_lock:
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = _SpanStats()
+        stats.add(seconds)
+
+@contextmanager
+def span(name, **attributes):
+    """Times the block under name; an exception also counts "<name>.errors" and is re-raised"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        count(f"{name}.errors")
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        record_span(name, seconds)
+        if log.isEnabledFor(logging.DEBUG):
+            details = "".join(f" {key}={value}" for key, value in attributes.items())
+            log.debug("span %s %.1f ms%s", name, seconds * 1000, details)
+
+def reset_metrics():
+    with _metrics_lock:
+        _counters.clear()
+        _spans.clear()
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize_durations(samples):
+    values = sorted(samples)
+    total = sum(values)
+    return {
+        "count": len(values),
+        "total_seconds": round(total, 6),
+        "mean_ms": round(total / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0
+    }
+
+def metrics_report():
+    """Counters, span timings and an estimated cost for everything recorded since the last reset"""
+    with _metrics_lock:
+        counters = dict(_counters)
+        spans = {name: stats.summary() for name, stats in _spans.items()}
+    gemini_usd = (counters.get("gemini.tokens_in", 0) * GEMINI_INPUT_USD_PER_M
+                  + counters.get("gemini.tokens_out", 0) * GEMINI_OUTPUT_USD_PER_M) / 1e6
+    vision_usd = counters.get("ocr.vision_images", 0) * VISION_USD_PER_1000 / 1000
+    return {
+        "counters": dict(sorted(counters.items())),
+        "spans": dict(sorted(spans.items())),
+        "cost_usd": {"gemini": round(gemini_usd, 6), "vision": round(vision_usd, 6), "total": round(gemini_usd + vision_usd, 6)}
+    }
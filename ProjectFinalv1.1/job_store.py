@@ -0,0 +1,208 @@
+"""
+Persistent grading job store (SQLite).
+
+A job is one question graded in one language and grading mode. For every student the store keeps
+the OCR text, the per-parameter scores and Gemini's feedback as soon as that student finishes, so:
+- an interrupted run resumes where it stopped: graded students are not sent to OCR or Gemini
+  again, and students whose evaluation failed reuse their stored OCR text
+- "Final Score" and "Exam Points" are always recomputed from the stored per-parameter scores with
+  the current PARAMETERS weights and question value, so changing either costs no API calls
+
+    store = get_job_store()
+    job_id = store.open_job(question, language, grading_mode, reference_answer)
+    store.record(job_id, position, student, result)
+    store.load_results(job_id, question_score)
+
+The database lives in JOB_STORE_PATH (default grading_jobs.sqlite3 in the working directory).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from exam_grader import PARAMETERS, combine_scores, exam_points
+
+# ====== CONFIG ======
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(os.getcwd(), "grading_jobs.sqlite3"))
+JOB_STORE_ENABLED = os.getenv("JOB_STORE", "1") != "0"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    job_key TEXT UNIQUE NOT NULL,
+    question TEXT NOT NULL,
+    language TEXT NOT NULL,
+    grading_mode TEXT NOT NULL,
+    reference_answer TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    student_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    pages TEXT,
+    ocr_text TEXT,
+    parameter_scores TEXT,
+    feedback TEXT,
+    error TEXT,
+    duplicate_of TEXT,
+    similarity REAL,
+    missing INTEGER,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, student_key)
+);
+"""
+# Columns added after the first release; older databases get them on open
+ADDED_COLUMNS = {"results": [("duplicate_of", "TEXT"), ("similarity", "REAL"), ("missing", "INTEGER")]}
+
+def job_key(question_text, language, grading_mode):
+    return hashlib.sha256(json.dumps([question_text, language, grading_mode], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def student_key(student):
+    """Identifies a student's submission; a scan that was replaced on disk counts as a new submission"""
+    paths = [path for path, _ in student.get("pages") or [[student["image_path"], None]]]
+    files = []
+    for path in dict.fromkeys(paths):
+        try:
+            stat = os.stat(path)
+            files.append([path, stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            files.append([path, None, None])
+    return hashlib.sha256(json.dumps([student["name"], student.get("pages"), files], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def rescore(parameter_scores, question_score):
+    """Final Score and Exam Points from per-parameter scores, with the current PARAMETERS weights"""
+    rubric = {param: parameter_scores[param] for param, _ in PARAMETERS if param != "Correctness"}
+    scores = combine_scores(parameter_scores["Correctness"], rubric)
+    scores["Exam Points"] = exam_points(scores["Final Score"], question_score)
+    return scores
+
+class JobStore:
+    """Thread-safe: pipeline callbacks record results from worker threads"""
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # a crash mid-write never loses committed results
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        with self._db:
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+                for name, kind in columns:
+                    if name not in existing:
+                        self._db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def find_job(self, question_text, language, grading_mode):
+        """Returns the job id, or None if this question was never graded in this language and mode"""
+        with self._lock:
+            row = self._db.execute("SELECT id FROM jobs WHERE job_key = ?", (job_key(question_text, language, grading_mode),)).fetchone()
+        return row[0] if row else None
+
+    def job_info(self, job_id):
+        """{"question", "language", "grading_mode"} of a stored job, or None"""
+        with self._lock:
+            row = self._db.execute("SELECT question, language, grading_mode FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(("question", "language", "grading_mode"), row)) if row else None
+
+    def job_reference(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT reference_answer FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def open_job(self, question_text, language, grading_mode, reference_answer):
+        """
+        Returns the id of the job for this question, creating it if needed.
+        Stored results graded against a different reference answer are discarded.
+        """
+        key = job_key(question_text, language, grading_mode)
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT id, reference_answer FROM jobs WHERE job_key = ?", (key,)).fetchone()
+            if row is None:
+                cursor = self._db.execute(
+                    "INSERT INTO jobs (job_key, question, language, grading_mode, reference_answer, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, question_text, language, grading_mode, reference_answer, now, now))
+                return cursor.lastrowid
+            job_id, stored_reference = row
+            if stored_reference != reference_answer:
+                self._db.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+                self._db.execute("UPDATE jobs SET reference_answer = ?, updated_at = ? WHERE id = ?", (reference_answer, now, job_id))
+            return job_id
+
+    def reset_job(self, job_id):
+        """Forgets every stored result of the job (the next run grades everyone again)"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+
+    def record(self, job_id, position, student, result):
+        """Saves one student's pipeline result; position is the student's place in the cohort"""
+        scores = result.get("scores")
+        parameter_scores = {param: scores[param] for param, _ in PARAMETERS} if scores else None
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (job_id, student_key, position, name, image_path, pages, ocr_text, parameter_scores, feedback, error, duplicate_of, similarity, missing, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, student_key(student), position, student["name"], student["image_path"],
+                 json.dumps(student.get("pages")) if student.get("pages") else None,
+                 result.get("ocr_text") or None,
+                 json.dumps(parameter_scores) if parameter_scores else None,
+                 json.dumps(result["feedback"], ensure_ascii=False) if result.get("feedback") is not None else None,
+                 result.get("error"), result.get("duplicate_of"), result.get("similarity"), 1 if result.get("missing") else None, time.time()))
+            self._db.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def stored_results(self, job_id, question_score):
+        """
+        student key -> stored result dict; graded students get scores rescored for question_score.
+        A question the student left unanswered in an exam comes back with "missing" and no scores.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT student_key, name, image_path, ocr_text, parameter_scores, feedback, error, duplicate_of, similarity, missing FROM results WHERE job_id = ?",
+                (job_id,)).fetchall()
+        stored = {}
+        for key, name, image_path, ocr_text, parameter_scores, feedback, error, duplicate_of, similarity, missing in rows:
+            result = {"name": name, "image_path": image_path, "ocr_text": ocr_text or "", "scores": None}
+            if parameter_scores:
+                result["scores"] = rescore(json.loads(parameter_scores), question_score)
+            if feedback:
+                result["feedback"] = json.loads(feedback)
+            if error:
+                result["error"] = error
+            if duplicate_of:
+                result["duplicate_of"] = duplicate_of
+                result["similarity"] = similarity
+            if missing:
+                result["missing"] = True
+            stored[key] = result
+        return stored
+
+    def load_results(self, job_id, question_score):
+        """Every stored result of the job, in cohort order"""
+        with self._lock:
+            keys = [row[0] for row in self._db.execute("SELECT student_key FROM results WHERE job_id = ? ORDER BY position, name", (job_id,))]
+        stored = self.stored_results(job_id, question_score)
+        return [stored[key] for key in keys]
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_job_store(path=None):
+    """Shared store for JOB_STORE_PATH (or path)"""
+    global _store
+    path = path or JOB_STORE_PATH
+    with _store_lock:
+        if _store is None or _store.path != path:
+            _store = JobStore(path)
+        return _store
@@ -0,0 +1,61 @@
+"""
+LLM clients used for grading.
+
+LLMClient.generate(prompt, generation_config) returns (reply text, finish reason) and raises
+GeminiError on failure. GeminiClient talks to the Gemini REST generateContent endpoint through
+the shared transport (pooling, retries, rate limits). Point GEMINI_BASE_URL at another server
+speaking the same protocol - e.g. mock_gemini_server.py - to run the grader offline.
+"""
+import os
+import threading
+from gemini_transport import GeminiReplyError, get_gemini_transport, estimate_tokens
+
+# ====== CONFIG ======
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+
+class LLMClient:
+    """Interface: generate(prompt, generation_config=None) -> (text, finish_reason). Subclasses set model."""
+    model = None
+
+    def generate(self, prompt, generation_config=None):
+        raise NotImplementedError
+
+class GeminiClient(LLMClient):
+    def __init__(self, api_key, model, base_url=None):
+        self.api_key = api_key
+        self.model = model
+        self.url = f"{(base_url or GEMINI_BASE_URL).rstrip('/')}/models/{model}:generateContent"
+
+    def generate(self, prompt, generation_config=None):
+        data = {
+            "contents": [{"parts": [{"text": prompt}]}]
+        }
+        if generation_config:
+            data["generationConfig"] = generation_config
+        reply = get_gemini_transport(self.api_key).post(self.url, data, prompt_tokens=estimate_tokens(prompt))
+        try:
+            candidate = reply['candidates'][0]
+            answer = candidate['content']['parts'][0]['text'].strip()
+        except Exception:
+            raise GeminiReplyError("Could not decode Gemini reply")
+        return answer, candidate.get('finishReason', 'STOP')
+
+_client = None
+_client_override = None
+_client_lock = threading.Lock()
+
+def get_llm_client(api_key, model):
+    """Shared LLM client (the one set with set_llm_client, if any)"""
+    global _client
+    with _client_lock:
+        if _client_override is not None:
+            return _client_override
+        if _client is None or _client.api_key != api_key or _client.model != model:
+            _client = GeminiClient(api_key, model)
+        return _client
+
+def set_llm_client(client):
+    """Replaces the shared client (e.g. with an in-process stand-in); None restores Gemini"""
+    global _client_override
+    with _client_lock:
+        _client_override = client
@@ -0,0 +1,213 @@
+"""
+Local stand-in for the Gemini generateContent endpoint, for load testing the grader offline.
+
+    python mock_gemini_server.py --port 8765 --latency-ms 800 --latency-distribution lognormal --error-429 0.05
+    GEMINI_BASE_URL=http://127.0.0.1:8765/v1beta python batch_grader.py ...
+
+Replies are canned but shaped like the real ones, so every grading mode parses them:
+reference code, "SCORE: ..." correctness replies, "SYNTAX: ..." rubric replies, and JSON
+objects/arrays when the request has a responseSchema. Scores are derived from a hash of the
+prompt, so the same prompt always gets the same reply. GET /stats returns request counters.
+
+Can also be started in-process:
+    from mock_gemini_server import start_mock_server
+    server, base_url = start_mock_server(latency_ms=200, error_500=0.02)
+"""
+import sys
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+GENERATE_PATH = re.compile(r"/models/([^/:]+):generateContent$")
+
+CANNED_REFERENCE = """def solution(numbers):
+    total = 0
+    for n in numbers:
+        total += n
+    return total"""
+
+def prompt_score(prompt, salt=""):
+    # Deterministic 60-100 score per prompt
+    digest = hashlib.sha256(f"{salt}|{prompt}".encode('utf-8')).digest()
+    return 60 + digest[0] % 41
+
+def structured_object(prompt, salt=""):
+    return {
+        "correctness": prompt_score(prompt, salt + "correctness"),
+        "syntax": prompt_score(prompt, salt + "syntax"),
+        "structure": prompt_score(prompt, salt + "structure"),
+        "efficiency": prompt_score(prompt, salt + "efficiency"),
+        "edge_cases": prompt_score(prompt, salt + "edge_cases"),
+        "explanation": "Mock evaluation.",
+        "corrected_code": "NO CORRECTION NEEDED"
+    }
+
+def canned_reply(prompt, generation_config=None):
+    """Reply text shaped like Gemini's answer to each of the grader's prompts"""
+    schema = (generation_config or {}).get("responseSchema")
+    if schema and schema.get("type") == "ARRAY":
+        ids = sorted({int(i) for i in re.findall(r"--- STUDENT (\d+)", prompt)})
+        return json.dumps([dict(structured_object(prompt, str(i)), id=i) for i in ids])
+    if schema:
+        return json.dumps(structured_object(prompt))
+    if "SCORE:" in prompt:
+        return f"SCORE: {prompt_score(prompt)}\nEXPLANATION: Mock evaluation.\nCORRECTED: NO CORRECTION NEEDED"
+    if "SYNTAX:" in prompt:
+        return "\n".join(f"{field}: {prompt_score(prompt, field)} - Mock evaluation." for field in ("SYNTAX", "STRUCTURE", "EFFICIENCY", "EDGE_CASES"))
+    return f"```python\n{CANNED_REFERENCE}\n```"
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=500, latency_distribution="fixed", latency_sigma=0.5,
+                 error_429=0.0, error_500=0.0, retry_after=None, seed=None):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {latency_distribution}")
+        super().__init__(address, MockGeminiHandler)
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "500": 0, "in_flight": 0, "max_in_flight": 0}
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        """Seconds to wait before replying"""
+        mean = self.latency_ms / 1000
+        with self.lock:
+            if self.latency_distribution == "uniform":
+                return self.random.uniform(0, 2 * mean)
+            if self.latency_distribution == "exponential":
+                return self.random.expovariate(1 / mean) if mean > 0 else 0
+            if self.latency_distribution == "lognormal":
+                # mu chosen so the distribution's mean is latency_ms
+                return self.random.lognormvariate(0, self.latency_sigma) * mean / math.exp(self.latency_sigma ** 2 / 2)
+            return mean
+
+    def sample_error(self):
+        """None, 429 or 500"""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.error_429:
+            return 429
+        if roll < self.error_429 + self.error_500:
+            return 500
+        return None
+
+    def count(self, key, delta=1):
+        with self.lock:
+            self.stats[key] += delta
+            if key == "in_flight":
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+    disable_nagle_algorithm = True  # headers and body are separate writes; avoid the delayed-ACK stall
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith("/stats"):
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats))
+            return
+        self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        match = GENERATE_PATH.search(self.path)
+        if not match:
+            self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+        server = self.server
+        server.count("requests")
+        server.count("in_flight")
+        try:
+            time.sleep(server.sample_latency())
+            error = server.sample_error()
+            if error == 429:
+                server.count("429")
+                headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+                self.send_json(429, {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}}, headers)
+                return
+            if error == 500:
+                server.count("500")
+                self.send_json(500, {"error": {"code": 500, "message": "Internal error", "status": "INTERNAL"}})
+                return
+            try:
+                request = json.loads(body)
+                prompt = request["contents"][0]["parts"][0]["text"]
+            except (ValueError, KeyError, IndexError, TypeError):
+                self.send_json(400, {"error": {"code": 400, "message": "Invalid request", "status": "INVALID_ARGUMENT"}})
+                return
+            text = canned_reply(prompt, request.get("generationConfig"))
+            prompt_tokens = max(1, len(prompt) // 4)
+            output_tokens = max(1, len(text) // 4)
+            server.count("ok")
+            self.send_json(200, {
+                "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens, "totalTokenCount": prompt_tokens + output_tokens},
+                "modelVersion": match.group(1)
+            })
+        finally:
+            server.count("in_flight", -1)
+
+def start_mock_server(host="127.0.0.1", port=0, **config):
+    """Starts the server on a background thread. Returns (server, base_url); stop with server.shutdown()"""
+    server = MockGeminiServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, name="mock-gemini", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1beta"
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini generateContent API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean reply latency")
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Shape of the lognormal distribution (larger = longer tail)")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-500", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with 429 replies")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible latencies and errors")
+    return parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    server = MockGeminiServer(
+        (args.host, args.port), args.latency_ms, args.latency_distribution, args.latency_sigma,
+        args.error_429, args.error_500, args.retry_after, args.seed
+    )
+    print(f"Mock Gemini listening on http://{args.host}:{server.server_address[1]}/v1beta")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stats: {server.stats}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Multi-question exams: every student hands in one scan (or one multi-page document) that answers
+all of the exam's questions.
+
+    exam = load_exam("exam.json")
+    report = grade_exam(exam, students)
+
+Each scan is OCR'd once. The text is then split into one answer region per question at the
+question markers students write ("שאלה 2", "Question 2", "Q2", or "2." / "2)" / "(2)" at the
+start of a line). All reference answers are generated up front in parallel, while the scans are
+being OCR'd, and every (student, question) pair is graded in a single GradingPipeline run so
+the pairs share its worker pools. Each student's exam points are totalled over the questions.
+
+exam.json:
+    {"language": "Python",
+     "questions": [{"text": "Write a function ...", "points": 10},
+                   {"image": "q2.png", "points": 15, "language": "C#"}]}
+Question images are OCR'd like --question-image; relative paths are resolved against the file.
+"""
+import os
+import re
+import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from exam_grader import LANGUAGES, get_ocr_text, get_pages_ocr_text, get_question_ocr_text, get_reference_answer, is_gemini_error
+from grading_pipeline import GradingPipeline, _cancellable
+from job_store import student_key
+from instrumentation import get_logger, count
+
+log = get_logger(__name__)
+
+# ====== CONFIG ======
+REFERENCE_WORKERS = int(os.getenv("REFERENCE_WORKERS", "4"))
+
+# "שאלה 2", "Question 2", "Q.2", "Ex 2", "Task 2:" ...
+_KEYWORD_MARKER = re.compile(r"^[ \t]*(?:שאלה|question|q|ex(?:ercise)?|task)[ \t]*[.#:]?[ \t]*(\d{1,2})(?!\d)[ \t]*[.):-]?", re.IGNORECASE | re.MULTILINE)
+# "2." "2)" "(2)" at the start of a line (not "2.5")
+_NUMBER_MARKER = re.compile(r"^[ \t]*\(?(\d{1,2})[ \t]*[.)](?![\d.])", re.MULTILINE)
+
+# ====== EXAM ======
+def load_exam(path, language=None, default_points=None, read_images=True):
+    """
+    Reads an exam file into {"questions": [{"text", "language", "points"}, ...]}.
+    A question's language and points default to the file's, then to language/default_points.
+    read_images=False (offline rescoring) rejects questions given only as an image instead of OCR'ing them.
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    language = data.get("language", language)
+    default_points = data.get("points", default_points)
+    questions = []
+    for number, item in enumerate(data.get("questions") or [], 1):
+        if item.get("text"):
+            text = item["text"].strip()
+        elif item.get("image") and not read_images:
+            raise ValueError(f"Question {number} is only an image; add its \"text\" to rescore without OCR")
+        elif item.get("image"):
+            text = get_question_ocr_text(os.path.join(base_dir, item["image"]))
+            if not text:
+                raise ValueError(f"No text detected in the image of question {number}")
+        else:
+            raise ValueError(f"Question {number} has neither text nor image")
+        question = {"text": text, "language": item.get("language", language), "points": item.get("points", default_points)}
+        if question["language"] not in LANGUAGES:
+            raise ValueError(f"Question {number}: unsupported language {question['language']!r}")
+        if not isinstance(question["points"], (int, float)) or question["points"] <= 0:
+            raise ValueError(f"Question {number} needs a positive number of points")
+        questions.append(question)
+    if not questions:
+        raise ValueError(f"{path} has no questions")
+    return {"questions": questions}
+
+def split_answers(ocr_text, question_count):
+    """
+    The answer to each question (1..question_count) in a student's OCR text, None where no answer
+    was found. Keyword markers ("Question 2") win over bare numbers when a student used them, and
+    may come in any order (students answer the easy questions first); the first marker of each
+    number counts. Bare "2." / "2)" markers are only taken in increasing order, so a "3)" inside the
+    code of answer 1 is not mistaken for question 3 once question 2 was seen. Text before the first
+    marker (name, ID) is dropped. A single-question exam without markers gets the whole text.
+    """
+    regions = [None] * question_count
+    markers = (_markers(_KEYWORD_MARKER, ocr_text, question_count, increasing=False)
+               or _markers(_NUMBER_MARKER, ocr_text, question_count, increasing=True))
+    if not markers:
+        if question_count == 1 and ocr_text.strip():
+            regions[0] = ocr_text.strip()
+        return regions
+    for i, (number, start, _) in enumerate(markers):
+        end = markers[i + 1][2] if i + 1 < len(markers) else len(ocr_text)
+        regions[number - 1] = ocr_text[start:end].strip() or None
+    return regions
+
+def _markers(pattern, text, question_count, increasing):
+    """[(question number, answer start, marker start)] in text order, one per question number"""
+    markers = []
+    seen = set()
+    for match in pattern.finditer(text):
+        number = int(match.group(1))
+        if not 0 < number <= question_count or number in seen or (increasing and number < max(seen, default=0)):
+            continue
+        markers.append((number, match.end(), match.start()))
+        seen.add(number)
+    return markers
+
+def generate_references(questions, refresh=False, workers=REFERENCE_WORKERS):
+    """Reference answers for all questions, generated (or read from the pins) in parallel"""
+    with ThreadPoolExecutor(max(1, min(workers, len(questions))), thread_name_prefix="reference") as pool:
+        references = list(pool.map(lambda q: get_reference_answer(q["text"], q["language"], refresh=refresh), questions))
+    failed = [number for number, answer in enumerate(references, 1) if is_gemini_error(answer)]
+    if failed:
+        raise ValueError(f"Could not generate reference answers for questions {', '.join(map(str, failed))}: {references[failed[0] - 1]}")
+    return references
+
+def _student_ocr(student):
+    if student.get("pages"):
+        return get_pages_ocr_text(student["pages"])
+    return get_ocr_text(student["image_path"])
+
+# ====== GRADING ======
+def grade_exam(exam, students, pipeline=None, on_result=None, refresh_reference=False, cancel=None, store=None):
+    """
+    Grades every question of exam for every student. on_result(student index, question index,
+    result) is called as each pair finishes. With a JobStore each question is its own job, so
+    pairs graded in an earlier run are resumed and only scans with ungraded pairs are OCR'd.
+    Returns a report with one entry per student: its answers and the total exam points.
+    Raises ValueError if a reference answer can't be generated.
+    """
+    questions = exam["questions"]
+    pipeline = pipeline or GradingPipeline()
+    answers = [[None] * len(questions) for _ in students]
+    ocr_texts = [""] * len(students)
+    stored = [{} for _ in questions]
+    keys = [student_key(student) for student in students] if store is not None else None
+
+    def stored_result(index, q):
+        return stored[q].get(keys[index]) if store is not None else None
+
+    def resumed(index, q):
+        # A stored pair is final once it has scores or was left unanswered
+        previous = stored_result(index, q)
+        return previous is not None and not previous.get("error") and bool(previous.get("scores") or previous.get("missing"))
+
+    def needs_ocr(index):
+        # Pairs whose evaluation failed last time reuse their stored answer text
+        return any(not resumed(index, q) and not (stored_result(index, q) or {}).get("ocr_text") for q in range(len(questions)))
+
+    with ThreadPoolExecutor(1, thread_name_prefix="reference") as reference_pool, \
+            ThreadPoolExecutor(pipeline.ocr_workers, thread_name_prefix="exam-ocr") as ocr_pool:
+        ocr_futures = {}
+
+        def start_ocr():
+            for index, student in enumerate(students):
+                if index not in ocr_futures and needs_ocr(index):
+                    ocr_futures[index] = student.get("ocr_future") or ocr_pool.submit(_cancellable(cancel, _student_ocr), student)
+
+        # Scans are OCR'd while the reference answers are generated
+        reference_future = reference_pool.submit(generate_references, questions, refresh_reference)
+        if store is not None:
+            for q, question in enumerate(questions):
+                job_id = store.find_job(question["text"], question["language"], pipeline.grading_mode)
+                stored[q] = store.stored_results(job_id, question["points"]) if job_id is not None else {}
+        start_ocr()
+        try:
+            references = reference_future.result()
+        except Exception:
+            for future in ocr_futures.values():
+                future.cancel()
+            raise
+        job_ids = [None] * len(questions)
+        if store is not None:
+            # open_job drops stored results graded against a different reference answer
+            for q, question in enumerate(questions):
+                job_ids[q] = store.open_job(question["text"], question["language"], pipeline.grading_mode, references[q])
+                stored[q] = store.stored_results(job_ids[q], question["points"])
+            start_ocr()
+
+        specs = [{"id": q, "reference_answer": references[q], "language": question["language"], "question_score": question["points"]}
+                 for q, question in enumerate(questions)]
+        pairs = []  # (student index, question index, pipeline student)
+        waiting = {}  # student index -> [(question index, Future of its answer text)] resolved after OCR
+        for index, student in enumerate(students):
+            for q in range(len(questions)):
+                if resumed(index, q):
+                    answers[index][q] = stored_result(index, q)
+                    count("jobstore.resumed")
+                    if on_result:
+                        on_result(index, q, answers[index][q])
+                    continue
+                region = Future()
+                previous = stored_result(index, q)
+                if previous is not None and previous["ocr_text"]:
+                    region.set_result(previous["ocr_text"])
+                    count("jobstore.reused_ocr")
+                else:
+                    waiting.setdefault(index, []).append((q, region))
+                pairs.append((index, q, {"name": student["name"], "image_path": student["image_path"], "pages": student.get("pages"),
+                                         "question": specs[q], "ocr_future": region}))
+
+        missing = set()  # (student index, question index) the student left unanswered
+        split_errors = {}  # student index -> why no answers could be found at all
+
+        def split(index, future):
+            error = future.exception()
+            regions = None
+            if error is None:
+                ocr_texts[index] = future.result()
+                regions = split_answers(ocr_texts[index], len(questions))
+                if not any(regions):
+                    split_errors[index] = "No question markers found in the answer"
+            for q, region in waiting.get(index, []):
+                if error is not None:
+                    region.set_exception(error)
+                elif regions[q] is None:
+                    if index not in split_errors:
+                        missing.add((index, q))
+                    region.set_exception(ValueError(split_errors.get(index) or f"No answer found for question {q + 1}"))
+                else:
+                    region.set_result(regions[q])
+
+        def record(pair_index, result):
+            index, q, _ = pairs[pair_index]
+            if (index, q) in missing:
+                # A skipped question is a final result (0 points), not a failure to retry
+                del result["error"]
+                result["missing"] = True
+            if store is not None and not (result.get("cancelled") and not result["ocr_text"]):
+                store.record(job_ids[q], index, students[index], result)
+            if on_result:
+                on_result(index, q, result)
+
+        for index, future in ocr_futures.items():
+            future.add_done_callback(lambda f, index=index: split(index, f))
+        results = pipeline.run([student for _, _, student in pairs], None, None, None, on_result=record, cancel=cancel)
+    for (index, q, _), result in zip(pairs, results):
+        answers[index][q] = result
+    return exam_report(questions, references, students, answers, ocr_texts, split_errors)
+
+def exam_report(questions, references, students, answers, ocr_texts=None, split_errors=None):
+    """Per-student answers with total exam points; a missing or failed answer counts as 0 points"""
+    max_points = sum(question["points"] for question in questions)
+    rows = []
+    for index, student in enumerate(students):
+        for result in answers[index]:
+            if not result.get("scores") and not result.get("error"):
+                result["missing"] = True
+        total = sum((result.get("scores") or {}).get("Exam Points", 0) for result in answers[index])
+        row = {"name": student["name"], "image_path": student["image_path"], "ocr_text": (ocr_texts or [""] * len(students))[index],
+               "answers": answers[index], "Exam Points": total, "Max Points": max_points}
+        errors = [f"Q{q}: {result['error']}" for q, result in enumerate(answers[index], 1) if result.get("error")]
+        if split_errors and index in split_errors:
+            errors = [split_errors[index]]
+        if errors:
+            row["error"] = "; ".join(errors)
+        rows.append(row)
+    return {
+        "questions": [{"question": question["text"], "language": question["language"], "question_score": question["points"],
+                       "reference_answer": reference} for question, reference in zip(questions, references)],
+        "max_points": max_points,
+        "students": rows
+    }
+
+def rescore_exam(exam, students, grading_mode, store):
+    """exam_report from stored per-parameter scores (current weights and points); no OCR or Gemini calls"""
+    questions = exam["questions"]
+    references = []
+    answers = [[None] * len(questions) for _ in students]
+    for q, question in enumerate(questions):
+        job_id = store.find_job(question["text"], question["language"], grading_mode)
+        if job_id is None:
+            raise ValueError(f"No stored grading job for question {q + 1} ({question['language']}, {grading_mode} mode)")
+        references.append(store.job_reference(job_id))
+        stored = store.stored_results(job_id, question["points"])
+        for index, student in enumerate(students):
+            answers[index][q] = stored.get(student_key(student)) or {
+                "name": student["name"], "image_path": student["image_path"], "ocr_text": "", "scores": None, "error": "Not graded yet"}
+    return exam_report(questions, references, students, answers)
@@ -0,0 +1,116 @@
+"""
+OCR backends.
+
+Every backend turns prepared upload bytes into (text, word confidence scores 0..1):
+- vision: Google Vision (VisionOCRClient in image_text_viewer)
+- local:  offline Tesseract engine, for cheap first-pass OCR of clean typed images
+- replay: serves responses recorded earlier from disk, with no network at all
+
+Pick the default backend with OCR_BACKEND=vision|local|replay. Setting OCR_RECORD_DIR records
+every response of the default backend into that directory, for later use with OCR_BACKEND=replay.
+"""
+import os
+import io
+import json
+import hashlib
+import threading
+
+# ====== CONFIG ======
+OCR_BACKEND = os.getenv("OCR_BACKEND", "vision")
+OCR_REPLAY_DIR = os.getenv("OCR_REPLAY_DIR", os.path.join(os.getcwd(), "ocr_recordings"))
+OCR_RECORD_DIR = os.getenv("OCR_RECORD_DIR")
+OCR_LOCAL_LANG = os.getenv("OCR_LOCAL_LANG", "eng")
+
+class OCRBackend:
+    """Interface: annotate(content) -> (text, confidence_scores). Subclasses set name."""
+    name = None
+
+    def annotate(self, content):
+        raise NotImplementedError
+
+    def batch_annotate(self, contents):
+        """Same contract as VisionOCRClient.batch_annotate: a failed image is an Exception in the list"""
+        results = []
+        for content in contents:
+            try:
+                results.append(self.annotate(content))
+            except Exception as e:
+                results.append(e)
+        return results
+
+class LocalOCRBackend(OCRBackend):
+    """Offline OCR with Tesseract (pip install pytesseract, plus the tesseract binary)"""
+    name = "local"
+
+    def __init__(self, lang=OCR_LOCAL_LANG):
+        self.lang = lang
+
+    def annotate(self, content):
+        try:
+            import pytesseract
+        except ImportError:
+            raise ImportError("The local OCR backend requires pytesseract (pip install pytesseract) and the tesseract binary")
+        from PIL import Image
+        data = pytesseract.image_to_data(Image.open(io.BytesIO(content)), lang=self.lang, output_type=pytesseract.Output.DICT)
+        lines = {}
+        confidence_scores = []
+        for i, word in enumerate(data["text"]):
+            if not word.strip():
+                continue
+            line = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(line, []).append(word)
+            confidence = float(data["conf"][i])
+            if confidence >= 0:
+                confidence_scores.append(confidence / 100)
+        text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+        return text, confidence_scores
+
+def upload_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+class ReplayOCRBackend(OCRBackend):
+    """
+    Deterministic stand-in: serves the response recorded for the exact same upload bytes.
+    Raises LookupError for an upload that was never recorded.
+    """
+    name = "replay"
+
+    def __init__(self, directory=OCR_REPLAY_DIR):
+        self.directory = directory
+
+    def annotate(self, content):
+        path = os.path.join(self.directory, f"{upload_digest(content)}.json")
+        try:
+            with open(path, encoding='utf-8') as f:
+                recorded = json.load(f)
+        except FileNotFoundError:
+            raise LookupError(f"No recorded OCR response for this upload in {self.directory}")
+        return recorded["text"], recorded["confidence_scores"]
+
+class RecordingOCRBackend(OCRBackend):
+    """Wraps another backend and saves each response for ReplayOCRBackend"""
+    def __init__(self, backend, directory=OCR_REPLAY_DIR):
+        self.backend = backend
+        self.name = backend.name
+        self.directory = directory
+
+    def _record(self, content, result):
+        os.makedirs(self.directory, exist_ok=True)
+        text, confidence_scores = result
+        path = os.path.join(self.directory, f"{upload_digest(content)}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"text": text, "confidence_scores": confidence_scores}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def annotate(self, content):
+        result = self.backend.annotate(content)
+        self._record(content, result)
+        return result
+
+    def batch_annotate(self, contents):
+        results = self.backend.batch_annotate(contents)
+        for content, result in zip(contents, results):
+            if not isinstance(result, Exception):
+                self._record(content, result)
+        return results
@@ -0,0 +1,247 @@
+"""
+Sandbox process for execution_grader - runs one answer's function on a list of inputs.
+
+Started as a separate interpreter (never imported by the grader). Reads one JSON request from
+stdin:
+    {"code": ..., "function": name, "arity": n, "inputs": [[arg, ...], ...], "cpu_seconds": s, "memory_mb": m,
+     "require_isolation": bool}
+and writes one JSON reply to stdout:
+    {"status": "ok", "function": name, "results": [{"value": ..., "stdout": ...} or {"error": ...}, ...]}
+    {"status": "isolation_error" | "syntax_error" | "rejected" | "load_error" | "no_function", "error": ...}
+
+Before touching the code the process isolates itself (Linux): a new network namespace without
+interfaces, a chroot into its empty working directory, the unprivileged "nobody" user (or a new
+user namespace when not started as root), RLIMIT_NPROC 0 so it can't start processes, no new
+privileges, and limits on CPU time, address space, file writes and open files. With
+require_isolation it refuses to run code if any of that fails (e.g. on Windows or where user
+namespaces are disabled).
+
+On top of that the code runs with a restricted set of builtins (no type, object, getattr, open,
+...), only allowlisted modules, and those only through copies holding their public functions
+and classes - no submodules such as statistics.sys, and no helpers that look attributes up by
+name (operator.attrgetter, string.Formatter, functools.update_wrapper). Code that names a dunder
+(__class__, __globals__, ...) or a frame/code attribute (gi_frame, f_globals, ...) is rejected
+before it runs. Only definitions, imports and constant assignments at module level are executed,
+so example calls and input() prompts around the function are skipped. Only stdlib modules are
+imported here.
+"""
+import io
+import os
+import ast
+import sys
+import json
+import math
+import types
+import builtins
+import importlib
+import contextlib
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: only the parent's wall-clock timeout applies
+
+ALLOWED_MODULES = {"math", "string", "collections", "itertools", "functools", "operator", "heapq", "bisect", "re", "statistics"}
+# Module attributes that turn a string into attribute access
+BLOCKED_MODULE_ATTRIBUTES = {
+    "string": {"Formatter", "Template"},
+    "operator": {"attrgetter", "methodcaller"},
+    "functools": {"update_wrapper", "wraps", "WRAPPER_ASSIGNMENTS", "WRAPPER_UPDATES", "singledispatchmethod", "cached_property"},
+}
+ALLOWED_BUILTINS = (
+    "abs", "all", "any", "bin", "bool", "chr", "dict", "divmod", "enumerate", "filter", "float", "format",
+    "frozenset", "hex", "int", "isinstance", "issubclass", "iter", "len", "list", "map", "max", "min", "next",
+    "oct", "ord", "pow", "print", "range", "repr", "reversed", "round", "set", "slice", "sorted", "str", "sum",
+    "tuple", "zip", "super", "property", "staticmethod", "classmethod", "hash", "callable",
+    "Exception", "ValueError", "TypeError", "IndexError", "KeyError", "ZeroDivisionError", "ArithmeticError",
+    "StopIteration", "RuntimeError", "NotImplementedError", "AttributeError", "RecursionError",
+    "True", "False", "None", "NotImplemented", "__build_class__",
+)
+# Attributes that reach frames, code objects and through them every module's globals
+BLOCKED_ATTRIBUTES = {
+    "gi_frame", "gi_code", "cr_frame", "cr_code", "ag_frame", "ag_code", "tb_frame",
+    "f_back", "f_globals", "f_locals", "f_builtins", "f_code",
+}
+# Methods an answer's class may not define: they receive attribute values looked up by name
+BLOCKED_METHODS = {"__getattr__", "__getattribute__", "__setattr__", "__delattr__", "__set_name__", "__init_subclass__",
+                   "__get__", "__set__", "__delete__", "__class_getitem__", "__mro_entries__", "__prepare__"}
+MAX_REPR = 2000
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+PR_SET_NO_NEW_PRIVS = 38
+NOBODY = 65534
+
+_modules = {}
+
+# ====== ISOLATION ======
+def _preload_modules():
+    # Imported before the chroot, which hides the stdlib
+    for name in ALLOWED_MODULES:
+        module = importlib.import_module(name)
+        proxy = types.ModuleType(name)
+        blocked = BLOCKED_MODULE_ATTRIBUTES.get(name, ())
+        for attribute, value in vars(module).items():
+            if not attribute.startswith("_") and attribute not in blocked and not isinstance(value, types.ModuleType):
+                setattr(proxy, attribute, value)
+        _modules[name] = proxy
+
+def _limit_resources(cpu_seconds, memory_mb):
+    """Returns False if the limits can't be set (no resource module, e.g. Windows)"""
+    if resource is None:
+        return False
+    # (soft, hard): past the soft CPU limit the process gets SIGXCPU, a second later SIGKILL
+    limits = [(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1)), (resource.RLIMIT_FSIZE, (0, 0)),
+              (resource.RLIMIT_NOFILE, (16, 16)), (resource.RLIMIT_NPROC, (0, 0)), (resource.RLIMIT_CORE, (0, 0))]
+    if memory_mb:
+        limits.append((resource.RLIMIT_AS, (memory_mb * 1024 * 1024,) * 2))
+    applied = True
+    for limit, values in limits:
+        try:
+            resource.setrlimit(limit, values)
+        except (ValueError, OSError):
+            applied = False
+    return applied
+
+def _isolate(cpu_seconds=1, memory_mb=None):
+    """
+    Cuts the process off from the network, the file system and other processes.
+    Returns the steps that failed (empty when fully isolated).
+    """
+    failed = []
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        unshare, prctl = libc.unshare, libc.prctl
+    except (ImportError, OSError, AttributeError):
+        # Not Linux: only the resource limits (where available) apply
+        return ["namespaces", "chroot", "user"] + ([] if _limit_resources(cpu_seconds, memory_mb) else ["limits"])
+    root = os.geteuid() == 0
+    try:
+        import pwd
+        nobody = pwd.getpwnam("nobody")
+        uid, gid = nobody.pw_uid, nobody.pw_gid
+    except (ImportError, KeyError):
+        uid = gid = NOBODY
+    # As root: new network and mount namespaces. Otherwise a user namespace grants the right to create them
+    if unshare(CLONE_NEWNET | CLONE_NEWNS | (0 if root else CLONE_NEWUSER)) != 0:
+        failed.append("namespaces")
+    try:
+        os.chroot(os.getcwd())
+        os.chdir("/")
+    except OSError:
+        failed.append("chroot")
+    if not _limit_resources(cpu_seconds, memory_mb):
+        failed.append("limits")
+    if prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) != 0:
+        failed.append("no_new_privs")
+    if root:
+        try:
+            os.setgroups([])
+            os.setgid(gid)
+            os.setuid(uid)
+        except OSError:
+            failed.append("user")
+    return failed
+
+# ====== LOADING ======
+def _restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name not in _modules:
+        raise ImportError(f"import of '{name}' is not allowed")
+    return _modules[name]
+
+def _sandbox_builtins():
+    allowed = {name: getattr(builtins, name) for name in ALLOWED_BUILTINS}
+    allowed["__import__"] = _restricted_import
+    return allowed
+
+def _is_dunder(name):
+    return name.startswith("__") and name.endswith("__")
+
+def check_names(tree):
+    """Why the code is rejected (a name it may not use), or None"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and _is_dunder(node.id):
+            return f"name '{node.id}' is not allowed"
+        if isinstance(node, ast.Attribute) and (_is_dunder(node.attr) or node.attr in BLOCKED_ATTRIBUTES):
+            return f"attribute '{node.attr}' is not allowed"
+        if isinstance(node, ast.alias) and (node.name.startswith("_") or (node.asname or "").startswith("__")):
+            return f"import of '{node.name}' is not allowed"
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in BLOCKED_METHODS:
+            return f"method '{node.name}' is not allowed"
+        if isinstance(node, ast.ClassDef) and node.keywords:
+            return "class keywords (metaclass=...) are not allowed"
+    return None
+
+def _is_definition(node):
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom)):
+        return True
+    # Module constants (N = 10, DIGITS = "0123"...) the function may rely on
+    if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+        return all(isinstance(child, (ast.Constant, ast.Tuple, ast.List, ast.Set, ast.Dict, ast.Load, ast.UnaryOp, ast.USub))
+                   for child in ast.walk(node.value))
+    return False
+
+def _find_function(tree, name, arity):
+    """The requested function, or else the first top-level function taking arity arguments"""
+    functions = [node for node in tree.body if isinstance(node, ast.FunctionDef)]
+    for node in functions:
+        if node.name == name:
+            return node.name
+    for node in functions:
+        if len(node.args.args) == arity:
+            return node.name
+    return None
+
+def canonical(value):
+    """JSON form of a return value; tuples compare like lists, sets and dicts independent of order"""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else repr(value)
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {"set": sorted((canonical(item) for item in value), key=repr)}
+    if isinstance(value, dict):
+        return {"dict": sorted(([canonical(k), canonical(v)] for k, v in value.items()), key=repr)}
+    return {"repr": repr(value)[:MAX_REPR]}
+
+def run(request):
+    _preload_modules()
+    failed = _isolate(request.get("cpu_seconds", 1), request.get("memory_mb"))
+    if failed and request.get("require_isolation", True):
+        return {"status": "isolation_error", "error": f"Could not isolate the sandbox ({', '.join(failed)})"}
+    try:
+        tree = ast.parse(request["code"])
+    except (SyntaxError, ValueError) as e:
+        return {"status": "syntax_error", "error": f"{type(e).__name__}: {e}"}
+    tree.body = [node for node in tree.body if _is_definition(node)]
+    rejected = check_names(tree)
+    if rejected:
+        return {"status": "rejected", "error": rejected}
+    name = _find_function(tree, request["function"], request["arity"])
+    if name is None:
+        return {"status": "no_function", "error": f"No function '{request['function']}' taking {request['arity']} arguments"}
+    namespace = {"__builtins__": _sandbox_builtins(), "__name__": "answer"}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            exec(compile(tree, "<answer>", "exec"), namespace)
+    except Exception as e:
+        return {"status": "load_error", "error": f"{type(e).__name__}: {e}"}
+    function = namespace[name]
+    results = []
+    for args in request["inputs"]:
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                value = function(*args)
+            results.append({"value": canonical(value), "stdout": output.getvalue()[:MAX_REPR]})
+        except BaseException as e:  # includes RecursionError and MemoryError; SIGXCPU ends the process
+            results.append({"error": f"{type(e).__name__}: {e}"[:MAX_REPR]})
+    return {"status": "ok", "function": name, "results": results}
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(2000)
+    reply = run(json.loads(sys.stdin.read()))
+    sys.stdout.write(json.dumps(reply))
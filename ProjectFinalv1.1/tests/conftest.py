@@ -0,0 +1,50 @@
+"""
+Shared setup for the offline test suite: no network, no Google credentials, and every cache,
+job store and dependency-check file goes to a throwaway directory instead of the working tree.
+"""
+import os
+import sys
+import tempfile
+import threading
+import pytest
+
+_SCRATCH = tempfile.mkdtemp(prefix="grader-tests-")
+os.environ.update({
+    "GEMINI_API_KEY": "test-key",
+    "OCR_BACKEND": "replay",
+    "OCR_REPLAY_DIR": os.path.join(_SCRATCH, "ocr_recordings"),
+    "OCR_CACHE_DIR": os.path.join(_SCRATCH, "ocr_cache"),
+    "GEMINI_CACHE_DIR": os.path.join(_SCRATCH, "gemini_cache"),
+    "JOB_STORE_PATH": os.path.join(_SCRATCH, "grading_jobs.sqlite3"),
+    "DEPENDENCY_CHECK": "0",
+    "GEMINI_MAX_RETRIES": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RUBRIC = {"Syntax": 80, "Code Structure": 80, "Efficiency": 80, "Edge Cases": 80}
+
+@pytest.fixture
+def gemini_calls(monkeypatch):
+    """Replaces the Gemini evaluators; returns the list of answers they were asked to grade"""
+    import grading_pipeline
+    calls = []
+    lock = threading.Lock()
+
+    def structured(code, reference, language):
+        with lock:
+            calls.append(code)
+        return 90, dict(RUBRIC), {"Explanation": "ok", "Corrected Code": "NO CORRECTION NEEDED"}
+
+    def batch(codes, reference, language, batch_size):
+        return [structured(code, reference, language) for code in codes]
+
+    def correctness(code, reference, language):
+        with lock:
+            calls.append(code)
+        return 90
+
+    monkeypatch.setattr(grading_pipeline, "evaluate_structured", structured)
+    monkeypatch.setattr(grading_pipeline, "grade_batch", batch)
+    monkeypatch.setattr(grading_pipeline, "evaluate_correctness", correctness)
+    monkeypatch.setattr(grading_pipeline, "evaluate_rubric", lambda code, language: dict(RUBRIC))
+    return calls
@@ -0,0 +1,48 @@
+import os
+import csv
+import sys
+import subprocess
+import pytest
+import batch_grader
+from job_store import JobStore
+
+SCORES = {"Correctness": 100, "Syntax": 50, "Code Structure": 50, "Efficiency": 50, "Edge Cases": 50}
+
+@pytest.fixture
+def graded_job(tmp_path):
+    scans = tmp_path / "scans"
+    scans.mkdir()
+    (scans / "alice.png").write_bytes(b"scan")
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.open_job("Sum a list", "Python", "structured", "def f(xs): return sum(xs)")
+    store.record(job_id, 0, {"name": "alice", "image_path": str(scans / "alice.png")}, {"ocr_text": "def f(xs): ...", "scores": SCORES})
+    store.close()
+    return tmp_path, job_id
+
+def rescore_args(tmp_path, *extra):
+    return ["--rescore", "--students", str(tmp_path / "scans"), "--output", str(tmp_path / "out"),
+            "--job-store", str(tmp_path / "jobs.sqlite3"), *extra]
+
+def test_rescore_by_job_id_uses_the_stored_question(graded_job, monkeypatch):
+    tmp_path, job_id = graded_job
+    monkeypatch.setattr(batch_grader, "load_question", lambda *args: pytest.fail("rescoring must not load the question"))
+    assert batch_grader.main(rescore_args(tmp_path, "--job-id", str(job_id), "--points", "20")) == 0
+    with open(tmp_path / "out" / "results.csv", encoding="utf-8-sig") as f:
+        row = next(csv.DictReader(f))
+    assert (row["Name"], row["Final Score"], row["Exam Points"]) == ("alice", "70", "14")
+
+def test_rescore_rejects_question_image(graded_job, monkeypatch):
+    tmp_path, _ = graded_job
+    monkeypatch.setattr(batch_grader, "get_question_ocr_text", lambda path: pytest.fail("rescoring must not OCR"))
+    assert batch_grader.main(rescore_args(tmp_path, "--question-image", "question.png")) == 1
+    assert not os.path.exists(tmp_path / "out")
+
+def test_job_id_needs_rescore(graded_job):
+    tmp_path, job_id = graded_job
+    assert batch_grader.main(["--job-id", str(job_id), "--students", str(tmp_path / "scans"), "--output", str(tmp_path / "out")]) == 1
+
+def test_headless_import_skips_the_gui_and_vision_modules():
+    probe = "import sys, batch_grader; print(sorted(m for m in ('tkinter', 'PIL.ImageTk', 'google.cloud.vision') if m in sys.modules))"
+    process = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, cwd=os.path.dirname(batch_grader.__file__), timeout=60)
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.strip() == "[]"
@@ -0,0 +1,61 @@
+import os
+import cache
+from cache import DiskCache
+
+def room_for(store, entries):
+    # Exactly the stored entries fit, plus half an entry of slack
+    total = store.stats()["bytes"]
+    store.max_bytes = total + total // entries // 2
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    store = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    for key in "abc":
+        store.set(key, "x" * 10)
+    room_for(store, 3)
+    assert store.get("a") == "x" * 10  # a is now the most recently used
+    store.set("d", "x" * 10)
+    assert store.get("b") is None
+    assert [store.get(key) is not None for key in "acd"] == [True, True, True]
+    assert not os.path.exists(tmp_path / "b.json")
+
+def test_lru_order_survives_a_restart(tmp_path):
+    store = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    for key in "abc":
+        store.set(key, key)
+    for age, key in enumerate("bca"):  # a most recently used, b least
+        os.utime(tmp_path / f"{key}.json", (1000 + age, 1000 + age))
+    reopened = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    room_for(reopened, 3)
+    reopened.set("d", "d")
+    assert reopened.get("b") is None
+    assert reopened.get("a") == "a"
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    store = DiskCache(str(tmp_path), max_bytes=10 ** 6, ttl=60)
+    store.set("k", {"score": 90})
+    now[0] += 59
+    assert store.get("k") == {"score": 90}
+    now[0] += 2
+    assert store.get("k") is None
+    assert not os.path.exists(tmp_path / "k.json")
+    assert store.stats() == {"entries": 0, "bytes": 0, "hits": 1, "misses": 1}
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    store = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    store.set("k", "v")
+    (tmp_path / "k.json").write_text('{"stored_at": 1', encoding='utf-8')
+    assert store.get("k") is None
+    store.set("k", "v2")
+    assert store.get("k") == "v2"
+
+def test_invalidate_and_clear(tmp_path):
+    store = DiskCache(str(tmp_path), max_bytes=10 ** 6)
+    store.set("a", 1)
+    store.set("b", 2)
+    assert store.invalidate("a") is True
+    assert store.invalidate("a") is False
+    store.clear()
+    assert store.get("b") is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,47 @@
+import pytest
+from code_similarity import normalize_tokens, similarity
+
+@pytest.mark.parametrize("identifier", ["ref", "foo", "field", "base", "batch", "iff", "whole", "tyr", "brake"])
+@pytest.mark.parametrize("language", ["Python", "Java", "C#"])
+def test_identifiers_are_not_mistaken_for_keywords(identifier, language):
+    assert normalize_tokens(f"{identifier} = {identifier} + 1", language) == ["ID", "=", "ID", "+", "NUM"]
+
+def test_python_answer_tokens():
+    code = "def add(a, b):  # sum\n    return a + b\nprint(add(1, 'x'))\n"
+    assert normalize_tokens(code, "Python") == ["def", "ID", "(", "ID", "ID", ")", "return", "ID", "+", "ID",
+                                                "print", "(", "ID", "(", "NUM", "STR", ")", ")"]
+
+def test_ocr_character_confusions_still_match_keywords():
+    assert normalize_tokens("whi1e x:\n    f0r y in x:\n        retum y", "Python") == ["while", "ID", "for", "ID", "in", "ID", "return", "ID"]
+
+@pytest.mark.parametrize("code, expected", [
+    ("a5 = a5 + i5", ["ID", "=", "ID", "+", "ID"]),
+    ("clo = 0\nfor clo in items:\n    print(clo, i5)", ["ID", "=", "NUM", "for", "ID", "in", "ID", "print", "(", "ID", "ID", ")"]),
+    ("clef = lookup[clef]", ["ID", "=", "ID", "[", "ID", "]"]),
+])
+def test_folds_keep_identifiers_that_look_like_keywords(code, expected):
+    assert normalize_tokens(code, "Python") == expected
+
+def test_folds_apply_where_the_keyword_can_stand():
+    code = "clef f(x):\n    with open(x) a5 h:\n        if x i5 None:\n            retum h"
+    assert normalize_tokens(code, "Python") == ["def", "ID", "(", "ID", ")", "with", "ID", "(", "ID", ")", "as", "ID",
+                                                "if", "ID", "is", "none", "return", "ID"]
+    assert normalize_tokens("clo { x--; } whi1e (x > 0);", "C") == ["do", "{", "ID", "--", "}", "while", "(", "ID", ">", "NUM", ")"]
+
+def test_c_family_drops_comments_imports_and_case():
+    code = "using System;\n// read\nIF (x == 1) { Console.WriteLine(\"one\"); }"
+    assert normalize_tokens(code, "C#") == ["if", "(", "ID", "==", "NUM", ")", "{", "console", ".", "writeline", "(", "STR", ")", "}"]
+
+def test_renamed_variables_score_as_identical():
+    reference = "def total(numbers):\n    s = 0\n    for n in numbers:\n        s += n\n    return s\n"
+    renamed = "def total(xs):\n    acc = 0\n    for x in xs:\n        acc += x\n    return acc\n"
+    assert similarity(renamed, reference, "Python") == 1.0
+    assert similarity("print('hi')", reference, "Python") < 0.3
+
+def test_similarity_fallback_bands():
+    from exam_grader import similarity_correctness
+    reference = "def largest(values):\n    best = values[0]\n    for v in values:\n        if v > best:\n            best = v\n    return best"
+    ocr_damaged = "def largest(va1ues);\n    best = values[0]\n    for v in valucs:\n        if v > best;\n            best = v\n    return best"
+    other_question = "def total(numbers):\n    result = 0\n    for n in numbers:\n        result += n\n    return result"
+    assert similarity_correctness(ocr_damaged, reference, "Python") == 90
+    assert similarity_correctness(other_question, reference, "Python") < 60
@@ -0,0 +1,47 @@
+import pytest
+from dedup import DuplicateIndex, cluster_texts, normalize_tokens
+
+ANSWER = """def total(numbers):
+    result = 0
+    for n in numbers:
+        if n > 0:
+            result += n
+    return result
+"""
+
+def test_layout_and_comments_are_ignored():
+    relaid = "def total( numbers ):  # add them up\n  result=0\n  for n in numbers:\n    if n>0:\n      result+=n\n  return result"
+    index = DuplicateIndex(0.95, "Python")
+    assert index.match_or_add("a", ANSWER) is None
+    assert index.match_or_add("b", relaid) == ("a", 1.0)
+
+@pytest.mark.parametrize("changed", [
+    ANSWER.replace("n > 0", "n < 0"),
+    ANSWER.replace("result += n", "result += 1"),
+    ANSWER.replace("    return result", "            return result"),
+])
+def test_one_token_logic_change_is_not_reused(changed):
+    index = DuplicateIndex(0.95, "Python")
+    index.match_or_add("a", ANSWER)
+    assert index.match_or_add("b", changed) is None
+
+@pytest.mark.parametrize("a, b", [("return True", "return true"), ("x = None", "x = none"), ("print('#a')", "print('#b')")])
+def test_case_and_string_contents_matter(a, b):
+    assert normalize_tokens(a, "Python") != normalize_tokens(b, "Python")
+
+def test_c_family_comments_and_whitespace():
+    assert normalize_tokens("int f() { /* sum */\n  return 1; // done\n}", "C") == ["int", "f", "(", ")", "{", "return", "1", ";", "}"]
+    assert normalize_tokens("x = 1 // 2", "Python") == ["x", "=", "1", "/", "/", "2"]
+
+def test_near_duplicates_are_only_clustered_for_review():
+    long_answer = "def table(values):\n" + "".join(f"    row{i} = values[{i}] * {i} + {i * i}\n" for i in range(40))
+    changed = long_answer.replace("row7 = values[7] *", "row7 = values[7] -")
+    assert cluster_texts([long_answer, changed, "print(1)"], language="Python") == [[0, 1]]
+    assert cluster_texts([long_answer, changed], language="Python", exact=True) == []
+
+def test_removed_leader_is_no_longer_matched():
+    index = DuplicateIndex(0.95, "Python")
+    index.match_or_add("a", ANSWER)
+    index.remove("a")
+    assert index.match_or_add("b", ANSWER) is None
+    assert index.match_or_add("c", ANSWER) == ("b", 1.0)
@@ -0,0 +1,86 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from mock_gemini_server import start_mock_server
+from gemini_transport import GeminiError
+from llm_client import GeminiClient, GeminiReplyError, set_llm_client
+from exam_grader import get_gemini_answer, is_gemini_error
+
+class _HtmlReplyHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b"<html><body>Service temporarily unavailable</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _TruncatedReplyHandler(BaseHTTPRequestHandler):
+    """Starts a chunked reply and closes the connection in the middle of it"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.write(b"100\r\n{\"candidates\": [")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+def _serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+@pytest.fixture
+def html_server():
+    server, base_url = _serve(_HtmlReplyHandler)
+    yield base_url
+    server.shutdown()
+
+@pytest.fixture
+def truncated_server():
+    server, base_url = _serve(_TruncatedReplyHandler)
+    yield base_url
+    server.shutdown()
+
+@pytest.fixture
+def client_override():
+    yield set_llm_client
+    set_llm_client(None)
+
+def test_mock_server_reply_is_decoded():
+    server, base_url = start_mock_server(latency_ms=0)
+    try:
+        text, finish_reason = GeminiClient("test-key", "gemini-test", base_url).generate("Write a function that sums a list")
+    finally:
+        server.shutdown()
+    assert text
+    assert finish_reason == "STOP"
+
+def test_non_json_reply_raises_reply_error(html_server):
+    with pytest.raises(GeminiReplyError):
+        GeminiClient("test-key", "gemini-test", html_server).generate("hello")
+
+def test_non_json_reply_becomes_error_text(html_server, client_override):
+    client_override(GeminiClient("test-key", "gemini-test", html_server))
+    answer = get_gemini_answer("hello", use_cache=False)
+    assert is_gemini_error(answer)
+
+def test_reply_cut_off_mid_body_raises_gemini_error(truncated_server):
+    with pytest.raises(GeminiError, match="ChunkedEncodingError"):
+        GeminiClient("test-key", "gemini-test", truncated_server).generate("hello")
+
+def test_invalid_url_becomes_error_text(client_override):
+    client_override(GeminiClient("test-key", "gemini-test", "http://"))
+    answer = get_gemini_answer("hello", use_cache=False)
+    assert is_gemini_error(answer)
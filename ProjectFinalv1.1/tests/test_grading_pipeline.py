@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import Future
+import pytest
+from grading_pipeline import GradingPipeline, _Batcher
+
+def student(name, text):
+    ocr = Future()
+    ocr.set_result(text)
+    return {"name": name, "image_path": f"{name}.png", "ocr_future": ocr}
+
+def run_with_timeout(pipeline, students, timeout=10, reference="REFERENCE", **kwargs):
+    outcome = {}
+    thread = threading.Thread(target=lambda: outcome.update(results=pipeline.run(students, reference, "Python", 10, **kwargs)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "GradingPipeline.run did not return"
+    return outcome["results"]
+
+def test_batcher_flushes_full_and_last_partial_batch():
+    flushed = []
+    batcher = _Batcher(2, 5, flushed.append)
+    for item in ("a", "b", "c", None, "d"):
+        batcher.add(item)
+    assert flushed == [["a", "b"], ["c", "d"]]
+
+def test_batcher_flushes_when_the_rest_dropped_out():
+    flushed = []
+    batcher = _Batcher(3, 3, flushed.append)
+    batcher.add("a")
+    batcher.add(None)
+    assert flushed == []
+    batcher.add(None)
+    assert flushed == [["a"]]
+
+@pytest.mark.parametrize("mode", ["two-call", "structured", "batched"])
+def test_results_in_input_order(gemini_calls, mode):
+    students = [student(f"s{i}", f"def f(x):\n    return x + {i}\n") for i in range(7)]
+    results = run_with_timeout(GradingPipeline(grading_mode=mode, batch_size=3, dedup_threshold=0), students)
+    assert [r["name"] for r in results] == [s["name"] for s in students]
+    assert all(r["scores"]["Correctness"] == 90 and r["scores"]["Exam Points"] == 8 for r in results)
+    assert len(gemini_calls) == 7
+
+def test_failing_callback_does_not_hang_the_run(gemini_calls):
+    def on_result(index, result):
+        raise RuntimeError("database is locked")
+
+    students = [student(f"s{i}", f"print({i})") for i in range(4)]
+    results = run_with_timeout(GradingPipeline(grading_mode="structured", dedup_threshold=0), students, on_result=on_result)
+    assert all(r["scores"] for r in results)
+
+def test_failed_ocr_is_recorded_per_student(gemini_calls):
+    broken = Future()
+    broken.set_exception(OSError("unreadable scan"))
+    students = [student("ok", "print(1)"), {"name": "bad", "image_path": "bad.png", "ocr_future": broken}]
+    results = run_with_timeout(GradingPipeline(grading_mode="batched", batch_size=2, dedup_threshold=0), students)
+    assert results[0]["scores"]
+    assert results[1]["scores"] is None and "unreadable scan" in results[1]["error"]
+
+def test_identical_answers_reuse_one_grade(gemini_calls):
+    answer = "def total(numbers):\n    s = 0\n    for n in numbers:\n        s += n\n    return s\n"
+    students = [student("a", answer), student("b", answer), student("c", "print('something else entirely')")]
+    results = run_with_timeout(GradingPipeline(grading_mode="structured", dedup_threshold=0.95), students)
+    assert len(gemini_calls) == 2
+    assert results[1]["duplicate_of"] == "a"
+    assert results[1]["scores"] == results[0]["scores"]
+
+def test_cancel_before_start_fails_every_student(gemini_calls):
+    cancel = threading.Event()
+    cancel.set()
+    students = [student(f"s{i}", f"print({i})") for i in range(3)]
+    results = run_with_timeout(GradingPipeline(grading_mode="structured", dedup_threshold=0), students, cancel=cancel)
+    assert all(r.get("cancelled") for r in results)
+    assert gemini_calls == []
+
+def test_questions_are_grouped_by_id(gemini_calls):
+    # Two exam questions that happen to share a reference answer and points stay separate
+    answer = "def f(x):\n    return x\n"
+    students = []
+    for q in range(2):
+        for name in ("a", "b"):
+            pair = student(f"{name}{q}", answer)
+            pair["question"] = {"id": q, "reference_answer": "REFERENCE", "language": "Python", "question_score": 10}
+            students.append(pair)
+    results = run_with_timeout(GradingPipeline(grading_mode="structured", dedup_threshold=0.95), students)
+    assert len(gemini_calls) == 2
+    assert [r.get("duplicate_of") for r in results] == [None, "a0", None, "a1"]
+
+def test_execution_decides_correctness_and_gemini_the_rubric(gemini_calls):
+    reference = "def add(a, b):\n    return a + b\n"
+    students = [student("right", reference), student("wrong", "def add(a, b):\n    return a - b\n")]
+    pipeline = GradingPipeline(grading_mode="two-call", dedup_threshold=0, execution_workers=1)
+    right, wrong = run_with_timeout(pipeline, students, timeout=30, reference=reference)
+    assert right["scores"]["Correctness"] == 100
+    assert all(right["scores"][param] == 80 for param in ("Syntax", "Code Structure", "Efficiency", "Edge Cases"))
+    assert "sandboxed execution" in right["feedback"]["Explanation"]
+    assert gemini_calls == [wrong["ocr_text"]]
@@ -0,0 +1,14 @@
+import instrumentation
+from instrumentation import metrics_report, record_span, reset_metrics
+
+def test_span_memory_is_bounded_and_aggregates_stay_exact(monkeypatch):
+    monkeypatch.setattr(instrumentation, "SPAN_SAMPLE_SIZE", 100)
+    reset_metrics()
+    for ms in range(1, 10001):
+        record_span("work", ms / 1000)
+    assert len(instrumentation._spans["work"].samples) == 100
+    summary = metrics_report()["spans"]["work"]
+    reset_metrics()
+    assert (summary["count"], summary["max_ms"], summary["mean_ms"]) == (10000, 10000.0, 5000.5)
+    assert 3000 < summary["p50_ms"] < 7000
+    assert summary["p95_ms"] > 8000
@@ -0,0 +1,74 @@
+import sqlite3
+from concurrent.futures import Future
+from batch_grader import grade_cohort
+from grading_pipeline import GradingPipeline
+from job_store import JobStore
+
+ANSWER = "def total(numbers):\n    s = 0\n    for n in numbers:\n        s += n\n    return s\n"
+
+def students(tmp_path, texts):
+    cohort = []
+    for name, text in texts:
+        path = tmp_path / f"{name}.png"
+        path.write_bytes(name.encode())
+        ocr = Future()
+        ocr.set_result(text)
+        cohort.append({"name": name, "image_path": str(path), "ocr_future": ocr})
+    return cohort
+
+def grade(store, cohort):
+    pipeline = GradingPipeline(grading_mode="structured", dedup_threshold=0.95)
+    return grade_cohort("Sum a list", cohort, "Python", 10, reference_answer="REFERENCE", pipeline=pipeline, store=store)
+
+def test_resume_skips_graded_students_and_keeps_duplicates(tmp_path, gemini_calls):
+    path = str(tmp_path / "jobs.sqlite3")
+    cohort = students(tmp_path, [("a", ANSWER), ("b", ANSWER), ("c", "print('other')")])
+    store = JobStore(path)
+    first = grade(store, cohort)
+    store.close()
+    assert len(gemini_calls) == 2
+
+    store = JobStore(path)
+    second = grade(store, cohort)
+    assert len(gemini_calls) == 2
+    assert second["job_id"] == first["job_id"]
+    assert [r["scores"] for r in second["students"]] == [r["scores"] for r in first["students"]]
+    assert second["students"][1]["duplicate_of"] == "a"
+    assert second["students"][1]["similarity"] == first["students"][1]["similarity"]
+    assert second["duplicate_clusters"] == first["duplicate_clusters"]
+
+def test_failed_evaluation_is_regraded_from_stored_ocr(tmp_path, gemini_calls):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    cohort = students(tmp_path, [("a", ANSWER)])
+    job_id = store.open_job("Sum a list", "Python", "structured", "REFERENCE")
+    store.record(job_id, 0, cohort[0], {"ocr_text": ANSWER, "scores": None, "error": "Gemini timed out"})
+    cohort[0].pop("ocr_future")  # a real scan would have to be OCR'd again
+    report = grade(store, cohort)
+    assert gemini_calls == [ANSWER]
+    assert report["students"][0]["scores"]["Correctness"] == 90
+
+def test_old_database_gets_the_new_columns(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE results (job_id INTEGER NOT NULL, student_key TEXT NOT NULL, position INTEGER NOT NULL,
+            name TEXT NOT NULL, image_path TEXT NOT NULL, pages TEXT, ocr_text TEXT, parameter_scores TEXT,
+            feedback TEXT, error TEXT, updated_at REAL NOT NULL, PRIMARY KEY (job_id, student_key));
+    """)
+    db.close()
+    store = JobStore(path)
+    job_id = store.open_job("Q", "Python", "structured", "REFERENCE")
+    store.record(job_id, 0, {"name": "b", "image_path": "b.png"}, {"ocr_text": "x", "scores": None, "error": "e", "duplicate_of": "a", "similarity": 0.97})
+    store.record(job_id, 1, {"name": "c", "image_path": "c.png"}, {"ocr_text": "", "scores": None, "missing": True})
+    duplicate, unanswered = store.load_results(job_id, 10)
+    assert (duplicate["duplicate_of"], duplicate["similarity"]) == ("a", 0.97)
+    assert unanswered["missing"] and unanswered["scores"] is None
+
+def test_unanswered_exam_question_is_graded_in_a_single_question_run(tmp_path, gemini_calls):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    cohort = students(tmp_path, [("a", ANSWER)])
+    job_id = store.open_job("Sum a list", "Python", "structured", "REFERENCE")
+    store.record(job_id, 0, cohort[0], {"ocr_text": "", "scores": None, "missing": True})
+    report = grade(store, cohort)
+    assert gemini_calls == [ANSWER]
+    assert report["students"][0]["scores"]["Correctness"] == 90
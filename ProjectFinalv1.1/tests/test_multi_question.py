@@ -0,0 +1,57 @@
+import pytest
+from concurrent.futures import Future
+from multi_question import split_answers
+
+def test_keyword_markers_in_any_order():
+    assert split_answers("Question 2\nfoo\nQuestion 1\nbar", 2) == ["bar", "foo"]
+
+def test_hebrew_and_short_keyword_markers():
+    text = "שם: דנה\nשאלה 3\nreturn 3\nQ1:\nreturn 1\nEx 2)\nreturn 2"
+    assert split_answers(text, 3) == ["return 1", "return 2", "return 3"]
+
+def test_first_keyword_marker_per_number_wins():
+    text = "Question 1\nprint('see question 2')\nQuestion 2\nx = 2\nQuestion 1\ny = 1"
+    assert split_answers(text, 2) == ["print('see question 2')", "x = 2\nQuestion 1\ny = 1"]
+
+def test_bare_numbers_only_increase():
+    text = "1.\nreturn 1\n2)\nfor i in x:\n1) print(i)\n3.\nreturn 3"
+    assert split_answers(text, 3) == ["return 1", "for i in x:\n1) print(i)", "return 3"]
+
+def test_keyword_markers_win_over_bare_numbers():
+    text = "Task 1:\nsteps:\n1. read\n2. sum\nTask 2:\nprint(2)"
+    assert split_answers(text, 2) == ["steps:\n1. read\n2. sum", "print(2)"]
+
+@pytest.mark.parametrize("text, expected", [
+    ("print('hello')", ["print('hello')"]),
+    ("   ", [None]),
+])
+def test_single_question_without_markers(text, expected):
+    assert split_answers(text, 1) == expected
+
+def test_unanswered_and_out_of_range_questions():
+    assert split_answers("Question 3\nx\nQuestion 7\ny", 3) == [None, None, "x\nQuestion 7\ny"]
+
+def test_rerun_keeps_a_skipped_question_missing(tmp_path, gemini_calls, monkeypatch):
+    import multi_question
+    from grading_pipeline import GradingPipeline
+    from job_store import JobStore
+    monkeypatch.setattr(multi_question, "get_reference_answer", lambda text, language, refresh=False: f"REFERENCE {text}")
+    exam = {"questions": [{"text": f"Q{q}", "language": "Python", "points": 10} for q in (1, 2)]}
+    path = tmp_path / "dana.png"
+    path.write_bytes(b"scan")
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+
+    def run():
+        ocr = Future()
+        ocr.set_result("Question 1\nprint(sum(xs))")
+        seen = {}
+        report = multi_question.grade_exam(exam, [{"name": "dana", "image_path": str(path), "ocr_future": ocr}],
+                                           pipeline=GradingPipeline(grading_mode="structured"), store=store,
+                                           on_result=lambda index, q, result: seen.setdefault(q, dict(result)))
+        return report, seen
+
+    first, _ = run()
+    second, seen = run()
+    assert len(gemini_calls) == 1
+    assert seen[1]["missing"] and seen[1]["scores"] is None and not seen[1].get("error")
+    assert second["students"][0]["Exam Points"] == first["students"][0]["Exam Points"] > 0
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from execution_grader import DifferentialExecutor, run_sandboxed, WORKER_SCRIPT
+
+def run_answer(code, inputs=([1],)):
+    return run_sandboxed(code, "f", [list(args) for args in inputs])
+
+def test_plain_answer_runs():
+    code = "import collections\nclass Box:\n    def __init__(self, v):\n        self.v = v\ndef f(x):\n    return [Box(x).v, collections.Counter('aab')['a']]\n"
+    assert run_answer(code)["results"] == [{"value": [1, 2], "stdout": ""}]
+
+@pytest.mark.parametrize("code", [
+    "def f(x):\n    return ().__class__.__base__.__subclasses__()\n",
+    "def f(x):\n    return f.__globals__\n",
+    "def f(x):\n    return __builtins__\n",
+    "def f(x):\n    g = (i for i in [1])\n    return g.gi_frame.f_back.f_globals['sys'].version\n",
+    "def f(x):\n    try:\n        1 / 0\n    except Exception as e:\n        return e.__traceback__.tb_frame.f_globals\n",
+    "class Grab:\n    def __setattr__(self, name, value):\n        pass\ndef f(x):\n    return 1\n",
+    "from string import _re\ndef f(x):\n    return 1\n",
+])
+def test_dunder_and_frame_access_is_rejected(code):
+    reply = run_answer(code)
+    assert reply["status"] == "rejected", reply
+
+@pytest.mark.parametrize("code", [
+    "import statistics\ndef f(x):\n    return statistics.sys.modules['os'].getcwd()\n",
+    "import re\ndef f(x):\n    return re.functools.reduce\n",
+    "import operator\ndef f(x):\n    return operator.attrgetter('__class__')(x)\n",
+    "import string\ndef f(x):\n    return string.Formatter().get_field('0.__class__', [x], {})\n",
+    "import functools\ndef f(x):\n    return functools.update_wrapper\n",
+    "def f(x):\n    return type(x)\n",
+    "def f(x):\n    return object\n",
+    "def f(x):\n    return open('/etc/passwd').read()\n",
+    "def f(x):\n    return getattr(x, 'real')\n",
+])
+def test_escape_routes_fail_at_run_time(code):
+    reply = run_answer(code)
+    assert reply["status"] == "ok"
+    assert "error" in reply["results"][0], reply
+
+@pytest.mark.parametrize("code", ["import os\ndef f(x):\n    return 1\n", "import collections.abc\ndef f(x):\n    return 1\n"])
+def test_modules_outside_the_allowlist_are_not_importable(code):
+    assert run_answer(code)["status"] == "load_error"
+
+def test_cpu_limit_stops_an_infinite_loop():
+    reply = run_sandboxed("def f(x):\n    while True:\n        pass\n", "f", [[1]], timeout=10)
+    assert reply["status"] == "limit"
+
+ISOLATION_PROBE = """
+import os, sys, json, socket
+"localhost".encode("idna")  # socket needs this codec; it can't be imported after the chroot
+sys.path.insert(0, {directory!r})
+import sandbox_worker
+sandbox_worker._preload_modules()
+failed = sandbox_worker._isolate()
+report = {{"failed": failed, "uid": os.getuid()}}
+for name, attempt in (("listing", lambda: os.listdir("/")),
+                      ("network", lambda: socket.create_connection(("127.0.0.1", 9), timeout=1)),
+                      ("file", lambda: open("/etc/passwd")),
+                      ("process", lambda: os.fork())):
+    try:
+        attempt()
+        report[name] = "allowed"
+    except OSError as e:
+        report[name] = type(e).__name__
+print(json.dumps(report))
+"""
+
+def test_worker_isolates_itself(tmp_path):
+    probe = ISOLATION_PROBE.format(directory=os.path.dirname(WORKER_SCRIPT))
+    process = subprocess.run([sys.executable, "-S", "-s", "-c", probe], capture_output=True, text=True, cwd=tmp_path, timeout=30)
+    report = json.loads(process.stdout)
+    if report["failed"]:
+        pytest.skip(f"this machine can't isolate the sandbox: {report['failed']}")
+    assert report["uid"] != 0
+    assert report["network"] != "allowed" and report["file"] != "allowed" and report["process"] != "allowed"
+
+def test_unisolated_sandbox_refuses_to_run():
+    request = {"code": "def f(x):\n    return x\n", "function": "f", "arity": 1, "inputs": [[1]], "require_isolation": True}
+    script = f"import sys, json; sys.path.insert(0, {os.path.dirname(WORKER_SCRIPT)!r}); import sandbox_worker; " \
+             "sandbox_worker._isolate = lambda *args: ['namespaces']; print(json.dumps(sandbox_worker.run(json.loads(sys.stdin.read()))))"
+    process = subprocess.run([sys.executable, "-c", script], input=json.dumps(request), capture_output=True, text=True, timeout=30)
+    assert json.loads(process.stdout)["status"] == "isolation_error"
+
+def test_code_is_taken_from_the_fenced_block_of_a_reply():
+    code = "def total(numbers):\n    s = 0\n    for n in numbers:\n        s += n\n    return s\n"
+    reply = f"Here is the solution in Python:\n\n```python\n{code}```\n\nThe loop adds every number to s and returns it."
+    outcome = DifferentialExecutor(reply, "Python").grade(f"Answer:\n```\n{code}```\nthat's all")
+    assert outcome["decided"] and outcome["score"] == 100 and outcome["total"] > 0